@@ -2,20 +2,36 @@
 Types provided
  Scalar
  ScalarX
+ Storage (has a 1D numpy.array)
  Vector
- VectorX (has a 1D numpy.array)
- Map (has a pandas.Series)
+ VectorX (a 1D view of a Storage)
+ Expression (deferred elementwise arithmetic on Vectors)
+ Matrix (a 2D view of a Storage)
+ Dictionary (keys and values are parallel Vectors)
  Table
- TableKeyed
+ KeyedTable
 where X is in {Bool, Int64, Float64, DateTime, TimeDelta, String, Object}
 '''
 
 # import abc
 import collections
 import datetime
+import itertools
+import multiprocessing
 import numpy as np
+import os
 import pdb
+import pickle
+import re
+import shutil
+import struct
+import tempfile
+import time
 import unittest
+try:
+    import concurrent.futures as futures  # Python 3, or the futures backport
+except ImportError:
+    futures = None
 
 
 class PUCException(Exception):
@@ -48,6 +64,9 @@ class PUCIndexError(PUCException):
 class PUCConstructionError(PUCException):
     def __init__(self, obj, msg=None):
         super (PUCConstructionError, self).__init__(obj, msg=msg)
+class PUCQueryError(PUCException):
+    def __init__(self, obj, msg=None):
+        super(PUCQueryError, self).__init__(obj, msg=msg)
 
 
 class PUC(object):
@@ -55,8 +74,8 @@ class PUC(object):
     types_bool = (bool, np.bool_)
     types_int = (int, np.int32, np.int64)
     types_float = (float, np.float_)
-    types_datetime = (datetime.datetime,)
-    types_timedelta = (datetime.timedelta,)
+    types_datetime = (datetime.datetime, np.datetime64)
+    types_timedelta = (datetime.timedelta, np.timedelta64)
     types_string = (str,)
     types_object = (object,)
 
@@ -79,6 +98,8 @@ class Scalar(PUC):
 
     def __add__(self, other):
         # maybe: allow Scalar + (bool|int|float)
+        if isinstance(other, _Arithmetic):
+            return NotImplemented  # Vector.__radd__ broadcasts self
         allowed_types = (type(self),)
         if isinstance(other, allowed_types):
             if isinstance(self, ScalarBool):
@@ -194,185 +215,2251 @@ class TestScalar(unittest.TestCase):
                 self.assertRaises(PUCException, add, a, b)
 
 
+class Storage(PUC):
+    '''holds the elements that are viewed by Vectors and Matrices
+
+    A Storage has a kind (see Storage.dtypes) and a 1D numpy.array buffer. Any number of
+    views share one Storage, so that slicing and striding never copy the elements.
+
+    With place=('disk', path) the buffer is a numpy.memmap of the file at path. The file
+    starts with a header (see Storage.header_format) holding the kind and length, so that
+    Storage(place=('disk', path)) reopens it without reading any elements; pages are read
+    by the operating system only when a view touches them.
+
+    With chunk_size=k the elements are held in a list of blocks of k elements, chunks, where
+    block i holds the elements at positions i * k, ..., i * k + k - 1. Extending it only ever
+    allocates one more block, so a Storage that grows all day never reallocates its elements.
+    Views read and write each block in place (see _segments); compact() makes it contiguous.
+
+    With ring=k the Storage is circular: it holds at most the k most recently appended
+    elements in a buffer of k elements, and extending it overwrites the oldest ones. Position 0
+    is always the oldest element, so its elements are at most two segments of the buffer, and
+    a view of a ring Storage sees the elements now at its positions.
+    '''
+    dtypes = {  # kind -> dtype of the buffer
+        'bool': np.dtype(np.bool_),
+        'int64': np.dtype(np.int64),
+        'float64': np.dtype(np.float64),
+        'datetime': np.dtype('M8[ns]'),
+        'timedelta': np.dtype('m8[ns]'),
+        'string': np.dtype(np.int32),  # codes of interned strings; see _Symbols
+        'object': np.dtype(object),
+    }
+    header_format = '<8s16sq32x'  # magic, kind, length, padding to 64 bytes
+    header_magic = b'PUCSTOR1'
+    _allocation = None  # with spare capacity, the array whose start is buffer; see extend
+    chunks = None  # list of blocks, if chunked; then buffer is None
+    chunk_size = None
+    ring = None  # capacity, if circular; then buffer holds the elements from position _head on
+
+    def __init__(self, data=None, n=None, kind=None, place='memory', chunk_size=None, ring=None):
+        if chunk_size is not None or ring is not None:
+            if place != 'memory':
+                raise PUCConstructionError(place, msg='a chunked or ring Storage must be in memory, not %s' % (place,))
+            if chunk_size is not None and ring is not None:
+                raise PUCConstructionError(ring, msg='supply chunk_size or ring, not both')
+            self._init_chunked(data, n, kind, chunk_size, ring)
+            return
+        if isinstance(place, tuple) and len(place) == 2 and place[0] == 'disk':
+            self._init_disk(data, n, kind, place[1])
+            return
+        if place != 'memory':
+            raise PUCConstructionError(place, msg='place %s is not supported' % (place,))
+        if kind is None:
+            kind = self._kind_of(data)
+        self._check_kind(kind)
+        dtype = Storage.dtypes[kind]
+        if data is None:
+            buffer = np.zeros(0 if n is None else n, dtype=dtype)
+        elif isinstance(data, np.ndarray) and data.dtype == dtype and data.ndim == 1:
+            buffer = data  # wrap, do not copy
+        else:
+            buffer = np.array(data, dtype=dtype)
+            if buffer.ndim != 1:
+                raise PUCConstructionError(data, msg='data has %s dimensions, not 1' % buffer.ndim)
+        if n is not None and n != buffer.size:
+            raise PUCConstructionError(data, msg='data has %s elements, not n=%s' % (buffer.size, n))
+        self.buffer = buffer
+        self.kind = kind
+        self.place = place
+
+    def _init_disk(self, data, n, kind, path):
+        'open the file at path if only the path is supplied; otherwise create it'
+        header_size = struct.calcsize(Storage.header_format)
+        if data is None and n is None:
+            if not os.path.exists(path):
+                raise PUCConstructionError(path, msg='file %s does not exist; supply n or data to create it' % path)
+            with open(path, 'rb') as f:
+                header = f.read(header_size)
+            if len(header) != header_size:
+                raise PUCConstructionError(path, msg='file %s is too short to be a Storage' % path)
+            magic, file_kind, n = struct.unpack(Storage.header_format, header)
+            file_kind = file_kind.rstrip(b'\0').decode('ascii')
+            if magic != Storage.header_magic:
+                raise PUCConstructionError(path, msg='file %s is not a Storage' % path)
+            if kind is not None and kind != file_kind:
+                raise PUCConstructionError(path, msg='file %s holds kind %s, not %s' % (path, file_kind, kind))
+            kind = file_kind
+            mode = 'r+' if os.access(path, os.W_OK) else 'r'
+        else:
+            if kind is None:
+                kind = self._kind_of(data)
+            self._check_kind(kind)
+            if not Storage._placeable(kind):
+                raise PUCConstructionError(kind, msg='a Storage of kind %s cannot be placed on disk' % kind)
+            if data is not None:
+                data = np.asarray(data, dtype=Storage.dtypes[kind])
+                if n is not None and n != data.size:
+                    raise PUCConstructionError(data, msg='data has %s elements, not n=%s' % (data.size, n))
+                n = data.size
+            with open(path, 'wb') as f:
+                f.write(struct.pack(Storage.header_format, Storage.header_magic, kind.encode('ascii'), n))
+                f.truncate(header_size + n * Storage.dtypes[kind].itemsize)
+            mode = 'r+'
+        if n == 0:
+            buffer = np.zeros(0, dtype=Storage.dtypes[kind])  # numpy cannot map 0 bytes
+        else:
+            buffer = np.memmap(path, dtype=Storage.dtypes[kind], mode=mode, offset=header_size, shape=(n,))
+            if data is not None:
+                buffer[:] = data
+        self.buffer = buffer
+        self.kind = kind
+        self.place = ('disk', path)
+
+    def _init_chunked(self, data, n, kind, chunk_size, ring):
+        'initialize a chunked or a ring Storage, then extend it with data'
+        size = ring if chunk_size is None else chunk_size
+        if not isinstance(size, (int, long)) or size < 1:
+            raise PUCConstructionError(size, msg='chunk_size and ring must be positive ints, not %s' % (size,))
+        if kind is None:
+            kind = self._kind_of(data)
+        self._check_kind(kind)
+        values = np.zeros(0 if n is None else n, dtype=Storage.dtypes[kind]) if data is None else np.asarray(data, dtype=Storage.dtypes[kind])
+        if n is not None and n != values.size:
+            raise PUCConstructionError(data, msg='data has %s elements, not n=%s' % (values.size, n))
+        if ring is None:
+            self.buffer = None
+            self.chunks = []
+            self.chunk_size = chunk_size
+        else:
+            self.buffer = np.zeros(ring, dtype=Storage.dtypes[kind])
+            self.ring = ring
+            self._head = 0
+        self._n = 0
+        self.kind = kind
+        self.place = 'memory'
+        self.extend(values)
+
+    @staticmethod
+    def _check_kind(kind):
+        'raise PUCConstructionError if kind is not known; otherwise return None'
+        if kind not in Storage.dtypes:
+            raise PUCConstructionError(kind, msg='kind %s is not one of %s' % (kind, sorted(Storage.dtypes)))
+
+    @staticmethod
+    def _placeable(kind):
+        'return True if the elements of a Storage of kind mean the same in every process, so it can be placed on disk'
+        return not Storage.dtypes[kind].hasobject and kind != 'string'
+
+    @staticmethod
+    def _kind_of(data):
+        'return the kind for data, which is None or a numpy.array'
+        if data is None:
+            return 'float64'
+        if isinstance(data, np.ndarray):
+            for kind in ('bool', 'int64', 'float64', 'datetime', 'timedelta', 'object'):
+                if Storage.dtypes[kind] == data.dtype:
+                    return kind
+            if data.dtype.kind in 'SU':
+                return 'string'
+        raise PUCConstructionError(data, msg='supply the kind of the data')
+
+    def __repr__(self):
+        return 'Storage(kind=%s, n=%s, place=%s%s%s)' % (
+            self.kind,
+            len(self),
+            self.place,
+            '' if self.chunks is None else ', chunk_size=%s' % self.chunk_size,
+            '' if self.ring is None else ', ring=%s' % self.ring,
+            )
+
+    def __len__(self):
+        return self.buffer.size if self.contiguous else self._n
+
+    @property
+    def contiguous(self):
+        'True if position i is element i of buffer'
+        return self.chunks is None and self.ring is None
+
+    @property
+    def capacity(self):
+        'number of elements that fit before extend must reallocate, or allocate a block if chunked'
+        if self.chunks is not None:
+            return len(self.chunks) * self.chunk_size
+        if self.ring is not None:
+            return self.ring
+        return self.buffer.size if self._allocation is None else self._allocation.size
+
+    def _segments(self, start, stop, step=1):
+        '''return list of 1D numpy.arrays that view the elements at positions start, start + step, ... before stop
+
+        A contiguous Storage gives one array. A chunked Storage gives one per block that holds
+        any of the elements, and a ring Storage at most two, so that the elements are read and
+        written without copying them.
+        '''
+        if self.ring is not None:
+            wrap = self.ring - self._head  # the position stored at the start of buffer
+            segments = []
+            if start < min(stop, wrap):
+                segments.append(self.buffer[self._head + start:self._head + min(stop, wrap):step])
+            after = start if start >= wrap else start + (wrap - start + step - 1) // step * step
+            if after < stop:
+                segments.append(self.buffer[after - wrap:stop - wrap:step])
+            return segments if len(segments) > 0 else [self.buffer[0:0]]
+        if self.chunks is None:
+            return [self.buffer[start:stop:step]]
+        size = self.chunk_size
+        segments = []
+        position = start
+        while position < stop:
+            chunk = position // size
+            chunk_stop = min(stop, (chunk + 1) * size)
+            segments.append(self.chunks[chunk][position - chunk * size:chunk_stop - chunk * size:step])
+            position += (chunk_stop - position + step - 1) // step * step  # the first position in a later block
+        return segments if len(segments) > 0 else [np.zeros(0, dtype=Storage.dtypes[self.kind])]
+
+    def _blocks(self):
+        'return list of the numpy.arrays that hold the elements'
+        return [self.buffer] if self.chunks is None else self.chunks
+
+    def _locate(self, positions):
+        'return (blocks, offsets): int64 arrays with where in _blocks() the elements at positions are'
+        if self.chunks is not None:
+            return positions // self.chunk_size, positions % self.chunk_size
+        blocks = np.zeros(positions.size, dtype=np.int64)
+        return blocks, positions if self.ring is None else (self._head + positions) % self.ring
+
+    def extend(self, values):
+        '''mutate self by appending the elements of the 1D numpy.array values
+
+        When the allocation is full, its capacity is doubled, so that appending costs
+        amortized O(1) per element. The buffer of a disk Storage grows its file.
+        '''
+        values = np.asarray(values, dtype=Storage.dtypes[self.kind])
+        if values.size == 0:
+            return
+        if self.chunks is not None:
+            self._extend_chunks(values)
+            return
+        if self.ring is not None:
+            self._extend_ring(values)
+            return
+        n = len(self)
+        if n + values.size > self.capacity:
+            self._reserve(max(n + values.size, 2 * self.capacity, 8))
+        self._allocation[n:n + values.size] = values
+        self.buffer = self._allocation[:n + values.size]
+        if self.place != 'memory':
+            with open(self.place[1], 'r+b') as f:
+                f.write(struct.pack(Storage.header_format, Storage.header_magic, self.kind.encode('ascii'), len(self)))
+
+    def _extend_chunks(self, values):
+        'mutate the chunked self by filling its last block with values, then appending blocks'
+        position = 0
+        while position < values.size:
+            used = self._n - (len(self.chunks) - 1) * self.chunk_size
+            if len(self.chunks) == 0 or used == self.chunk_size:
+                self.chunks.append(np.zeros(self.chunk_size, dtype=Storage.dtypes[self.kind]))
+                used = 0
+            n_copied = min(self.chunk_size - used, values.size - position)
+            self.chunks[-1][used:used + n_copied] = values[position:position + n_copied]
+            self._n += n_copied
+            position += n_copied
+
+    def _extend_ring(self, values):
+        'mutate the ring self by writing values after its newest element, overwriting the oldest ones'
+        if values.size >= self.ring:
+            self.buffer[:] = values[values.size - self.ring:]
+            self._head, self._n = 0, self.ring
+            return
+        tail = (self._head + self._n) % self.ring
+        n_first = min(values.size, self.ring - tail)
+        self.buffer[tail:tail + n_first] = values[:n_first]
+        self.buffer[:values.size - n_first] = values[n_first:]
+        n = self._n + values.size
+        if n > self.ring:
+            self._head = (self._head + n - self.ring) % self.ring
+        self._n = min(n, self.ring)
+
+    def compact(self):
+        '''mutate self into one contiguous buffer without spare capacity, copying the elements once
+
+        The views of self stay valid. A chunked or ring Storage stops being one, so that later
+        extends double a contiguous buffer.
+        '''
+        n = len(self)
+        if not self.contiguous:
+            self.buffer = np.concatenate(self._segments(0, n))
+            self.chunks, self.chunk_size, self.ring = None, None, None
+            del self._n
+        elif self.place == 'memory':
+            if self._allocation is not None:
+                self.buffer = self.buffer.copy()
+        elif self._allocation is not None:
+            self.flush()
+            del self._allocation
+            self._init_disk(None, None, self.kind, self.place[1])
+            with open(self.place[1], 'r+b') as f:
+                f.truncate(struct.calcsize(Storage.header_format) + n * self.buffer.dtype.itemsize)
+        self._allocation = None
+
+    def _copy(self):
+        'return new Storage in memory with a copy of the elements of self, at the same positions'
+        values = np.concatenate(self._segments(0, len(self)))
+        return Storage(values, kind=self.kind, chunk_size=self.chunk_size, ring=self.ring)
+
+    def _reserve(self, capacity):
+        'mutate self by reallocating room for capacity elements and copying the elements'
+        n = len(self)
+        if self.place == 'memory':
+            allocation = np.empty(capacity, dtype=self.buffer.dtype)
+            allocation[:n] = self.buffer
+        else:
+            self.flush()
+            path = self.place[1]
+            header_size = struct.calcsize(Storage.header_format)
+            with open(path, 'r+b') as f:
+                f.truncate(header_size + capacity * self.buffer.dtype.itemsize)
+            allocation = np.memmap(path, dtype=self.buffer.dtype, mode='r+', offset=header_size, shape=(capacity,))
+        self._allocation = allocation
+        self.buffer = allocation[:n]
+
+    def __getstate__(self):
+        # a disk Storage pickles as its path, not its elements
+        state = self.__dict__.copy()
+        state.pop('_allocation', None)  # just the elements, not the spare capacity
+        if self.kind == 'string':
+            # codes are private to the process, so carry the strings they code
+            codes = np.unique(np.concatenate(self._blocks()))
+            state['_strings'] = (codes, _SYMBOLS.decode(codes).tolist())
+        if self.place == 'memory':
+            return state
+        self.flush()
+        del state['buffer']
+        return state
+
+    def __setstate__(self, state):
+        if state['place'] == 'memory':
+            strings = state.pop('_strings', None)
+            self.__dict__.update(state)
+            if strings is not None:
+                codes, values = strings
+                recode = np.zeros(codes[-1] + 1 if codes.size > 0 else 0, dtype=np.int32)
+                recode[codes] = _SYMBOLS.encode(np.array(values, dtype=object))
+                for block in self._blocks():
+                    block[:] = recode[block]
+        else:
+            self._init_disk(None, None, state['kind'], state['place'][1])
+
+    def flush(self):
+        'write changed elements of a disk Storage to its file'
+        if isinstance(self.buffer, np.memmap):
+            self.buffer.flush()
+
+
+class Tensor(PUC):
+    '''abstract class for views of a Storage
+
+    A view has a shape, an element offset, and per-dimension strides (in elements). The
+    storage position of element (i0, i1, ...) is offset + i0 * strides[0] + i1 * strides[1] + ...
+    '''
+    def _check_view(self):
+        'raise PUCIndexError if the view reaches outside its storage; otherwise return None'
+        if any(n < 0 for n in self.shape):
+            raise PUCIndexError(self.shape, msg='shape %s has a negative dimension' % (self.shape,))
+        if any(stride < 1 for stride in self.strides):
+            raise PUCIndexError(self.strides, msg='strides %s must be positive' % (self.strides,))
+        if min(self.shape) == 0:
+            return None
+        last = self.offset + sum((n - 1) * stride for n, stride in zip(self.shape, self.strides))
+        if self.offset < 0 or last >= len(self.storage):
+            msg = 'view with offset %s shape %s strides %s does not fit in storage of length %s' % (
+                self.offset, self.shape, self.strides, len(self.storage))
+            raise PUCIndexError(self, msg=msg)
+
+    def copy(self):
+        'return new view of the same storage'
+        return self._view(self.storage, self.offset, self.shape, self.strides)
+
+    def deepcopy(self):
+        'return new view with the same offset and strides into a copy of the storage'
+        return self._view(self.storage._copy(), self.offset, self.shape, self.strides)
+
+    def is_contiguous(self):
+        'return True if the elements are adjacent and in row-major order in the storage'
+        expected = 1
+        for n, stride in reversed(list(zip(self.shape, self.strides))):
+            if n > 1 and stride != expected:
+                return False
+            expected *= n
+        return True
+
+    def deep_contiguous_copy(self):
+        'return new view of a new storage that holds just the elements of self, contiguously'
+        storage = Storage(np.ascontiguousarray(self.value).ravel().copy(), kind=self.storage.kind)
+        return self._view(storage, 0, self.shape, self._contiguous_strides(self.shape))
+
+    def make_contiguous(self):
+        'return self if it is contiguous; otherwise a deep contiguous copy'
+        return self if self.is_contiguous() else self.deep_contiguous_copy()
+
+    @staticmethod
+    def _contiguous_strides(shape):
+        'return row-major strides for shape'
+        strides = [1] * len(shape)
+        for i in range(len(shape) - 2, -1, -1):
+            strides[i] = strides[i + 1] * shape[i + 1]
+        return strides
+
+
+def _check_index(index, n):
+    '''raise if index is not valid for a dimension of length n; otherwise return it as an int, slice, or numpy.array
+
+    A slice must have non-negative start, stop and step; it is returned with its bounds clipped to n.
+    A bool index (VectorBool or list of bool) is a mask and must have n elements.
+    An int index (VectorInt64 or list of int) selects positions, each in [0, n).
+    The positions are bounds-checked with one vectorized min/max, not a Python loop.
+    '''
+    # treat an Iterable[X] is if it were a VectorX
+    allowed_index_types = (ScalarInt64, VectorBool, VectorInt64, int, slice, collections.Iterable)
+    if not isinstance(index, allowed_index_types):
+        raise PUCTypeError(index, allowed_index_types)
+    if isinstance(index, slice):
+        for bound in (index.start, index.stop, index.step):
+            if bound is not None and bound < 0:
+                raise PUCIndexError(index, msg='slice %s has a negative bound' % (index,))
+        if index.step == 0:
+            raise PUCIndexError(index, msg='slice step cannot be zero')
+        start, stop, step = index.indices(n)
+        return slice(start, max(start, stop), step)
+    if isinstance(index, (ScalarInt64, int)):
+        index_value = index.value if isinstance(index, PUC) else index
+        if index_value < 0:
+            raise PUCIndexError(index, msg='index value %s is negative' % index_value)
+        if index_value >= n:
+            raise PUCIndexError(index, msg='index value %s  not less than length %s' % (index_value, n))
+        return index_value
+    if isinstance(index, VectorBool):
+        index_value = index.value
+    elif isinstance(index, VectorInt64):
+        index_value = index.value
+    else:
+        # if index is a list, it must be of all bools or ints
+        items = index if isinstance(index, list) else list(index)
+        item_type = None
+        for item in items:
+            if item_type is None:
+                item_type = type(item)
+                if item_type not in (bool, int):
+                    msg = 'each element of a list index must be a bool or int; found %s' % item_type
+                    raise PUCIndexError(index, msg=msg)
+            elif type(item) != item_type:
+                msg = 'found index element of type %s, not expected type %s' % (
+                    type(item),
+                    item_type,
+                )
+                raise PUCIndexError(index, msg=msg)
+        index_value = np.array(items, dtype=bool if item_type == bool else np.int64)
+    if index_value.dtype == np.bool_:
+        if index_value.size != n:
+            msg = 'bool index has %s elements, not the length %s' % (index_value.size, n)
+            raise PUCIndexError(index, msg=msg)
+        return index_value
+    if index_value.size > 0:
+        lowest, highest = index_value.min(), index_value.max()
+        if lowest < 0:
+            raise PUCIndexError(index, msg='index value %s is negative' % lowest)
+        if highest >= n:
+            raise PUCIndexError(index, msg='index value %s  not less than length %s' % (highest, n))
+    return index_value
+
+
+class _Arithmetic(object):
+    '''elementwise arithmetic and ordering operators shared by Vector and Expression
+
+    Each operator calls _elementwise, which computes at once when the operands are Vectors and
+    Scalars, and builds an Expression when any operand is an Expression.
+    '''
+    __array_ufunc__ = None  # numpy defers to our reflected operators, as in 2.0 * v
+
+    def __add__(self, other):
+        return _elementwise('add', self, other)
+
+    def __radd__(self, other):
+        return _elementwise('add', other, self)
+
+    def __sub__(self, other):
+        return _elementwise('subtract', self, other)
+
+    def __rsub__(self, other):
+        return _elementwise('subtract', other, self)
+
+    def __mul__(self, other):
+        return _elementwise('multiply', self, other)
+
+    def __rmul__(self, other):
+        return _elementwise('multiply', other, self)
+
+    def __truediv__(self, other):
+        return _elementwise('divide', self, other)
 
+    def __lt__(self, other):
+        return _elementwise('less', self, other)
 
+    def __le__(self, other):
+        return _elementwise('less_equal', self, other)
 
+    def __gt__(self, other):
+        return _elementwise('greater', self, other)
 
+    def __ge__(self, other):
+        return _elementwise('greater_equal', self, other)
+
+    def __rtruediv__(self, other):
+        return _elementwise('divide', other, self)
+
+    __div__ = __truediv__  # / always divides exactly, as in Q
+    __rdiv__ = __rtruediv__
+
+    def __neg__(self):
+        return _elementwise('negative', self)
+
+    def __abs__(self):
+        return _elementwise('abs', self)
+
+    def exp(self):
+        return _elementwise('exp', self)
+
+    def log(self):
+        return _elementwise('log', self)
+
+    def sqrt(self):
+        return _elementwise('sqrt', self)
+
+
+class Vector(Tensor, _Arithmetic):
+    '''abstract class to hold common methods for VectorX
+
+    A Vector is a 1D view of a Storage. Construct it either from its elements,
+        VectorInt64(10, 20, 30)
+    or as a view of an existing storage,
+        VectorInt64(storage=s, shape=[5], offsets=[0], strides=[2])  # every other element
+    in which case no elements are copied. Vector(storage=s) returns the VectorX for s.kind.
+    '''
+    attributes = ('sorted', 'unique', 'grouped', 'parted')  # see set_attribute
+    attribute = None
+    _attribute_index = None
+    _find_index = None  # _HashIndex of the elements, built by the first find
+    validity = None  # numpy.packbits of one bit per element, 0 where it is null; None if there are no nulls
+
+    def __new__(cls, *args, **kwds):
+        if cls is Vector and 'storage' in kwds:
+            kind = kwds['storage'].kind
+            if kind not in _VECTOR_CLASSES:
+                raise PUCConstructionError(kwds['storage'], msg='no Vector class for storage kind %s' % kind)
+            cls = _VECTOR_CLASSES[kind]
+        return super(Vector, cls).__new__(cls)
 
-class Vector(PUC):
-    'abstract class to hold common methods for VectorX'
     def __init__(self, *args, **kwds):
-        assert len(kwds) <= 3  # only name and dtype are allowed
         assert 'dtype' in kwds, 'internal error: %s' % kwds
         assert 'allowed_types' in kwds, 'internal error: %s' % kwds
+        name = kwds.get('name', None)
+        if 'storage' in kwds:
+            if len(args) > 0:
+                raise PUCConstructionError(args, msg='supply either elements or a storage, not both')
+            storage = kwds['storage']
+            if not isinstance(storage, Storage):
+                raise PUCTypeError(storage, (Storage,))
+            if storage.kind != self.kind:
+                msg = 'storage of kind %s cannot back a %s' % (storage.kind, self.__class__.__name__)
+                raise PUCConstructionError(storage, msg=msg)
+            offset = kwds['offsets'][0] if 'offsets' in kwds else kwds.get('offset', 0)
+            stride = kwds['strides'][0] if 'strides' in kwds else 1
+            if 'shape' in kwds:
+                length = kwds['shape'][0]
+            else:
+                length = max(0, (len(storage) - offset + stride - 1) // stride) if stride > 0 else 0
+            self._set_view(storage, offset, [length], [stride], name)
+            return
         allowed_types = kwds['allowed_types']
         for arg in args:
             if not isinstance(arg, allowed_types):
                 raise PUCTypeError(arg, allowed_types)
-        self.value = np.array(
-            args,
-            dtype=kwds['dtype'],
-            )
-        self.name = kwds.get('name', None)
+        storage = Storage(np.array(args, dtype=kwds['dtype']), kind=self.kind)
+        self._set_view(storage, 0, [len(args)], [1], name)
+
+    def _set_view(self, storage, offset, shape, strides, name):
+        'initialize self as a view of storage; raise PUCIndexError if it does not fit'
+        self.storage = storage
+        self.offset = offset
+        self.shape = shape
+        self.strides = strides
+        self.name = name
+        self._check_view()
+
+    def _view(self, storage, offset, shape, strides):
+        'return new Vector of the same kind and name as self that views storage'
+        result = self.__class__.__new__(self.__class__)
+        result._set_view(storage, offset, list(shape), list(strides), self.name)
+        return result
+
+    @property
+    def offsets(self):
+        return [self.offset]
+
+    @property
+    def value(self):
+        '''a 1D numpy.array that views (does not copy) the elements of self
+
+        If the elements span several blocks of a chunked Storage, it is a copy of them.
+        '''
+        segments = self.segments()
+        return segments[0] if len(segments) == 1 else np.concatenate(segments)
+
+    def segments(self):
+        '''return list of 1D numpy.arrays that view the elements of self, in order, without copying them
+
+        There is one array for a contiguous Storage, at most two for a ring Storage, and one per
+        block for a chunked Storage.
+        '''
+        n, stride = self.shape[0], self.strides[0]
+        return self.storage._segments(self.offset, self.offset + max(0, (n - 1) * stride + 1), stride)
+
+    def _range_value(self, rows):
+        'return numpy.array of the elements in the slice rows: a view, unless they span segments of the Storage'
+        if self.storage.contiguous:
+            return self.value[rows]
+        return self[rows].value
+
+    def _gather(self, index):
+        'return numpy.array of the elements at the int64 or bool numpy.array index, reading each block in place'
+        if self.storage.contiguous:
+            return self.value[index]
+        if index.dtype == np.bool_:
+            index = np.flatnonzero(index)
+        blocks = self.storage._blocks()
+        result = np.empty(index.size, dtype=self.dtype)
+        for block, rows, offsets in self._block_rows(index):
+            result[rows] = blocks[block][offsets]
+        return result
+
+    def _block_rows(self, index):
+        'generate (block, rows of index, offsets in the block) for the elements of self at the int64 array index'
+        blocks, offsets = self.storage._locate(self.offset + index * self.strides[0])
+        if index.size == 0 or blocks[0] == blocks[-1] and np.all(blocks == blocks[0]):
+            yield (blocks[0] if index.size > 0 else 0), slice(None), offsets
+            return
+        order = np.argsort(blocks, kind='mergesort')
+        sorted_blocks = blocks[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_blocks[1:] != sorted_blocks[:-1])))
+        for start, stop in zip(starts, np.append(starts[1:], index.size)):
+            rows = order[start:stop]
+            yield sorted_blocks[start], rows, offsets[rows]
+
+    @classmethod
+    def _wrap(cls, value, name=None):
+        'return new cls that holds the 1D numpy.array value without copying or checking it'
+        result = cls.__new__(cls)
+        result._set_view(Storage(value, kind=cls.kind), 0, [value.size], [1], name)
+        return result
+
+    @classmethod
+    def _check_dtype(cls, dtype, obj):
+        'raise PUCTypeError unless values of dtype can be held by cls without loss; otherwise return None'
+        dtype = np.dtype(dtype)
+        if dtype == cls.dtype:
+            return None
+        if dtype.kind in cls.source_kinds and np.can_cast(dtype, cls.dtype, casting='safe'):
+            return None
+        raise PUCTypeError(obj, (cls.dtype,))
+
+    @classmethod
+    def _coerce(cls, values, obj):
+        'return the numpy.array values as an array of cls.dtype; raise PUCTypeError unless they convert without loss'
+        if values.size > 0:
+            cls._check_dtype(values.dtype, obj)
+        return values.astype(cls.dtype)
+
+    @classmethod
+    def from_numpy(cls, array, name=None, copy=False):
+        '''return new cls holding the elements of a 1D numpy.array
+
+        The dtype is checked once for the whole array. If it is already cls.dtype, the
+        array is wrapped without copying (unless copy is True), so that mutating the
+        Vector mutates the array. A dtype that converts without loss (say int32 for a
+        VectorInt64) is converted in one numpy operation.
+        '''
+        if not isinstance(array, np.ndarray):
+            raise PUCTypeError(array, (np.ndarray,))
+        if array.ndim != 1:
+            raise PUCConstructionError(array, msg='array has %s dimensions, not 1' % array.ndim)
+        cls._check_dtype(array.dtype, array)
+        if array.dtype != cls.dtype:
+            array = array.astype(cls.dtype)
+        elif copy:
+            array = array.copy()
+        return cls._wrap(array, name=name)
+
+    @classmethod
+    def from_buffer(cls, buffer, name=None):
+        '''return new cls that shares memory with an object supporting the buffer protocol
+
+        A typed memoryview (or any buffer that numpy can type) is checked like a numpy.array.
+        Untyped bytes (format 'B') are reinterpreted as elements of cls.dtype.
+        '''
+        try:
+            array = np.asarray(memoryview(buffer))
+        except (TypeError, ValueError):
+            raise PUCTypeError(buffer, (memoryview,))
+        if array.dtype == np.uint8 and cls.dtype != np.uint8:
+            if array.ndim != 1 or array.size % cls.dtype.itemsize != 0:
+                msg = 'buffer of %s bytes does not hold a whole number of %s elements' % (array.nbytes, cls.dtype)
+                raise PUCConstructionError(buffer, msg=msg)
+            array = array.view(cls.dtype)
+        return cls.from_numpy(array, name=name)
+
+    @classmethod
+    def from_iter(cls, iterable, name=None, count=None, chunk_size=65536):
+        '''return new cls holding the elements produced by iterable
+
+        Elements are consumed chunk_size at a time; each chunk is typed and checked once and
+        then copied into a preallocated buffer that doubles in place when full. If count is
+        given, the buffer is allocated once with exactly that many elements.
+        '''
+        iterator = iter(iterable)
+        capacity = chunk_size if count is None else count
+        buffer = np.empty(capacity, dtype=cls.dtype)
+        size = 0
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if len(chunk) == 0:
+                break
+            chunk_array = np.array(chunk)
+            if chunk_array.ndim != 1:
+                raise PUCTypeError(chunk, (cls.dtype,))
+            cls._check_dtype(chunk_array.dtype, chunk)
+            if size + chunk_array.size > capacity:
+                if count is not None:
+                    msg = 'iterable has more than count=%s elements' % count
+                    raise PUCConstructionError(iterable, msg=msg)
+                capacity = max(2 * capacity, size + chunk_array.size)
+                buffer.resize(capacity, refcheck=False)  # realloc, no second buffer
+            buffer[size:size + chunk_array.size] = chunk_array
+            size += chunk_array.size
+        if count is not None and size != count:
+            msg = 'iterable has %s elements, not count=%s' % (size, count)
+            raise PUCConstructionError(iterable, msg=msg)
+        if size != capacity:
+            buffer.resize(size, refcheck=False)
+        return cls._wrap(buffer, name=name)
 
     def __repr__(self,):
-        return '%s(value=%s%s)' % (
+        return '%s(value=%s%s%s)' % (
             self.__class__.__name__,
             self.value,
+            '' if self.validity is None else ', nulls=%s' % self.null_count(),
             '' if self.name is None else ', name=%s' % self.name,
             )
 
     def __len__(self):
-        return self.value.size
+        return self.shape[0]
 
 
-    def _check_index(self, index):
-        'raise if index is not valid; otherwise return None'
-        # treat an Iterable[X] is if it were a VectorX
-        # maybe return index values as a list[int], because I'm going to have to examine all the indices
-        allowed_index_types = (ScalarInt64, VectorBool, VectorInt64, int, collections.Iterable)
-        if not isinstance(index, allowed_index_types):
-            raise PUCTypeError(index, allowed_index_types)
-        # if index is a list, it must be of all bools, ints, or floats
-        if isinstance(index, list):
-            item_type = None
-            for item in index:
-                if item_type is None:
-                    item_type = type(item)
-                    if item_type not in (bool, float, int):
-                        msg = 'each element of a list index must be a bool, int, or float; found %s' % item_type
-                        raise PUCIndexError(index, msg=msg)
-                else:
-                    if type(item) != item_type:
-                        msg = 'found index element of type %s, not expected type %s' % (
-                            type(item),
-                            item_type,
-                        )
-                        raise PUCIndexError(index, msg=msg)
-        if isinstance(index, (ScalarInt64, int)):
-            index_value = index.value if isinstance(index, PUC) else index
-            if index_value < 0:
-                raise PUCIndexError(index, msg='index value %s is negative' % index_value)
-            if index_value >= len(self):
-                raise PUCIndexError(index, msg='index value %s  not less than length %s' % (index_value, len(self)))
-        elif isinstance(index, VectorBool) or item_type == bool:
-            assert False, 'write me'
-        elif isinstance(index, VectorInt64) or item_type == int:
-            assert False, 'write me'
+    def copy(self):
+        'return new view of the same storage, with the attribute and nulls of self'
+        return self._keep_attribute(super(Vector, self).copy())
+
+    def deepcopy(self):
+        'return new view with the same offset and strides into a copy of the storage, with the attribute and nulls of self'
+        return self._keep_attribute(super(Vector, self).deepcopy())
+
+    # nulls
+
+    def valid(self):
+        'return bool numpy.array that is True where the element of self is not null'
+        if self.validity is None:
+            return np.ones(len(self), dtype=bool)
+        return np.unpackbits(self.validity)[:len(self)].astype(bool)
+
+    def set_valid(self, valid):
+        '''mutate self: the elements where the VectorBool or bool numpy.array valid is False become null
+
+        The nulls are kept as a bitmap of one bit per element, validity, so that they cost
+        len(self) / 8 bytes and a typed Vector never falls back to object elements. The stored
+        element of a null is not used. Lookups that miss, joins, arithmetic, comparisons, and
+        aggregations propagate the nulls; assigning None to an element makes it null.
+        '''
+        valid = valid.value if isinstance(valid, VectorBool) else np.asarray(valid)
+        if valid.dtype != np.bool_ or valid.shape != (len(self),):
+            raise PUCConstructionError(valid, msg='valid must be %s bools' % len(self))
+        self._set_valid(valid)
+
+    def _set_valid(self, valid):
+        'mutate self to have the nulls of the bool numpy.array valid, or none if it is None'
+        self.validity = None if valid is None or valid.all() else np.packbits(valid)
+
+    def null_count(self):
+        'return the number of null elements'
+        return 0 if self.validity is None else len(self) - int(np.count_nonzero(self.valid()))
+
+    def _is_valid(self, position):
+        'return True unless the element at position is null'
+        return self.validity is None or bool(self.validity[position >> 3] >> (7 - (position & 7)) & 1)
+
+    # attributes, as in Q
+
+    def _keep_attribute(self, other):
+        'return the Vector other, which has the elements of self, after giving it the attribute and nulls of self'
+        other.attribute = self.attribute
+        other._attribute_index = self._attribute_index
+        other.validity = self.validity
+        return other
+
+    def set_attribute(self, attribute):
+        '''mutate self: check that attribute holds for the elements, then build its index
+
+        attribute is one of Vector.attributes, as Q's s#, u#, g#, and p#, or None to remove it:
+            'sorted': the elements are in ascending order; lookups and ranges binary search
+            'unique': no element occurs twice; lookups probe a hash index
+            'grouped': lookups find the positions of each value in a value-to-positions index
+            'parted': equal elements are adjacent; lookups find the run of each value
+        Dictionary and KeyedTable lookups, Dictionary.find, and the where clauses of select
+        use the attribute instead of scanning. Assigning elements removes the attribute, and
+        Table.append keeps it if it still holds. Other views of the same storage are not
+        tracked: assigning through them leaves the attribute wrong.
+
+        Raise PUCConstructionError if the attribute does not hold.
+        '''
+        if attribute is not None and attribute not in Vector.attributes:
+            raise PUCConstructionError(attribute, msg='attribute %s is not one of %s' % (attribute, Vector.attributes))
+        index = None if attribute is None else self._attribute_index_for(attribute, self.value)
+        if index is False:
+            raise PUCConstructionError(self, msg='the elements are not %s' % attribute)
+        self.attribute = attribute
+        self._attribute_index = index
+
+    @staticmethod
+    def _attribute_index_for(attribute, values):
+        'return the index for attribute of the numpy.array values, or False if the attribute does not hold'
+        if attribute == 'sorted':
+            return None if np.all(values[1:] >= values[:-1]) else False
+        if attribute == 'unique':
+            index = _HashIndex(values)
+            return index if np.all(index.firsts() == np.arange(values.size)) else False
+        if attribute == 'grouped':
+            codes, first_positions = _factorize(values)
+            counts = np.bincount(codes, minlength=first_positions.size)
+            return {
+                'values': _HashIndex(values[first_positions]),  # value -> code
+                'first_positions': first_positions,
+                'order': np.argsort(codes, kind='mergesort'),
+                'starts': np.cumsum(counts) - counts,
+                'counts': counts,
+            }
+        # parted
+        starts = np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1)).astype(np.int64)
+        if values.size == 0:
+            starts = starts[0:0]
+        run_values = values[starts]
+        index = _HashIndex(run_values)
+        if not np.all(index.firsts() == np.arange(run_values.size)):
+            return False
+        return {'values': index, 'starts': starts, 'stops': np.append(starts[1:], values.size)}
+
+    def _extend_attribute(self, n_old):
+        '''mutate self, which had n_old elements before an extend: keep its attribute if it still holds
+
+        For sorted, only the new elements are checked. For unique, the new elements are checked
+        against and inserted into the hash index. Other attributes rebuild their index.
+        '''
+        values = self.value
+        if self.attribute == 'sorted':
+            new = values[max(0, n_old - 1):]
+            if not np.all(new[1:] >= new[:-1]):
+                self.attribute = None
+            return
+        new = values[n_old:]
+        index = self._attribute_index
+        if self.attribute == 'unique' and len(index) == n_old:
+            if np.all(index.lookup(new) == -1) and _first_occurrences(new).size == new.size:
+                index.insert(new)  # shorter copies of self ignore positions beyond their length
+            else:
+                self.attribute, self._attribute_index = None, None
+            return
+        index = self._attribute_index_for(self.attribute, values)
+        if index is False:
+            self.attribute, self._attribute_index = None, None
+        else:
+            self._attribute_index = index
+
+    def extend(self, other):
+        '''mutate self by appending the elements of other, a Vector of the kind of self or a list
+
+        The elements are appended to the storage in place, in amortized O(len(other)) (see
+        Storage.extend), so other views of the storage stay valid and keep their elements. If
+        self does not end at the end of its storage, or has a stride other than 1, its
+        elements are first copied into a new storage of its own. The attribute of self is kept
+        if it still holds.
+
+        If the storage is a ring, self must start at its start, and it then keeps only the
+        newest elements of the ring.
+        '''
+        if isinstance(other, Vector):
+            if type(other) != type(self):
+                raise PUCTypeError(other, (type(self),))
+            values = other.value
+        else:
+            values = self._coerce(np.array(other), other)
+        n_old = len(self)
+        nulls = self.validity is not None or isinstance(other, Vector) and other.validity is not None
+        if nulls:
+            valid = np.concatenate((self.valid(), other.valid() if isinstance(other, Vector) else np.ones(values.size, dtype=bool)))
+        if self.strides[0] != 1 or self.offset + n_old != len(self.storage) or (
+                self.storage.ring is not None and self.offset != 0):
+            storage = Storage(self.value.copy(), kind=self.kind, ring=self.storage.ring)
+            self.storage, self.offset, self.strides = storage, 0, [1]
+        self.storage.extend(values)
+        self.shape = [len(self.storage) - self.offset]
+        if nulls:
+            self._set_valid(valid[valid.size - len(self):])
+        n_kept = len(self) - values.size  # less than n_old if the ring dropped its oldest elements
+        if n_kept < n_old:
+            self._find_index = None
+        if self._find_index is not None:
+            self._find_index.insert(values)
+        if self.attribute is not None:
+            self._extend_attribute(max(0, n_kept))
+
+    def append(self, value):
+        'mutate self by appending the scalar value, in amortized O(1); see extend'
+        self.extend([value.value if isinstance(value, Scalar) else value])
+
+    def _lookup(self, keys):
+        'return int64 array with the first position of each of the numpy.array keys or -1, using the attribute; None without one'
+        if self.attribute is None:
+            return None
+        index = self._attribute_index
+        if self.attribute == 'sorted':
+            values = self.value
+            found = np.searchsorted(values, keys, side='left')
+            hit = found < values.size
+            hit[hit] = values[found[hit]] == keys[hit]
+            return np.where(hit, found, -1)
+        if self.attribute == 'unique':
+            found = index.lookup(keys)
+            found[found >= len(self)] = -1  # keys appended to a longer copy of self
+            return found
+        found = index['values'].lookup(keys)
+        hit = found != -1
+        firsts = index['first_positions'] if self.attribute == 'grouped' else index['starts']
+        result = np.full(keys.size, -1, dtype=np.int64)
+        result[hit] = firsts[found[hit]]
+        return result
+
+    def _positions_where(self, op, value):
+        '''return the positions of the elements e for which (e op value), in order, using the attribute
+
+        Return a slice or an int64 array, or None if the attribute does not help, so that the
+        caller should scan. op is one of =, ==, <, <=, >, >=.
+        '''
+        if self.attribute is None or isinstance(value, (str, unicode)):
+            return None
+        if self.attribute == 'sorted':
+            values = self.value
+            if op in ('=', '=='):
+                return slice(int(np.searchsorted(values, value, side='left')), int(np.searchsorted(values, value, side='right')))
+            if op in ('<', '<='):
+                return slice(0, int(np.searchsorted(values, value, side='left' if op == '<' else 'right')))
+            if op in ('>', '>='):
+                return slice(int(np.searchsorted(values, value, side='right' if op == '>' else 'left')), len(values))
+            return None
+        value_kind = np.asarray(value).dtype.kind
+        if op not in ('=', '==') or value_kind != self.dtype.kind and (value_kind, self.dtype.kind) != ('i', 'f'):
+            return None  # a hash lookup needs a key of the same kind
+        key = np.array([value], dtype=self.dtype)
+        index = self._attribute_index
+        if self.attribute == 'unique':
+            found = index.lookup(key)
+            return found[(found != -1) & (found < len(self))]
+        code = int(index['values'].lookup(key)[0])
+        if code == -1:
+            return np.zeros(0, dtype=np.int64)
+        if self.attribute == 'grouped':
+            start = index['starts'][code]
+            return index['order'][start:start + index['counts'][code]]
+        return slice(int(index['starts'][code]), int(index['stops'][code]))
+
+    def find(self, other):
+        '''return the position of the first element of self equal to each element of other, as Q's ?
+
+        other is a Vector of the kind of self or a list, giving a VectorInt64 of the same length,
+        or a scalar, giving a ScalarInt64. A value that is not in self has position len(self).
+
+        The first find builds a hash index of self, unless self has an attribute, and keeps it
+        for later finds until an element of self is assigned. So a find costs O(len(other)).
+        '''
+        if isinstance(other, Vector):
+            if type(other) != type(self):
+                raise PUCTypeError(other, (type(self),))
+            keys, scalar = other.value, False
+        else:
+            scalar = not isinstance(other, list)
+            keys = np.array([other.value if isinstance(other, Scalar) else other] if scalar else other)
+            keys = self._coerce(keys, other)
+        positions = self._lookup(keys)
+        if positions is None:
+            if self._find_index is None:
+                self._find_index = _HashIndex(self.value)
+            positions = self._find_index.lookup(keys)
+        positions[positions == -1] = len(self)
+        return ScalarInt64(int(positions[0])) if scalar else VectorInt64._wrap(positions)
+
+    def lazy(self):
+        'return an Expression of self, whose arithmetic is deferred until its compute()'
+        return Expression(None, [self], self.kind)
+
+    # reductions and scans, as in Q
+    #
+    # Each reads the elements through segments(), so a strided or chunked Vector is reduced in
+    # place, one numpy operation per segment. Nulls are skipped by reductions and count as the
+    # identity (0 for sums, 1 for prds) in scans. As for ScalarBool, bools add as int64s.
+
+    def _valid_segments(self):
+        'generate (segment, valid) for each segment of self, where valid is None or a bool numpy.array of its non-nulls'
+        valid = None if self.validity is None else self.valid()
+        start = 0
+        for segment in self.segments():
+            yield segment, None if valid is None else valid[start:start + segment.size]
+            start += segment.size
+
+    def _check_kind(self, kinds):
+        'raise PUCTypeError unless self has one of the kinds'
+        if self.kind not in kinds:
+            raise PUCTypeError(self, tuple(_VECTOR_CLASSES[kind] for kind in kinds))
+
+    def _reduce(self, ufunc, kind):
+        'return the reduction by ufunc of the non-null elements of self as a numpy scalar of kind, or None if there are none'
+        dtype = Storage.dtypes[kind]
+        parts = []
+        for segment, valid in self._valid_segments():
+            if valid is not None:
+                segment = segment[valid]
+            if segment.size > 0:
+                parts.append(ufunc.reduce(segment, dtype=dtype))
+        return ufunc.reduce(np.array(parts, dtype=dtype)) if len(parts) > 0 else None
+
+    def _scan(self, ufunc, kind, identity):
+        'return numpy.array of kind with the running ufunc of the elements of self, with nulls as identity'
+        dtype = Storage.dtypes[kind]
+        result = np.empty(len(self), dtype=dtype)
+        start = 0
+        for segment, valid in self._valid_segments():
+            if valid is not None:
+                segment = np.where(valid, segment, identity)
+            part = result[start:start + segment.size]
+            ufunc.accumulate(segment, dtype=dtype, out=part)
+            if start > 0:
+                ufunc(part, result[start - 1], out=part)  # carry the previous segments
+            start += segment.size
+        return result
+
+    def _sum_kind(self):
+        'return the kind of the sum of the elements of self'
+        self._check_kind(('bool', 'int64', 'float64', 'timedelta'))
+        return 'int64' if self.kind == 'bool' else self.kind
+
+    def sum(self):
+        'return ScalarX with the sum of the elements that are not null'
+        kind = self._sum_kind()
+        total = self._reduce(np.add, kind)
+        return _VECTOR_CLASSES[kind].scalar_type(np.zeros(1, dtype=Storage.dtypes[kind])[0] if total is None else total)
+
+    def min(self):
+        'return ScalarX with the least element that is not null, or None if there is none'
+        self._check_kind(('bool', 'int64', 'float64', 'datetime', 'timedelta'))
+        least = self._reduce(np.fmin if self.kind == 'float64' else np.minimum, self.kind)  # fmin skips NaNs
+        return None if least is None else self.scalar_type(least)
+
+    def max(self):
+        'return ScalarX with the greatest element that is not null, or None if there is none'
+        self._check_kind(('bool', 'int64', 'float64', 'datetime', 'timedelta'))
+        greatest = self._reduce(np.fmax if self.kind == 'float64' else np.maximum, self.kind)
+        return None if greatest is None else self.scalar_type(greatest)
+
+    def _count(self):
+        'return the number of elements that are not null'
+        return len(self) - self.null_count()
+
+    def avg(self):
+        'return ScalarFloat64 with the mean of the elements that are not null, NaN if there are none'
+        self._check_kind(('bool', 'int64', 'float64'))
+        total = self._reduce(np.add, 'float64')
+        return ScalarFloat64(np.nan if total is None else total / self._count())
+
+    def dev(self):
+        'return ScalarFloat64 with the population standard deviation of the elements that are not null, as Q\'s dev'
+        mean = self.avg().value
+        squares = 0.0
+        for segment, valid in self._valid_segments():
+            if valid is not None:
+                segment = segment[valid]
+            deviations = segment - mean
+            squares += np.dot(deviations, deviations)
+        return ScalarFloat64(np.sqrt(squares / self._count()) if self._count() > 0 else np.nan)
+
+    def sums(self):
+        'return new Vector with the running sums of the elements, nulls counting 0'
+        kind = self._sum_kind()
+        return _VECTOR_CLASSES[kind]._wrap(self._scan(np.add, kind, 0), name=self.name)
+
+    def prds(self):
+        'return new Vector with the running products of the elements, nulls counting 1'
+        self._check_kind(('bool', 'int64', 'float64'))
+        kind = 'int64' if self.kind == 'bool' else self.kind
+        return _VECTOR_CLASSES[kind]._wrap(self._scan(np.multiply, kind, 1), name=self.name)
+
+    def deltas(self):
+        '''return new Vector with the first element and then the difference of each element and the one before
+
+        As in Q, so that deltas().sums() is self. The deltas of datetimes are timedeltas, the first
+        being from the epoch. An element is null if it or the element before it is.
+        '''
+        self._check_kind(('bool', 'int64', 'float64', 'datetime', 'timedelta'))
+        kind = {'bool': 'int64', 'datetime': 'timedelta'}.get(self.kind, self.kind)
+        dtype = Storage.dtypes[kind]
+        result = np.empty(len(self), dtype=dtype)
+        previous = np.datetime64(0, 'ns') if self.kind == 'datetime' else np.zeros(1, dtype=dtype)[0]
+        start = 0
+        for segment in self.segments():
+            if segment.size > 0:
+                part = result[start:start + segment.size]
+                np.subtract(segment[1:], segment[:-1], out=part[1:], dtype=dtype)
+                part[0] = np.subtract(segment[0], previous, dtype=dtype)
+                previous = segment[-1]
+            start += segment.size
+        deltas = _VECTOR_CLASSES[kind]._wrap(result, name=self.name)
+        if self.validity is not None:
+            valid = self.valid()
+            valid[1:] &= valid[:-1]
+            deltas._set_valid(valid)
+        return deltas
+
+    def xbar(self, width):
+        '''return new Vector with each element rounded down to a multiple of width, as Q's xbar
+
+        For VectorInt64, whose width is a positive integer, and VectorFloat64; VectorDateTime and
+        VectorTimeDelta round to a timedelta width (see _VectorTemporal.bucket). Nulls stay null.
+        '''
+        self._check_kind(('int64', 'float64'))
+        width = width.value if isinstance(width, Scalar) else width
+        if not width > 0 or (self.kind == 'int64' and int(width) != width):
+            raise PUCConstructionError(width, msg='width %s is not a positive %s' % (width, self.kind))
+        if self.kind == 'int64':
+            result = self._new(self.value // int(width) * int(width))
+        else:
+            result = self._new(np.floor(self.value / width) * width)
+        if self.validity is not None:
+            result._set_valid(self.valid())
+        return result
+
+    # moving windows
+    #
+    # The window of element i is the n elements ending at i (fewer at the start), or with times,
+    # a sorted VectorDateTime or numeric Vector of the same length, the elements whose times
+    # are in (times[i] - n, times[i]]. Each function costs O(len(self)) whatever the window, and
+    # writes its result into out, a Vector of its kind and length, if supplied. See _moving.
+
+    def _window_starts(self, n, times):
+        'return int64 array with the position of the first element of the window of each element of self'
+        if times is None:
+            if not isinstance(n, (int, long)) or n < 1:
+                raise PUCConstructionError(n, msg='window %s is not a positive int' % (n,))
+            return np.maximum(np.arange(len(self)) - n + 1, 0)
+        if not isinstance(times, Vector) or len(times) != len(self):
+            raise PUCConstructionError(times, msg='times must be a Vector of %s elements' % len(self))
+        return _time_window_starts(times.value, _operand_value(n), np.zeros(1, dtype=np.int64))
+
+    def _moving(self, function, starts, parameter, out):
+        'return the moving function (sum, avg, max, min, or ewma) of self; see _moving'
+        if function == 'sum':
+            kind = self._sum_kind()
+        elif function in ('avg', 'ewma'):
+            self._check_kind(('bool', 'int64', 'float64'))
+            kind = 'float64'
         else:
-            assert False, 'internal error'
+            self._check_kind(('bool', 'int64', 'float64', 'datetime', 'timedelta'))
+            kind = self.kind
+        if function == 'ewma' and not 0 < parameter <= 1:
+            raise PUCConstructionError(parameter, msg='alpha %s is not in (0, 1]' % (parameter,))
+        return _moving(function, self, kind, starts, parameter, out)
+
+    def msum(self, n, times=None, out=None):
+        'return Vector with the sum of the elements in the window of each element, nulls counting 0'
+        return self._moving('sum', self._window_starts(n, times), None, out)
+
+    def mavg(self, n, times=None, out=None):
+        'return VectorFloat64 with the mean of the non-null elements in the window of each element'
+        return self._moving('avg', self._window_starts(n, times), None, out)
+
+    def mmax(self, n, times=None, out=None):
+        'return Vector with the greatest non-null element in the window of each element'
+        return self._moving('max', self._window_starts(n, times), n if times is None else None, out)
+
+    def mmin(self, n, times=None, out=None):
+        'return Vector with the least non-null element in the window of each element'
+        return self._moving('min', self._window_starts(n, times), n if times is None else None, out)
+
+    def ewma(self, alpha, out=None):
+        '''return VectorFloat64 with the exponentially weighted moving average of the elements, as Q's ema
+
+        result[0] is self[0] and result[i] is alpha * self[i] + (1 - alpha) * result[i - 1], for
+        0 < alpha <= 1. A null element repeats the element before it.
+        '''
+        return self._moving('ewma', np.zeros(1, dtype=np.int64), alpha, out)
+
+    def _new(self, value):
+        'return new Vector of the same kind as self that holds the numpy.array value'
+        return self._wrap(value, name=self.name)
+
+    def _scalar(self, element):
+        'return the Scalar for the element of the storage of self'
+        return self.scalar_type(element)
+
+    def _stored(self, value):
+        'return the element or numpy.array to store for value, a Scalar, Vector, or python scalar'
+        return value.value if isinstance(value, PUC) else value
+
+    def _ordered(self, values):
+        'return numpy.array whose elements are in the order of the numpy.array values, elements of self'
+        return values
+
+    def _sort_key(self):
+        'return numpy.array of integers, or floats, that order like the elements of self; see _sort_permutation'
+        values = self.value
+        if values.dtype.kind in 'mM':
+            return values.view(np.int64)
+        if values.dtype == np.bool_:
+            return values.view(np.uint8)
+        if values.dtype.hasobject:
+            return np.unique(self._ordered(values), return_inverse=True)[1]
+        return values
+
+    def _take(self, positions):
+        'return new Vector with the elements at the int64 array positions; a position of -1 yields a null'
+        missing = positions == -1
+        if len(self) == 0:
+            result = self._new(np.full(positions.size, self.null_value, dtype=self.dtype))
+            result._set_valid(~missing)
+            return result
+        found = np.where(missing, 0, positions)
+        values = self._gather(found)
+        if missing.any():
+            values[missing] = self.null_value  # as in Q, so that the element is null without the bitmap too
+        result = self._new(values)
+        if self.validity is not None:
+            result._set_valid(self.valid()[found] & ~missing)
+        elif missing.any():
+            result._set_valid(~missing)
+        return result
+
+    def _check_index(self, index):
+        'raise if index is not valid for self; otherwise return it as an int, slice, or numpy.array'
+        return _check_index(index, len(self))
 
-   
     def _check_value(self, index, value):
         'raise PUCIndexError if incompatible for self[index] = value; otherwise return None'
-        if (
+        if isinstance(value, Vector):
+            if type(value) == type(self):
+                return None
+        elif value is None:
+            return None  # makes the elements null
+        elif (
             (isinstance(self, VectorBool) and isinstance(value, (ScalarBool, bool))) or
             (isinstance(self, VectorInt64) and isinstance(value, (ScalarInt64, int))) or
             (isinstance(self, VectorFloat64) and isinstance(value, (ScalarFloat64, float))) or
-            (isinstance(self, VectorDateTime) and isinstance(value, (ScalarDateTime, datetime.datetime))) or
-            (isinstance(self, VectorTimeDelta) and isinstance(value, (ScalarTimeDelta, datetime.timedelta))) or
+            (isinstance(self, VectorDateTime) and isinstance(value, (ScalarDatetime,) + PUC.types_datetime)) or
+            (isinstance(self, VectorTimeDelta) and isinstance(value, (ScalarTimedelta,) + PUC.types_timedelta)) or
             (isinstance(self, VectorString) and isinstance(value, (ScalarString, str))) or
             (isinstance(self, VectorObject) and isinstance(value, (ScalarObject, object)))
         ):
             return None
-        else:
-            msg = 'value of type %s is not compatible with a Vector of type %s' % (
-                    type(value),
-                    type(self),
-                )
-            raise PUCIndexError(msg)
+        msg = 'value of type %s is not compatible with a Vector of type %s' % (
+                type(value),
+                type(self),
+            )
+        raise PUCIndexError(value, msg=msg)
 
     def __getitem__(self, index):
-        'return new PUC object of the same shape and kind as the index'
-        self._check_index(index)
-        if isinstance(index, (ScalarInt64, int)):
-            # return a Scalar
-            result_value = self.value[index.value if isinstance(index, ScalarInt64) else index]
-            if isinstance(self, VectorBool):
-                return ScalarBool(result_value)
-            if isinstance(self, VectorInt64):
-                return ScalarInt64(result_value)
-            if isinstance(self, VectorFloat64):
-                return ScalarFloat64(result_value)
-            if isinstance(self, VectorDateTime):
-                return ScalarDateTime(result_value)
-            if isinstance(self, VectorTimeDelta):
-                return ScalarTimeDelta(result_value)
-            if isinstance(self, VectorString):
-                return ScalarString(result_value)
-            if isinstance(self, VectorObject):
-                return ScalarObject(result_value)
-            assert False, 'internal error'
-        if isinstance(index, VectorBool):
-            # return Vector with selected elements
-            pdb.set_trace()
-            assert False, 'write me'
-        if isinstance(index, VectorInt64):
-            # return Vector with selected elements
-            pdb.set_trace()
-            assert False, 'write me'
-        assert False, 'internal error'
+        'return new PUC object of the same shape and kind as the index; a slice returns a view'
+        index_value = self._check_index(index)
+        if isinstance(index_value, slice):
+            # return a view of the same storage, without copying
+            start, stop, step = index_value.start, index_value.stop, index_value.step
+            result = self._view(
+                self.storage,
+                self.offset + start * self.strides[0],
+                [(stop - start + step - 1) // step],
+                [self.strides[0] * step],
+                )
+        elif isinstance(index_value, np.ndarray):
+            # return Vector with selected elements, using one numpy fancy-index operation
+            result = self._new(self._gather(index_value))
+        else:
+            # return a Scalar, or None for a null
+            if not self._is_valid(index_value):
+                return None
+            position = self.offset + index_value * self.strides[0]
+            return self._scalar(self.storage._segments(position, position + 1)[0][0])
+        if self.validity is not None:
+            result._set_valid(self.valid()[index_value])
+        return result
+
+    def _scatter(self, index_value, value):
+        'mutate the elements of self selected by index_value to value, block by block of a chunked or ring Storage'
+        if isinstance(index_value, slice):
+            index = np.arange(index_value.start, index_value.stop, index_value.step)
+        elif isinstance(index_value, np.ndarray):
+            index = np.flatnonzero(index_value) if index_value.dtype == np.bool_ else index_value
+        else:
+            index = np.array([index_value])
+        values = np.asarray(value, dtype=self.dtype)
+        blocks = self.storage._blocks()
+        for block, rows, offsets in self._block_rows(index):
+            blocks[block][offsets] = values if values.ndim == 0 else values[rows]
 
     def __setitem__(self, index, value):
-        'mutate self'
-        self._check_index(index)
-        self._check_value(index, value) 
-        if isinstance(index, ScalarInt64):
-            self.value[index.value] = value.value
-        elif isinstance(index, int):
-            self.value[index] = value
-        elif isinstance(index, VectorBool):
-            # new_value must be a Vector
-            # take repeatedly from it
-            assert False, 'write me'
-        elif isinstance(index, VectorInt64):
-            # new_value must be a Vector
-            # take repeatedly from it
-            assert False, 'write me'
+        'mutate self; a Scalar value is replicated, a Vector value supplies one element per selected position, None nulls them'
+        index_value = self._check_index(index)
+        self._check_value(index, value)
+        if isinstance(value, Vector):
+            if isinstance(index_value, slice):
+                n_selected = len(range(index_value.start, index_value.stop, index_value.step))
+            elif isinstance(index_value, np.ndarray):
+                n_selected = np.count_nonzero(index_value) if index_value.dtype == np.bool_ else index_value.size
+            else:
+                raise PUCIndexError(index, msg='cannot assign a Vector to one element')
+            if len(value) != n_selected:
+                msg = 'value has %s elements, but the index selects %s' % (len(value), n_selected)
+                raise PUCIndexError(value, msg=msg)
+        if value is None or self.validity is not None or isinstance(value, Vector) and value.validity is not None:
+            valid = self.valid()
+            valid[index_value] = value is not None and (value.valid() if isinstance(value, Vector) else True)
+            self._set_valid(valid)
+        stored = self.null_value if value is None else self._stored(value)
+        if self.storage.contiguous:
+            self.value[index_value] = stored
         else:
-            assert False, 'internal error'
+            self._scatter(index_value, stored)
+        self._find_index = None
+        if self.attribute is not None:
+            self.attribute, self._attribute_index = None, None
 
 
 class VectorBool(Vector):
+    kind = 'bool'  # kind of the backing Storage
+    dtype = np.dtype(np.bool_)
+    source_kinds = 'b'  # numpy dtype kinds that from_numpy accepts
+    scalar_type = ScalarBool
+    null_value = False  # fills the result of a lookup that misses, as in Q
     def __init__(self, *args, **kwds):
-        kwds.update(dtype=bool)
+        kwds.update(dtype=self.dtype)
         kwds.update(allowed_types=(bool,))
         super(VectorBool, self).__init__(*args, **kwds)
 
 class VectorInt64(Vector):
+    kind = 'int64'
+    dtype = np.dtype(np.int64)
+    source_kinds = 'iu'
+    scalar_type = ScalarInt64
+    null_value = np.iinfo(np.int64).min  # Q's 0N
     def __init__(self, *args, **kwds):
-        kwds.update(dtype=int)
+        kwds.update(dtype=self.dtype)
         kwds.update(allowed_types=(int,))
         super(VectorInt64, self).__init__(*args, **kwds)
 
 class VectorFloat64(Vector):
-    pass
-class VectorDateTime(Vector):
-    pass
-class VectorTimeDelta(Vector):
-    pass
+    kind = 'float64'
+    dtype = np.dtype(np.float64)
+    source_kinds = 'f'
+    scalar_type = ScalarFloat64
+    null_value = np.nan
+    def __init__(self, *args, **kwds):
+        kwds.update(dtype=self.dtype)
+        kwds.update(allowed_types=PUC.types_float)
+        super(VectorFloat64, self).__init__(*args, **kwds)
+
+class _VectorTemporal(Vector):
+    '''abstract class to hold common methods for VectorDateTime and VectorTimeDelta
+
+    The elements are numpy datetime64[ns] or timedelta64[ns] values, 8-byte integers counting
+    nanoseconds, so that arithmetic, comparisons, sorting, and hashing are vectorized. NaT is
+    the null value.
+    '''
+    units = ('D', 'h', 'm', 's', 'ms', 'us', 'ns')  # of the integers that from_integers converts
+
+    @classmethod
+    def _coerce(cls, values, obj):
+        '''return the numpy.array values as an array of cls.dtype
+
+        values are numpy datetime64s or timedelta64s of any unit, python datetimes or
+        timedeltas, or for a VectorDateTime ISO 8601 strings, which numpy parses.
+        '''
+        if values.size > 0 and values.dtype.kind == 'O':
+            if not all(isinstance(value, cls.scalar_types) for value in values):
+                raise PUCTypeError(obj, cls.scalar_types)
+            return np.array(values.tolist(), dtype=cls.dtype)
+        if values.size > 0 and values.dtype.kind in 'SU' and cls.dtype.kind == 'M':
+            try:
+                return values.astype(cls.dtype)
+            except ValueError:
+                raise PUCConstructionError(obj, msg='%s are not ISO 8601 datetimes' % (obj,))
+        return super(_VectorTemporal, cls)._coerce(values, obj)
+
+    @classmethod
+    def from_integers(cls, values, unit='ns', name=None):
+        '''return new cls from a list or numpy.array of integers, each a number of units
+
+        For a VectorDateTime, they count units since the epoch (1970-01-01), as Unix times
+        do with unit 's'. unit is one of cls.units. One numpy conversion, with no Python
+        objects.
+        '''
+        if unit not in cls.units:
+            raise PUCConstructionError(unit, msg='unit %s is not one of %s' % (unit, cls.units))
+        integers = VectorInt64._coerce(np.asarray(values), values)
+        return cls._wrap(integers.astype('%s8[%s]' % (cls.dtype.char, unit)).astype(cls.dtype), name=name)
+
+    def bucket(self, width):
+        '''return new Vector of the kind of self with each element rounded down to a multiple of width
+
+        width is a positive timedelta or ScalarTimedelta. The multiples of a VectorDateTime are
+        counted from the epoch, as in Q's xbar, so one-minute buckets start on the minute. One
+        integer division of the nanoseconds; NaT stays NaT.
+        '''
+        step = int(np.array(width.value if isinstance(width, Scalar) else width, dtype='m8[ns]').astype(np.int64))
+        if step <= 0:
+            raise PUCConstructionError(width, msg='width %s is not positive' % (width,))
+        nanoseconds = self.value.view(np.int64)
+        result = nanoseconds // step * step
+        result[nanoseconds == _NAT] = _NAT
+        bucketed = self._new(result.view(self.dtype))
+        if self.validity is not None:
+            bucketed._set_valid(self.valid())
+        return bucketed
+
+    def xbar(self, width):
+        'return new Vector with each element rounded down to a multiple of the timedelta width; see bucket'
+        return self.bucket(width)
+
+    def _positions_where(self, op, value):
+        return super(_VectorTemporal, self)._positions_where(op, self._coerce(np.array([value]), value)[0])
+
+
+_NAT = np.iinfo(np.int64).min  # the nanoseconds of NaT
+
+
+class VectorDateTime(_VectorTemporal):
+    kind = 'datetime'
+    dtype = np.dtype('M8[ns]')
+    source_kinds = 'M'
+    scalar_type = ScalarDatetime
+    scalar_types = PUC.types_datetime
+    null_value = np.datetime64('NaT')
+    def __init__(self, *args, **kwds):
+        kwds.update(dtype=self.dtype)
+        kwds.update(allowed_types=PUC.types_datetime)
+        super(VectorDateTime, self).__init__(*args, **kwds)
+
+    @classmethod
+    def from_iso(cls, strings, name=None):
+        'return new VectorDateTime from a list or numpy.array of ISO 8601 strings, parsed by numpy in one pass'
+        return cls._wrap(cls._coerce(np.asarray(strings), strings), name=name)
+
+class VectorTimeDelta(_VectorTemporal):
+    kind = 'timedelta'
+    dtype = np.dtype('m8[ns]')
+    source_kinds = 'm'
+    scalar_type = ScalarTimedelta
+    scalar_types = PUC.types_timedelta
+    null_value = np.timedelta64('NaT')
+    def __init__(self, *args, **kwds):
+        kwds.update(dtype=self.dtype)
+        kwds.update(allowed_types=PUC.types_timedelta)
+        super(VectorTimeDelta, self).__init__(*args, **kwds)
+
+
+class _Symbols(object):
+    '''the interned strings of the process, as Q's symbols
+
+    Each distinct string is stored once, in strings, and is identified by its int32 code, its
+    position there. Code 0 is the empty string, the null symbol. Codes are never reused, so a
+    code means the same string for the life of the process; they are not shared with other
+    processes (see Storage.__getstate__). A unicode string is interned as its UTF-8 encoding.
+    '''
+    def __init__(self):
+        self.strings = np.zeros(16, dtype=object)  # strings[code], with spare capacity
+        self._n = 0
+        self._codes = {}  # string -> code
+        self._ranks = None
+        self.encode(np.array([''], dtype=object))
+
+    def __len__(self):
+        return self._n
+
+    def encode(self, values, obj=None):
+        '''return int32 array with the code of each string in the 1D numpy.array values, interning new strings
+
+        Only the distinct strings are looked up, so the cost in Python is per distinct string.
+        Raise PUCTypeError if an element is not a string.
+        '''
+        try:
+            distinct, inverse = np.unique(values, return_inverse=True)
+        except UnicodeDecodeError:  # unicode and non-ASCII str do not compare: compare their UTF-8
+            distinct, inverse = np.unique(np.array([_utf8(value) for value in values], dtype=object), return_inverse=True)
+        codes = np.empty(distinct.size, dtype=np.int32)
+        for i, string in enumerate(distinct):
+            if not isinstance(string, (str, unicode)):
+                raise PUCTypeError(values if obj is None else obj, PUC.types_string)
+            string = _utf8(string)
+            code = self._codes.get(string)
+            if code is None:
+                code = self._intern(string)
+            codes[i] = code
+        return codes[inverse]
+
+    def _intern(self, string):
+        'return the code of the new string'
+        if self._n == self.strings.size:
+            self.strings = np.concatenate((self.strings, np.zeros(self._n, dtype=object)))
+        code = self._n
+        self.strings[code] = string
+        self._codes[string] = code
+        self._n += 1
+        self._ranks = None
+        return code
+
+    def code(self, string):
+        'return the code of string, or -1 if it is not interned'
+        return self._codes.get(_utf8(string), -1)
+
+    def decode(self, codes):
+        'return object numpy.array with the string of each of the codes'
+        return self.strings[codes]
+
+    def ranks(self):
+        '''return int32 array with the rank of the string of each code among the strings, so that ranks order like strings
+
+        Sorted once per new string (when the ranks are next needed), so that sorting symbols
+        costs one lookup per element and never compares the strings themselves.
+        '''
+        if self._ranks is None:
+            self._by_rank = np.argsort(self.strings[:self._n], kind='mergesort').astype(np.int32)
+            ranks = np.empty(self._n, dtype=np.int32)
+            ranks[self._by_rank] = np.arange(self._n, dtype=np.int32)
+            self._ranks = ranks
+        return self._ranks
+
+    def by_rank(self):
+        'return int32 array with the code of the string of each rank (see ranks): the codes in the order of their strings'
+        self.ranks()
+        return self._by_rank
+
+
+def _utf8(string):
+    'return the str string, or the unicode string encoded as UTF-8'
+    return string.encode('utf-8') if isinstance(string, unicode) else string
+
+
+_SYMBOLS = _Symbols()
+
+
 class VectorString(Vector):
-    pass
+    '''a Vector of strings, stored as int32 codes of interned strings (see _Symbols), as Q's symbols
+
+    value is the int32 array of codes; decode() returns the strings. Equal strings have equal
+    codes, so equality, find, group by, joins, and hash indexes compare integers and never
+    strings, and a column with few distinct strings takes 4 bytes per element. Ordering
+    comparisons and ordered by in select compare the strings; the sorted attribute and the
+    sorted index of a KeyedTable order the codes.
+    '''
+    kind = 'string'
+    dtype = np.dtype(np.int32)
+    source_kinds = ''  # strings are encoded by _coerce
+    scalar_type = ScalarString
+    null_value = 0  # the code of '', Q's null symbol
+    def __init__(self, *args, **kwds):
+        kwds.update(dtype=self.dtype)
+        kwds.update(allowed_types=PUC.types_string)
+        if 'storage' not in kwds:
+            for arg in args:
+                if not isinstance(arg, PUC.types_string):
+                    raise PUCTypeError(arg, PUC.types_string)
+            kwds['storage'] = Storage(_SYMBOLS.encode(np.array(args, dtype=object)), kind=self.kind)
+            args = ()
+        super(VectorString, self).__init__(*args, **kwds)
+
+    @classmethod
+    def _coerce(cls, values, obj):
+        'return int32 array of the codes of the strings in the numpy.array values, which may already be codes'
+        if values.dtype == cls.dtype:
+            return values
+        if values.size == 0:
+            return values.astype(cls.dtype)
+        if values.dtype.kind not in 'SUO':
+            raise PUCTypeError(obj, PUC.types_string)
+        return _SYMBOLS.encode(values, obj)
+
+    @classmethod
+    def from_numpy(cls, array, name=None, copy=False):
+        'return new VectorString holding the strings or the int32 codes in a 1D numpy.array'
+        if isinstance(array, np.ndarray) and array.ndim == 1 and array.dtype != cls.dtype:
+            array = cls._coerce(array, array)
+        return super(VectorString, cls).from_numpy(array, name=name, copy=copy)
+
+    @classmethod
+    def from_iter(cls, iterable, name=None, count=None, chunk_size=65536):
+        'return new VectorString holding the strings produced by iterable, encoded chunk_size at a time'
+        iterator = iter(iterable)
+        def codes():
+            while True:
+                chunk = list(itertools.islice(iterator, chunk_size))
+                if len(chunk) == 0:
+                    return
+                for code in cls._coerce(np.array(chunk, dtype=object), chunk):
+                    yield code
+        return super(VectorString, cls).from_iter(codes(), name=name, count=count, chunk_size=chunk_size)
+
+    def __repr__(self):
+        return '%s(value=%s%s)' % (
+            self.__class__.__name__,
+            self.decode(),
+            '' if self.name is None else ', name=%s' % self.name,
+            )
+
+    def decode(self):
+        'return object numpy.array of the strings of self'
+        return _SYMBOLS.decode(self.value)
+
+    def _scalar(self, element):
+        return ScalarString(_SYMBOLS.strings[element])
+
+    def _stored(self, value):
+        if isinstance(value, Vector):
+            return value.value
+        string = value.value if isinstance(value, Scalar) else value
+        return _SYMBOLS.encode(np.array([string], dtype=object))[0]
+
+    def _ordered(self, values):
+        return _SYMBOLS.decode(values)
+
+    def _sort_key(self):
+        return _SYMBOLS.ranks()[self.value]
+
+    def _positions_where(self, op, value):
+        if not isinstance(value, (str, unicode)):
+            return None
+        if op not in ('=', '=='):
+            return None  # the attribute orders the codes, not the strings
+        code = _SYMBOLS.code(value)
+        if code == -1:
+            return np.zeros(0, dtype=np.int64)
+        return super(VectorString, self)._positions_where(op, code)
 class VectorObject():
     pass
 
-class TestVector(unittest.TestCase):
-    def test_init_Vector(self):
-        'check that construction cannot be done from a list'
-        x = VectorInt64()
-        self.assertRaises(PUCTypeError, VectorInt64, [])
-        x = VectorBool(True)
-        x = VectorBool(True, False)
-        self.assertRaises(PUCTypeError, VectorBool, (True, False))
+# the VectorX that views a Storage of each kind
+_VECTOR_CLASSES = {
+    'bool': VectorBool,
+    'int64': VectorInt64,
+    'float64': VectorFloat64,
+    'datetime': VectorDateTime,
+    'timedelta': VectorTimeDelta,
+    'string': VectorString,
+}
 
-    def test_init_VectorBool(self):
-        tests = (
-            ((True, False), 2),
-            ((True,), 1),
-            ([], 0),
-            )
-        for args, expected_len in tests:
-            x = VectorBool(*args)
+
+# moving windows; see Vector.msum
+
+def _time_window_starts(times, width, group_starts):
+    '''return int64 array with the first position of the window (times[i] - width, times[i]] of each i
+
+    times is a numpy.array that is sorted within each group; the groups are the runs that start
+    at the positions group_starts. One group is one binary search. Several are one stable sort
+    of the times merged with the window bounds, by (group, time, bound after time): the start
+    of the window of i is the number of times before its bound in that order.
+    '''
+    n = times.size
+    groups = np.repeat(np.arange(group_starts.size), np.diff(np.append(group_starts, n)))
+    if np.any((groups[1:] == groups[:-1]) & (times[1:] < times[:-1])):
+        raise PUCConstructionError(times, msg='the times of a moving window must be sorted')
+    bounds = times - width
+    if group_starts.size <= 1:
+        return np.searchsorted(times, bounds, side='right').astype(np.int64)
+    is_bound = np.repeat(np.array([False, True]), n)
+    order = np.lexsort((is_bound, np.concatenate((times, bounds)), np.concatenate((groups, groups))))
+    merged_is_bound = is_bound[order]
+    times_before = np.cumsum(~merged_is_bound) - ~merged_is_bound
+    starts = np.empty(n, dtype=np.int64)
+    starts[order[merged_is_bound] - n] = times_before[merged_is_bound]
+    return starts
+
+
+def _moving(function, vector, kind, starts, parameter, out):
+    '''return Vector of kind with the moving function of the elements of vector, in out if supplied
+
+    function is 'sum', 'avg', 'max', or 'min' over the elements starts[i], ..., i, or 'ewma'
+    with parameter alpha restarting at each of starts, which are then the starts of groups. The window functions run in O(n):
+        sum and avg: differences of one running sum
+        max and min with parameter a fixed width: van Herk/Gil-Werman block prefix and suffix
+            extremes; otherwise a doubling (sparse) table over the window lengths, O(n log w)
+    A window with no non-null elements gives a null. For ewma, a null repeats the element before
+    it in its group, and the average of a group starts at its first non-null element.
+    '''
+    values, valid = vector.value, None if vector.validity is None else vector.valid()
+    n = values.size
+    if out is None:
+        out = _VECTOR_CLASSES[kind]._wrap(np.empty(n, dtype=Storage.dtypes[kind]), name=vector.name)
+    elif type(out) is not _VECTOR_CLASSES[kind] or len(out) != n or not out.storage.contiguous or out.strides[0] != 1:
+        raise PUCConstructionError(out, msg='out must be a contiguous %s of %s elements' % (_VECTOR_CLASSES[kind].__name__, n))
+    result = out.value
+    counts = None
+    if function in ('sum', 'avg'):
+        if valid is not None:
+            values = np.where(valid, values, np.zeros(1, dtype=values.dtype))
+        running = np.concatenate((np.zeros(1, dtype=result.dtype), np.cumsum(values, dtype=result.dtype)))
+        np.subtract(running[1:], running[starts], out=result)
+        if function == 'avg' or valid is not None:
+            counts = np.arange(1, n + 1) - starts if valid is None else _running_counts(valid, starts)
+        if function == 'avg':
+            np.true_divide(result, np.maximum(counts, 1), out=result)
+    elif function in ('max', 'min'):
+        work, identity = _extreme_operands(values, function)
+        if valid is not None:
+            work = np.where(valid, work, identity)
+            counts = _running_counts(valid, starts)
+        ufunc = {'max': np.fmax, 'min': np.fmin}[function] if work.dtype.kind == 'f' else {'max': np.maximum, 'min': np.minimum}[function]
+        if parameter is not None:
+            extremes = _fixed_extremes(work, parameter, ufunc, identity)
+        else:
+            extremes = _range_extremes(work, starts, ufunc)
+        result[:] = extremes.astype(values.dtype) if values.dtype == np.bool_ else extremes.view(values.dtype)
+    elif n > 0:
+        restart = np.zeros(n, dtype=bool)
+        restart[starts] = True
+        if valid is not None:
+            filled = np.maximum.accumulate(np.where(valid, np.arange(n), -1))  # the last non-null at or before i
+            leading = filled < np.repeat(starts, np.diff(np.append(starts, n)))  # none yet in the group of i
+            values = values[np.maximum(filled, 0)]
+            counts = (~leading).astype(np.int64)
+            restart[1:] |= leading[:-1]
+        _ewma(values, parameter, restart, result)
+        if valid is not None:
+            result[leading] = np.nan  # as in Q, so that the element is null without the bitmap too
+    out._set_valid(None if counts is None else counts > 0)
+    return out
+
+
+def _running_counts(valid, starts):
+    'return int64 array with the number of True elements of valid at starts[i], ..., i'
+    running = np.concatenate(([0], np.cumsum(valid, dtype=np.int64)))
+    return running[1:] - running[starts]
+
+
+def _extreme_operands(values, function):
+    'return (numpy.array, identity): values as numbers that order like them, and the identity of max or min of them'
+    if values.dtype == np.bool_:
+        return values.astype(np.int8), np.int8(0 if function == 'max' else 1)
+    if values.dtype.kind in 'Mm':
+        values = values.view(np.int64)  # NaT is the least int64
+    if values.dtype.kind == 'f':
+        return values, -np.inf if function == 'max' else np.inf
+    info = np.iinfo(values.dtype)
+    return values, values.dtype.type(info.min if function == 'max' else info.max)
+
+
+def _fixed_extremes(values, width, ufunc, identity):
+    '''return numpy.array with the ufunc (a max or min) of each window of width elements ending at each position
+
+    van Herk/Gil-Werman: in blocks of width elements, the window ending at i spans the suffix of
+    one block and the prefix of the next, so two accumulates and one ufunc are O(n) for any width.
+    '''
+    n = values.size
+    blocks = -(-n // width)
+    padded = np.full(blocks * width, identity, dtype=values.dtype)
+    padded[:n] = values
+    padded = padded.reshape(blocks, width)
+    prefix = ufunc.accumulate(padded, axis=1).ravel()[:n]
+    suffix = ufunc.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()[:n]
+    result = prefix.copy()  # the windows of the first block start at 0
+    if n >= width:
+        result[width - 1:] = ufunc(suffix[:n - width + 1], prefix[width - 1:])
+    return result
+
+
+def _range_extremes(values, starts, ufunc):
+    '''return numpy.array with the ufunc (a max or min) of values[starts[i]:i + 1] for each i
+
+    A doubling table: level k holds the ufunc of each run of 2 ** k elements, and a window of
+    length m is covered by two runs of the largest 2 ** k <= m. The levels are built one at a
+    time, each answering its windows, so memory stays O(n).
+    '''
+    n = values.size
+    result = np.empty(n, dtype=values.dtype)
+    lengths = np.arange(n) - starts + 1
+    levels = np.frexp(lengths)[1] - 1 if n > 0 else np.zeros(0, dtype=np.int64)  # floor(log2(length))
+    level, span = values, 1
+    for k in range(int(levels.max()) + 1 if n > 0 else 0):
+        ends = np.flatnonzero(levels == k)
+        result[ends] = ufunc(level[starts[ends]], level[ends - span + 1])
+        level = ufunc(level[:-span], level[span:])
+        span *= 2
+    return result
+
+
+def _ewma(values, alpha, restart, out):
+    '''write the exponentially weighted moving average of the numpy.array values into out
+
+    The average restarts, out[r] = values[r], at each r where the bool array restart is True,
+    which it is at 0. The values are laid out as the rows of a matrix, each short enough that
+    d ** -k stays within 1e12 for d = 1 - alpha, so that the running sums keep their precision.
+    With S the cumsum of values[k] / d ** k along a row,
+        out[j] = d ** (j - r) * values[r] + alpha * d ** j * (S[j] - S[r]) after a restart r in the row
+        out[j] = d ** (j + 1) * c + alpha * d ** j * S[j] otherwise, where c is the out before the row
+    for all the rows at once. The c of each row follows from the ends of the rows before it,
+    each weighted by d ** (row length) <= about 1e-12, so a few terms of that series are exact to
+    double precision: a fixed number of vectorized operations, whatever alpha and the length.
+    '''
+    decay = 1.0 - alpha
+    n = values.size
+    if decay == 0.0 or n == 0:
+        out[:] = values
+        return
+    width = max(1, min(n, int(12 / -np.log10(decay)))) if decay < 1.0 else n
+    n_rows = -(-n // width)
+    matrix = np.zeros(n_rows * width)
+    matrix[:n] = values
+    matrix = matrix.reshape(n_rows, width)
+    restarts = np.zeros(n_rows * width, dtype=bool)
+    restarts[:n] = restart
+    restarts = restarts.reshape(n_rows, width)
+    powers = decay ** np.arange(width + 1)
+    positions = np.arange(width)
+    rows = np.arange(n_rows)[:, np.newaxis]
+    run = np.maximum.accumulate(np.where(restarts, positions, -1), axis=1)  # the last restart at or before j
+    continued = run < 0
+    run = np.maximum(run, 0)
+    scaled = np.cumsum(matrix / powers[:width], axis=1)
+    local = (scaled - np.where(continued, 0.0, scaled[rows, run])) * (alpha * powers[:width])
+    local += np.where(continued, 0.0, powers[positions - run] * matrix[rows, run])
+    # the out at the end of each row: ends[i] + factors[i] * (the out at the end of row i - 1)
+    ends = local[:, -1]
+    factors = np.where(restarts.any(axis=1), 0.0, powers[width])
+    n_terms = 1 if powers[width] == 0.0 else int(np.ceil(np.log(2.0 ** -60) / np.log(powers[width])))
+    carry = ends.copy()
+    weights = np.ones(n_rows)
+    for i in range(1, min(n_terms, n_rows - 1) + 1):
+        weights[i:] *= factors[1:n_rows - i + 1]
+        carry[i:] += weights[i:] * ends[:n_rows - i]
+    previous = np.concatenate(([0.0], carry[:-1]))[:, np.newaxis]
+    local += np.where(continued, powers[1:width + 1] * previous, 0.0)
+    out[:] = local.ravel()[:n]
+
+
+# elementwise functions: name -> numpy ufunc
+_ELEMENTWISE = {
+    'add': np.add,
+    'subtract': np.subtract,
+    'multiply': np.multiply,
+    'divide': np.true_divide,
+    'negative': np.negative,
+    'abs': np.absolute,
+    'exp': np.exp,
+    'log': np.log,
+    'sqrt': np.sqrt,
+    'less': np.less,
+    'less_equal': np.less_equal,
+    'greater': np.greater,
+    'greater_equal': np.greater_equal,
+}
+
+_COMPARISONS = ('less', 'less_equal', 'greater', 'greater_equal')  # give VectorBools
+
+# the kind of the result of an elementwise function of datetime or timedelta operands:
+# (name, kind, ...) -> kind; other functions of them raise PUCTypeError
+_TEMPORAL_KINDS = {
+    ('add', 'datetime', 'timedelta'): 'datetime',
+    ('add', 'timedelta', 'datetime'): 'datetime',
+    ('add', 'timedelta', 'timedelta'): 'timedelta',
+    ('subtract', 'datetime', 'datetime'): 'timedelta',
+    ('subtract', 'datetime', 'timedelta'): 'datetime',
+    ('subtract', 'timedelta', 'timedelta'): 'timedelta',
+    ('multiply', 'timedelta', 'int64'): 'timedelta',
+    ('multiply', 'int64', 'timedelta'): 'timedelta',
+    ('multiply', 'timedelta', 'float64'): 'timedelta',
+    ('multiply', 'float64', 'timedelta'): 'timedelta',
+    ('divide', 'timedelta', 'timedelta'): 'float64',
+    ('divide', 'timedelta', 'int64'): 'timedelta',
+    ('divide', 'timedelta', 'float64'): 'timedelta',
+    ('negative', 'timedelta'): 'timedelta',
+    ('abs', 'timedelta'): 'timedelta',
+}
+
+
+def _operand_kind(operand):
+    'return the kind of the result of the elementwise operand, a number, time, Vector, or Expression'
+    numeric = (VectorBool, VectorInt64, VectorFloat64, VectorDateTime, VectorTimeDelta, Expression)
+    if isinstance(operand, numeric):
+        return operand.kind
+    if isinstance(operand, np.datetime64):
+        return 'datetime'
+    if isinstance(operand, np.timedelta64):  # a numpy integer
+        return 'timedelta'
+    if isinstance(operand, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(operand, (int, long, np.integer)):
+        return 'int64'
+    if isinstance(operand, (float, np.floating)):
+        return 'float64'
+    raise PUCTypeError(operand, numeric + (bool, int, float, np.datetime64, np.timedelta64))
+
+
+def _operand_value(operand):
+    'return the elementwise operand with a Scalar replaced by its value and a python time by a numpy one'
+    if isinstance(operand, Scalar):
+        operand = operand.value
+    if isinstance(operand, datetime.datetime):
+        return np.datetime64(operand, 'ns')
+    if isinstance(operand, datetime.timedelta):
+        return np.timedelta64(operand).astype('m8[ns]')
+    return operand
+
+
+def _result_kind(name, operands, kinds):
+    'return the kind of the result of the elementwise function name of operands, of kinds'
+    temporal = any(kind in ('datetime', 'timedelta') for kind in kinds)
+    if name in _COMPARISONS:
+        if temporal and len(set(kinds)) > 1:
+            raise PUCTypeError(operands[1], (_VECTOR_CLASSES[kinds[0]],))
+        return 'bool'
+    if temporal:
+        key = (name,) + tuple('int64' if kind == 'bool' else kind for kind in kinds)
+        if key not in _TEMPORAL_KINDS:
+            allowed = [other[-1] for other in _TEMPORAL_KINDS if other[:-1] == key[:-1]]
+            raise PUCTypeError(operands[-1], tuple(_VECTOR_CLASSES[kind] for kind in allowed))
+        return _TEMPORAL_KINDS[key]
+    if name in ('divide', 'exp', 'log', 'sqrt') or 'float64' in kinds:
+        return 'float64'
+    return 'int64'
+
+
+def _joint_validity(vectors):
+    'return the validity bitmap of the elementwise result of the Vectors, null where any is, or None'
+    bitmaps = [vector.validity for vector in vectors if vector.validity is not None]
+    if len(bitmaps) == 0:
+        return None
+    return np.bitwise_and.reduce(bitmaps) if len(bitmaps) > 1 else bitmaps[0]
+
+
+def _with_validity(result, name, validity):
+    'return the Vector result of the elementwise function name after giving it the nulls in validity'
+    if validity is None:
+        return result
+    if name in _COMPARISONS:
+        # as in Q, a comparison with a null is false, so that the result selects rows
+        result.value[np.unpackbits(validity)[:len(result)] == 0] = False
+    else:
+        result.validity = validity
+    return result
+
+
+def _apply(name, arguments, kind, out=None):
+    'return the elementwise function name of the numpy arguments, as elements of kind'
+    if name in _COMPARISONS:
+        return _ELEMENTWISE[name](*arguments, out=out)
+    return _ELEMENTWISE[name](*arguments, out=out, dtype=Storage.dtypes[kind])
+
+
+def _elementwise(name, *operands):
+    '''return the function name applied to the operands elementwise
+
+    The operands are numeric, datetime, or timedelta Vectors, Expressions, numbers, times, or
+    ScalarX holding them. If any is an Expression, return a new Expression; otherwise return a
+    new Vector. As for ScalarBool, the arithmetic of bools is that of int64s; divide and the
+    transcendental functions give float64s, and comparisons give bools. Times follow
+    _TEMPORAL_KINDS, so the difference of two datetimes is a timedelta. An element is null
+    where an element of an operand is, and a comparison with a null is False.
+    '''
+    operands = [_operand_value(operand) for operand in operands]
+    kinds = [_operand_kind(operand) for operand in operands]
+    lengths = set(len(operand) for operand in operands if isinstance(operand, (Vector, Expression)))
+    if len(lengths) > 1:
+        raise PUCConstructionError(operands, msg='operands of %s have lengths %s' % (name, sorted(lengths)))
+    kind = _result_kind(name, operands, kinds)
+    if any(isinstance(operand, Expression) for operand in operands):
+        return Expression(name, operands, kind)
+    arrays = [operand.value if isinstance(operand, Vector) else operand for operand in operands]
+    result = _VECTOR_CLASSES[kind]._wrap(_apply(name, arrays, kind))
+    return _with_validity(result, name, _joint_validity([operand for operand in operands if isinstance(operand, Vector)]))
+
+
+def add(a, b):
+    'return a + b elementwise, like a numpy ufunc: a new Vector, or an Expression if a or b is one'
+    return _elementwise('add', a, b)
+
+
+def subtract(a, b):
+    'return a - b elementwise'
+    return _elementwise('subtract', a, b)
+
+
+def multiply(a, b):
+    'return a * b elementwise'
+    return _elementwise('multiply', a, b)
+
+
+def divide(a, b):
+    'return a / b elementwise, as float64s'
+    return _elementwise('divide', a, b)
+
+
+def exp(a):
+    'return e ** a elementwise, as float64s'
+    return _elementwise('exp', a)
+
+
+def log(a):
+    'return the natural logarithm of a elementwise, as float64s'
+    return _elementwise('log', a)
+
+
+def sqrt(a):
+    'return the square root of a elementwise, as float64s'
+    return _elementwise('sqrt', a)
+
+
+def less(a, b):
+    'return a < b elementwise, as bools'
+    return _elementwise('less', a, b)
+
+
+def less_equal(a, b):
+    'return a <= b elementwise, as bools'
+    return _elementwise('less_equal', a, b)
+
+
+def greater(a, b):
+    'return a > b elementwise, as bools'
+    return _elementwise('greater', a, b)
+
+
+def greater_equal(a, b):
+    'return a >= b elementwise, as bools'
+    return _elementwise('greater_equal', a, b)
+
+
+class Expression(PUC, _Arithmetic):
+    '''a deferred elementwise computation over Vectors of equal length
+
+    Vector.lazy() starts one; the operators and functions of an Expression build a graph
+    instead of computing, and compute() evaluates the whole graph:
+        e = (a.lazy() + b) * c.lazy().exp()  # nothing is computed yet
+        v = e.compute()                      # a new VectorFloat64
+    compute() runs the graph over chunks of chunk_size elements, so that each intermediate
+    result is a chunk-sized buffer that stays in cache and is reused for every chunk. Only the
+    result has the full length. A node used twice in the graph is evaluated once per chunk.
+    '''
+    chunk_size = 4096  # elements; the buffers of a typical graph fit in a 256 KB L2 cache
+
+    def __init__(self, function, operands, kind):
+        self.function = function  # a key of _ELEMENTWISE, or None for a Vector
+        self.operands = operands
+        self.kind = kind
+        lengths = [len(operand) for operand in operands if isinstance(operand, (Vector, Expression))]
+        self._length = lengths[0] if len(lengths) > 0 else 1
+
+    def __repr__(self):
+        if self.function is None:
+            return 'Expression(%r)' % (self.operands[0],)
+        return 'Expression(%s(%s), kind=%s)' % (self.function, ', '.join(repr(operand) for operand in self.operands), self.kind)
+
+    def __len__(self):
+        return self._length
+
+    def _evaluate(self, start, stop, buffers, results, out=None):
+        'return numpy.array with elements start:stop of self, in out or in a buffer reused across chunks'
+        if self.function is None:
+            return self.operands[0]._range_value(slice(start, stop))  # a view, not a copy
+        key = id(self)
+        if key in results:
+            return results[key]
+        arguments = []
+        for operand in self.operands:
+            if isinstance(operand, Expression):
+                arguments.append(operand._evaluate(start, stop, buffers, results))
+            elif isinstance(operand, Vector):
+                arguments.append(operand._range_value(slice(start, stop)))
+            else:
+                arguments.append(operand)
+        if out is None:
+            if key not in buffers:
+                buffers[key] = np.empty(self.chunk_size, dtype=Storage.dtypes[self.kind])
+            out = buffers[key][:stop - start]
+        _apply(self.function, arguments, self.kind, out=out)
+        results[key] = out
+        return out
+
+    def _vectors(self):
+        'return list of the Vectors in the graph of self'
+        vectors = []
+        for operand in self.operands:
+            if isinstance(operand, Expression):
+                vectors.extend(operand._vectors())
+            elif isinstance(operand, Vector):
+                vectors.append(operand)
+        return vectors
+
+    def compute(self):
+        'return new Vector with the value of self, null where any of its Vectors is'
+        n = len(self)
+        output = np.empty(n, dtype=Storage.dtypes[self.kind])
+        buffers = {}
+        for start in range(0, n, self.chunk_size):
+            stop = min(n, start + self.chunk_size)
+            result = self._evaluate(start, stop, buffers, {}, out=output[start:stop])
+            if self.function is None:
+                output[start:stop] = result
+        validity = _joint_validity(self._vectors())
+        return _with_validity(_VECTOR_CLASSES[self.kind]._wrap(output), self.function, validity)
+
+
+class Matrix(Tensor):
+    '''2D view of a Storage
+
+    The storage position of element (i, j) is offset + i * strides[0] + j * strides[1].
+    The offsets argument, if supplied, is summed to form the offset. By default the
+    strides are [shape[1], 1], a dense row-major layout.
+    Indexing by ints and slices returns views; indexing by a VectorBool or VectorInt64
+    returns a new Vector or Matrix.
+    '''
+    def __init__(self, storage, shape, offsets=None, strides=None, offset=0, name=None):
+        if not isinstance(storage, Storage):
+            raise PUCTypeError(storage, (Storage,))
+        if len(shape) != 2:
+            raise PUCConstructionError(shape, msg='shape %s does not have 2 dimensions' % (shape,))
+        if not storage.contiguous:
+            raise PUCConstructionError(storage, msg='a Matrix needs a contiguous Storage; compact() it first')
+        self.storage = storage
+        self.offset = sum(offsets) if offsets is not None else offset
+        self.shape = list(shape)
+        self.strides = [shape[1], 1] if strides is None else list(strides)
+        self.name = name
+        self._check_view()
+
+    def _view(self, storage, offset, shape, strides):
+        'return new Matrix with the same name as self that views storage'
+        return Matrix(storage, shape, strides=strides, offset=offset, name=self.name)
+
+    def __repr__(self):
+        return 'Matrix(kind=%s, shape=%s%s)' % (
+            self.storage.kind,
+            self.shape,
+            '' if self.name is None else ', name=%s' % self.name,
+            )
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def value(self):
+        'a 2D numpy.array that views (does not copy) the elements of self'
+        buffer = self.storage.buffer
+        if min(self.shape) == 0:
+            return np.empty(self.shape, dtype=buffer.dtype)
+        return np.lib.stride_tricks.as_strided(
+            buffer[self.offset:],
+            shape=self.shape,
+            strides=[stride * buffer.strides[0] for stride in self.strides],
+            )
+
+    def _check_index(self, index):
+        'return (row index, column index), each as returned by _check_index'
+        if not isinstance(index, tuple):
+            index = (index, slice(None))
+        if len(index) != 2:
+            raise PUCIndexError(index, msg='a Matrix index has 2 components, not %s' % len(index))
+        return _check_index(index[0], self.shape[0]), _check_index(index[1], self.shape[1])
+
+    def __getitem__(self, index):
+        '''return a Scalar, a Vector, or a Matrix
+
+        m[i, j] is a Scalar, m[i, :] and m[:, j] are Vector views, m[a:b, c:d] is a Matrix
+        view, and any VectorBool or VectorInt64 component selects into a new Storage.
+        '''
+        rows, cols = self._check_index(index)
+        vector_class = _VECTOR_CLASSES[self.storage.kind]
+        basic = (int, slice)
+        if isinstance(rows, basic) and isinstance(cols, basic):
+            offset = self.offset
+            shape, strides = [], []
+            for component, stride in zip((rows, cols), self.strides):
+                if isinstance(component, slice):
+                    offset += component.start * stride
+                    shape.append(len(range(component.start, component.stop, component.step)))
+                    strides.append(stride * component.step)
+                else:
+                    offset += component * stride
+            if len(shape) == 0:
+                return vector_class.scalar_type(self.storage.buffer[offset])
+            if len(shape) == 1:
+                result = vector_class.__new__(vector_class)
+                result._set_view(self.storage, offset, shape, strides, self.name)
+                return result
+            return self._view(self.storage, offset, shape, strides)
+        # at least one component is a numpy.array: select into new storage
+        row_positions, col_positions = [
+            component if isinstance(component, int) else np.arange(n)[component]
+            for component, n in zip((rows, cols), self.shape)
+            ]
+        if isinstance(row_positions, int) or isinstance(col_positions, int):
+            return vector_class._wrap(self.value[row_positions, col_positions].copy(), name=self.name)
+        value = self.value[np.ix_(row_positions, col_positions)]
+        storage = Storage(value.ravel(), kind=self.storage.kind)
+        return Matrix(storage, list(value.shape), name=self.name)
+
+    def __setitem__(self, index, value):
+        'mutate the elements selected by index; value is a Scalar, python scalar, Vector, or Matrix'
+        rows, cols = self._check_index(index)
+        if isinstance(rows, np.ndarray) and isinstance(cols, np.ndarray):
+            rows, cols = np.ix_(np.arange(self.shape[0])[rows], np.arange(self.shape[1])[cols])
+        self.value[rows, cols] = value.value if isinstance(value, PUC) else value
+
+
+class TestVector(unittest.TestCase):
+    def test_init_Vector(self):
+        'check that construction cannot be done from a list'
+        x = VectorInt64()
+        self.assertRaises(PUCTypeError, VectorInt64, [])
+        x = VectorBool(True)
+        x = VectorBool(True, False)
+        self.assertRaises(PUCTypeError, VectorBool, (True, False))
+
+    def test_init_VectorBool(self):
+        tests = (
+            ((True, False), 2),
+            ((True,), 1),
+            ([], 0),
+            )
+        for args, expected_len in tests:
+            x = VectorBool(*args)
             self.assertEqual(expected_len, len(x))
             for i, arg in enumerate(args):
                 # check value of each arg
@@ -426,6 +2513,3305 @@ class TestVector(unittest.TestCase):
             return x[index]
         self.assertRaises(PUCIndexError, getitem, 0)
 
+    def test_getitem_VectorBool(self):
+        x = VectorInt64(10, 20, 30)
+        for index in (VectorBool(True, False, True), [True, False, True]):
+            r = x[index]
+            self.assertTrue(isinstance(r, VectorInt64))
+            self.assertEqual(2, len(r))
+            self.assertEqual(ScalarInt64(10), r[0])
+            self.assertEqual(ScalarInt64(30), r[1])
+        self.assertEqual(0, len(x[VectorBool(False, False, False)]))
+        def getitem(index):
+            return x[index]
+        self.assertRaises(PUCIndexError, getitem, VectorBool(True))  # too few
+        self.assertRaises(PUCIndexError, getitem, [True, 1])  # mixed element types
+
+    def test_getitem_VectorInt64(self):
+        x = VectorBool(True, False)
+        for index in (VectorInt64(1, 1, 0), [1, 1, 0]):
+            r = x[index]
+            self.assertTrue(isinstance(r, VectorBool))
+            self.assertEqual(3, len(r))
+            self.assertEqual(ScalarBool(False), r[0])
+            self.assertEqual(ScalarBool(False), r[1])
+            self.assertEqual(ScalarBool(True), r[2])
+        self.assertEqual(0, len(x[VectorInt64()]))
+        def getitem(index):
+            return x[index]
+        self.assertRaises(PUCIndexError, getitem, VectorInt64(0, 2))
+        self.assertRaises(PUCIndexError, getitem, [-1])
+        self.assertRaises(PUCIndexError, getitem, [0.0])
+
+    def test_getitem_returns_copy(self):
+        x = VectorInt64(10, 20, 30)
+        r = x[VectorInt64(0, 1)]
+        r[0] = 99
+        self.assertEqual(ScalarInt64(10), x[0])
+
+    def test_setitem_VectorBool_VectorInt64(self):
+        x = VectorInt64(10, 20, 30)
+        x[VectorBool(True, False, True)] = 0
+        self.assertEqual([0, 20, 0], list(x.value))
+        x[VectorInt64(1, 2)] = ScalarInt64(7)
+        self.assertEqual([0, 7, 7], list(x.value))
+        x[[2, 0]] = VectorInt64(1, 2)
+        self.assertEqual([2, 7, 1], list(x.value))
+        def setitem(index, value):
+            x[index] = value
+        self.assertRaises(PUCIndexError, setitem, VectorInt64(0, 1), VectorInt64(1))  # wrong length
+        self.assertRaises(PUCIndexError, setitem, VectorInt64(0), VectorBool(True))  # wrong kind
+        self.assertRaises(PUCIndexError, setitem, VectorInt64(3), 1)  # out of bounds
+        self.assertRaises(PUCIndexError, setitem, 0, VectorInt64(1))  # Vector into one element
+
+    def test_from_numpy(self):
+        a = np.array([1.0, 2.0, 3.0])
+        x = VectorFloat64.from_numpy(a, name='x')
+        self.assertEqual(3, len(x))
+        self.assertEqual('x', x.name)
+        x[0] = 10.0
+        self.assertEqual(10.0, a[0])  # wrapped, not copied
+        y = VectorFloat64.from_numpy(a, copy=True)
+        y[1] = 20.0
+        self.assertEqual(2.0, a[1])
+        z = VectorInt64.from_numpy(np.array([1, 2], dtype=np.int32))  # lossless conversion
+        self.assertEqual(np.int64, z.value.dtype)
+        self.assertEqual(ScalarInt64(2), z[1])
+        self.assertRaises(PUCTypeError, VectorInt64.from_numpy, a)
+        self.assertRaises(PUCTypeError, VectorFloat64.from_numpy, np.array([1, 2]))
+        self.assertRaises(PUCTypeError, VectorBool.from_numpy, [True])
+        self.assertRaises(PUCConstructionError, VectorInt64.from_numpy, np.zeros((2, 2), dtype=np.int64))
+
+    def test_from_buffer(self):
+        a = np.array([7, 11], dtype=np.int64)
+        x = VectorInt64.from_buffer(a)
+        a[0] = 8
+        self.assertEqual(ScalarInt64(8), x[0])  # shares memory
+        raw = bytearray(np.array([1.5, 2.5]).tobytes())
+        y = VectorFloat64.from_buffer(raw)
+        self.assertEqual(2, len(y))
+        self.assertEqual(ScalarFloat64(2.5), y[1])
+        self.assertRaises(PUCConstructionError, VectorFloat64.from_buffer, bytearray(3))
+        self.assertRaises(PUCTypeError, VectorInt64.from_buffer, np.array([1.0]))
+        self.assertRaises(PUCTypeError, VectorInt64.from_buffer, 123)
+
+    def test_from_iter(self):
+        x = VectorInt64.from_iter((i * i for i in range(10)), chunk_size=3)
+        self.assertEqual(10, len(x))
+        self.assertEqual(ScalarInt64(81), x[9])
+        y = VectorBool.from_iter(iter([True, False]), count=2)
+        self.assertEqual(2, len(y))
+        self.assertEqual(ScalarBool(False), y[1])
+        self.assertEqual(0, len(VectorFloat64.from_iter([])))
+        self.assertRaises(PUCTypeError, VectorInt64.from_iter, [1, 2.5])
+        self.assertRaises(PUCConstructionError, VectorInt64.from_iter, [1, 2, 3], count=2)
+        self.assertRaises(PUCConstructionError, VectorInt64.from_iter, [1, 2, 3], count=4)
+
+    def test_extend(self):
+        x = VectorInt64(1, 2)
+        head = x[0:2]
+        x.extend(VectorInt64(3, 4))
+        x.append(5)
+        x.append(ScalarInt64(6))
+        x.extend([])
+        self.assertEqual([1, 2, 3, 4, 5, 6], list(x.value))
+        self.assertTrue(x.storage is head.storage)  # in place
+        self.assertEqual([1, 2], list(head.value))
+        every_other = VectorInt64(storage=x.storage, shape=[3], strides=[2])
+        every_other.append(7)  # not a tail view: copied into a storage of its own
+        self.assertEqual([1, 3, 5, 7], list(every_other.value))
+        self.assertEqual(6, len(x.storage))
+        fresh = VectorInt64(1, 2)  # has never grown
+        fresh.extend([])
+        fresh.extend(VectorInt64())
+        self.assertEqual([1, 2], list(fresh.value))
+        table = Table(VectorInt64(1, 2), VectorString('a', 'b'), names=['qty', 'sym'])
+        table.append(table.select_rows(slice(0, 0)))
+        self.assertEqual(2, len(table))
+        self.assertEqual(ScalarInt64(6), x.find(7))  # builds the find index
+        x.append(7)
+        self.assertEqual(ScalarInt64(6), x.find(7))  # the find index is extended too
+        self.assertRaises(PUCTypeError, x.extend, VectorFloat64(1.0))
+        self.assertRaises(PUCTypeError, x.append, 1.5)
+
+    def test_find(self):
+        x = VectorInt64(30, 10, 20, 10)
+        r = x.find(VectorInt64(10, 40, 30))
+        self.assertTrue(isinstance(r, VectorInt64))
+        self.assertEqual([1, 4, 0], list(r.value))
+        index = x._find_index
+        self.assertEqual([2], list(x.find([20]).value))
+        self.assertTrue(x._find_index is index)  # built once
+        self.assertEqual(ScalarInt64(4), x.find(99))
+        self.assertEqual(ScalarInt64(0), x.find(ScalarInt64(30)))
+        self.assertEqual(0, len(x.find([])))
+        x[0] = 40
+        self.assertTrue(x._find_index is None)
+        self.assertEqual(ScalarInt64(0), x.find(40))
+        self.assertEqual(ScalarInt64(4), x.find(30))
+        s = VectorFloat64(1.0, 2.5)
+        s.set_attribute('sorted')
+        self.assertEqual([1, 2], list(s.find([2.5, 3.0]).value))
+        self.assertTrue(s._find_index is None)  # the attribute is used instead
+        self.assertEqual([1], list(VectorBool(True, False).find([False]).value))
+        self.assertRaises(PUCTypeError, x.find, VectorFloat64(1.0))
+        self.assertRaises(PUCTypeError, x.find, 2.5)
+
+
+class TestStorage(unittest.TestCase):
+    def test_init(self):
+        s = Storage(n=10, kind='bool')
+        self.assertEqual(10, len(s))
+        self.assertEqual('bool', s.kind)
+        s = Storage([0, 1, 1, 0], kind='bool')
+        self.assertEqual([False, True, True, False], list(s.buffer))
+        a = np.arange(3.0)
+        s = Storage(a)
+        self.assertEqual('float64', s.kind)
+        self.assertTrue(s.buffer is a)  # wrapped, not copied
+        self.assertEqual(0, len(Storage(place='memory')))
+        self.assertRaises(PUCConstructionError, Storage, place='GPU')
+        self.assertRaises(PUCConstructionError, Storage, n=3, kind='int32')
+        self.assertRaises(PUCConstructionError, Storage, [1, 2], n=3, kind='int64')
+        self.assertRaises(PUCConstructionError, Storage, [1, 2])  # kind cannot be inferred
+
+    def test_extend(self):
+        s = Storage(np.arange(3, dtype=np.int64))
+        v = VectorInt64(storage=s)
+        s.extend([3])
+        self.assertEqual(8, s.capacity)
+        allocation = s._allocation
+        for i in range(4, 8):
+            s.extend(np.array([i]))
+        self.assertTrue(s._allocation is allocation)  # no reallocation until full
+        self.assertEqual(list(range(8)), list(s.buffer))
+        s.extend(np.arange(8, 20))
+        self.assertEqual(20, s.capacity)
+        self.assertEqual(3, len(v))  # views keep their elements
+        self.assertEqual(19, s.buffer[19])
+        self.assertEqual(20, len(pickle.loads(pickle.dumps(s)).buffer))
+
+
+class TestStorageDisk(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_create_and_reopen(self):
+        path = os.path.join(self.directory, 'x')
+        s = Storage(np.arange(5, dtype=np.int64), place=('disk', path))
+        self.assertEqual(('disk', path), s.place)
+        self.assertTrue(isinstance(s.buffer, np.memmap))
+        v = VectorInt64(storage=s, shape=[2], offset=3)
+        v[0] = 30
+        s.flush()
+        reopened = Storage(place=('disk', path))
+        self.assertEqual('int64', reopened.kind)
+        self.assertEqual([0, 1, 2, 30, 4], list(reopened.buffer))
+        self.assertEqual(struct.calcsize(Storage.header_format) + 5 * 8, os.path.getsize(path))
+        m = Matrix(Storage(n=6, kind='float64', place=('disk', os.path.join(self.directory, 'm'))), [2, 3])
+        m[1, 2] = 1.5
+        self.assertEqual(ScalarFloat64(1.5), m[1, 2])
+        empty = Storage(n=0, kind='bool', place=('disk', os.path.join(self.directory, 'empty')))
+        self.assertEqual(0, len(Storage(place=('disk', empty.place[1]))))
+
+    def test_extend(self):
+        path = os.path.join(self.directory, 'x')
+        s = Storage(n=0, kind='float64', place=('disk', path))
+        s.extend([1.0, 2.0])
+        s.extend([3.0])
+        self.assertTrue(isinstance(s.buffer, np.memmap))
+        s.flush()
+        self.assertEqual([1.0, 2.0, 3.0], list(Storage(place=('disk', path)).buffer))
+        s.compact()
+        self.assertEqual(struct.calcsize(Storage.header_format) + 3 * 8, os.path.getsize(path))
+        self.assertEqual([1.0, 2.0, 3.0], list(s.buffer))
+
+    def test_pickle_as_path(self):
+        path = os.path.join(self.directory, 'x')
+        v = VectorFloat64(storage=Storage([1.0, 2.0], kind='float64', place=('disk', path)))
+        v[1] = 3.0
+        copied = pickle.loads(pickle.dumps(v))
+        self.assertEqual(('disk', path), copied.storage.place)
+        self.assertEqual([1.0, 3.0], list(copied.value))
+        copied[0] = 7.0
+        copied.storage.flush()
+        self.assertEqual(7.0, Storage(place=('disk', path)).buffer[0])
+
+    def test_errors(self):
+        path = os.path.join(self.directory, 'x')
+        self.assertRaises(PUCConstructionError, Storage, place=('disk', path))  # does not exist
+        self.assertRaises(PUCConstructionError, Storage, n=2, kind='object', place=('disk', path))
+        self.assertRaises(PUCConstructionError, Storage, ['a', 'b'], kind='string', place=('disk', path))
+        self.assertRaises(PUCConstructionError, Storage, np.array(['a', 'b']), place=('disk', path))
+        Storage(n=2, kind='bool', place=('disk', path))
+        self.assertRaises(PUCConstructionError, Storage, kind='int64', place=('disk', path))
+        with open(path, 'wb') as f:
+            f.write(b'not a storage')
+        self.assertRaises(PUCConstructionError, Storage, place=('disk', path))
+
+
+class TestStorageChunked(unittest.TestCase):
+    def test_extend(self):
+        s = Storage(np.arange(5, dtype=np.int64), chunk_size=4)
+        self.assertEqual(5, len(s))
+        self.assertEqual(2, len(s.chunks))
+        first = s.chunks[0]
+        s.extend(np.arange(5, 13))
+        self.assertTrue(s.chunks[0] is first)  # blocks are never reallocated
+        self.assertEqual(4, len(s.chunks))
+        self.assertEqual(16, s.capacity)
+        self.assertEqual([[1, 2, 3], [4, 5, 6, 7], [8, 9]], [list(a) for a in s._segments(1, 10)])
+        self.assertEqual([[1, 3], [5, 7], [9, 11]], [list(a) for a in s._segments(1, 13, 2)])
+        self.assertEqual([[]], [list(a) for a in s._segments(3, 3)])
+        self.assertEqual(0, len(Storage(n=0, kind='float64', chunk_size=2)))
+        self.assertRaises(PUCConstructionError, Storage, n=3, kind='int64', chunk_size=0)
+        self.assertRaises(PUCConstructionError, Storage, n=3, kind='int64', chunk_size=2, place=('disk', 'x'))
+
+    def test_vector(self):
+        s = Storage(np.arange(10, dtype=np.int64), chunk_size=4)
+        v = VectorInt64(storage=s, shape=[4], offset=1, strides=[2])  # 1, 3, 5, 7
+        self.assertEqual([1, 3, 5, 7], list(v.value))
+        self.assertEqual(ScalarInt64(7), v[3])
+        self.assertEqual([7, 1], list(v[[3, 0]].value))
+        self.assertEqual([3, 5], list(v[1:3].value))
+        self.assertEqual([5, VectorInt64.null_value], list(v._take(np.array([2, -1])).value))
+        v[[0, 3]] = VectorInt64(100, 700)
+        v[1:3] = 0
+        self.assertEqual([0, 100, 2, 0, 4, 0, 6, 700, 8, 9], list(VectorInt64(storage=s).value))
+        self.assertEqual([100, 0, 0, 700], list(v.deepcopy().value))
+        self.assertEqual(list(np.arange(10) * 2), list((VectorInt64.from_numpy(np.arange(10)).lazy() * 2).compute().value))
+        w = VectorInt64(storage=s)
+        self.assertEqual(list(w.value * 3), list((w.lazy() * 3).compute().value))
+        self.assertEqual(list(w.value), list(pickle.loads(pickle.dumps(w)).value))
+        self.assertRaises(PUCConstructionError, Matrix, s, [2, 5])
+
+    def test_compact(self):
+        s = Storage(np.arange(6, dtype=np.float64), chunk_size=4)
+        v = VectorFloat64(storage=s, shape=[2], offset=3)
+        s.compact()
+        self.assertTrue(s.chunks is None)
+        self.assertEqual(6, len(s))
+        self.assertEqual([3.0, 4.0], list(v.value))
+        self.assertTrue(v.value.base is not None)  # a view again
+        s.extend([6.0])
+        self.assertEqual(7, len(s))
+
+    def test_table(self):
+        t = Table(
+            VectorInt64(storage=Storage(np.arange(10, dtype=np.int64), chunk_size=3)),
+            VectorFloat64.from_numpy(np.arange(10) / 2.0),
+            names=['id', 'price'],
+            )
+        self.assertEqual([1, 7, 9], list(t.select('where id = 1 or price >= 3.5 and id <> 8')['id'].value))
+        t.append(Table(VectorInt64(10, 11), VectorFloat64(5.0, 5.5), names=['id', 'price']))
+        self.assertEqual(4, len(t['id'].storage.chunks))
+        self.assertEqual([11], list(t.select('where id > 10')['id'].value))
+        self.assertEqual([10, 2], list(t.select_rows(VectorInt64(10, 2))['id'].value))
+
+
+
+class TestStorageRing(unittest.TestCase):
+    def test_extend(self):
+        s = Storage(np.arange(3, dtype=np.int64), ring=4)
+        self.assertEqual((3, 4), (len(s), s.capacity))
+        buffer = s.buffer
+        s.extend(np.arange(3, 6))
+        self.assertTrue(s.buffer is buffer)  # never reallocated
+        self.assertEqual(4, len(s))
+        self.assertEqual([[2, 3], [4, 5]], [list(a) for a in s._segments(0, 4)])
+        self.assertEqual([[3], [5]], [list(a) for a in s._segments(1, 4, 2)])
+        self.assertEqual([[4]], [list(a) for a in s._segments(2, 3)])
+        s.extend(np.arange(6, 16))  # more than the capacity
+        self.assertEqual([[12, 13, 14, 15]], [list(a) for a in s._segments(0, 4)])
+        self.assertEqual([[12, 13, 14, 15]], [list(a) for a in s._copy()._segments(0, 4)])
+        s.compact()
+        self.assertEqual(([12, 13, 14, 15], True), (list(s.buffer), s.contiguous))
+        self.assertRaises(PUCConstructionError, Storage, n=3, kind='int64', ring=2, chunk_size=2)
+
+    def test_vector(self):
+        v = VectorInt64(storage=Storage(np.arange(5, dtype=np.int64), ring=5))
+        v.extend([5, 6])
+        self.assertEqual([2, 3, 4, 5, 6], list(v.value))
+        self.assertEqual([[2, 3, 4], [5, 6]], [list(a) for a in v.segments()])
+        self.assertTrue(all(a.base is v.storage.buffer for a in v.segments()))
+        self.assertEqual([6, 2], list(v[[4, 0]].value))
+        v[[1, 4]] = VectorInt64(30, 60)
+        self.assertEqual([2, 30, 4, 5, 60], list(v.value))
+        self.assertEqual(3, v.find(VectorInt64(5)).value[0])
+        v.set_attribute('unique')
+        v.append(7)  # drops 2
+        self.assertEqual(('unique', 3), (v.attribute, v.find(VectorInt64(60, 2)).value[0]))
+        self.assertEqual(5, v.find(VectorInt64(2)).value[0])
+
+    def test_repr(self):
+        self.assertEqual('Storage(kind=int64, n=3, place=memory)', repr(Storage(np.arange(3, dtype=np.int64))))
+        chunked = Storage(np.arange(5, dtype=np.int64), chunk_size=2)
+        self.assertEqual('Storage(kind=int64, n=5, place=memory, chunk_size=2)', repr(chunked))
+        ring = Storage(np.arange(3, dtype=np.int64), ring=4)
+        self.assertEqual('Storage(kind=int64, n=3, place=memory, ring=4)', repr(ring))
+
+
+class TestVectorView(unittest.TestCase):
+    def test_views_share_storage(self):
+        s = Storage(np.arange(10, dtype=np.int64))
+        v = Vector(storage=s)  # dispatches on the kind of the storage
+        self.assertTrue(isinstance(v, VectorInt64))
+        self.assertEqual(10, len(v))
+        first8 = VectorInt64(storage=s, shape=[8])
+        self.assertEqual(8, len(first8))
+        every_other = VectorInt64(storage=s, shape=[5], offsets=[0], strides=[2])
+        self.assertEqual([0, 2, 4, 6, 8], list(every_other.value))
+        self.assertFalse(every_other.is_contiguous())
+        every_other[1] = 99
+        self.assertEqual(ScalarInt64(99), v[2])  # views share storage
+        self.assertRaises(PUCIndexError, VectorInt64, storage=s, shape=[6], strides=[2])
+        self.assertRaises(PUCConstructionError, VectorFloat64, storage=s)
+
+    def test_first_delta(self):
+        v = VectorInt64(storage=Storage(np.array([1, 4, 9, 16], dtype=np.int64)), shape=[3])
+        w = Vector(storage=v.storage, shape=v.shape, offset=1)
+        self.assertEqual([3, 5, 7], list(w.value - v.value))
+
+    def test_slice(self):
+        v = VectorInt64(0, 1, 2, 3, 4, 5)
+        w = v[1:5:2]
+        self.assertTrue(w.storage is v.storage)
+        self.assertEqual([1, 3], list(w.value))
+        self.assertEqual([3], list(w[1:].value))
+        self.assertEqual(0, len(v[4:2]))
+        self.assertEqual(6, len(v[:100]))
+        v[0:2] = VectorInt64(10, 11)
+        v[4:] = 0
+        self.assertEqual([10, 11, 2, 3, 0, 0], list(v.value))
+        def getitem(index):
+            return v[index]
+        self.assertRaises(PUCIndexError, getitem, slice(-1, None))
+        self.assertRaises(PUCIndexError, getitem, slice(None, None, 0))
+
+    def test_copies(self):
+        s = Storage(np.arange(6, dtype=np.int64))
+        v = VectorInt64(storage=s, shape=[3], offset=1, strides=[2])
+        c = v.copy()
+        self.assertTrue(c.storage is s)
+        d = v.deepcopy()
+        self.assertFalse(d.storage is s)
+        self.assertEqual(list(v.value), list(d.value))
+        e = v.deep_contiguous_copy()
+        self.assertEqual(3, len(e.storage))
+        self.assertTrue(e.is_contiguous())
+        self.assertEqual([1, 3, 5], list(e.value))
+        self.assertTrue(e.make_contiguous() is e)
+        self.assertEqual([1, 3, 5], list(v.make_contiguous().value))
+
+
+class TestMatrix(unittest.TestCase):
+    def test_getitem(self):
+        s = Storage(np.arange(12.0))
+        m = Matrix(storage=s, shape=[3, 4])
+        self.assertTrue(m.is_contiguous())
+        self.assertEqual(ScalarFloat64(6.0), m[1, 2])
+        column = m[:, 3]
+        self.assertTrue(isinstance(column, VectorFloat64))
+        self.assertTrue(column.storage is s)
+        self.assertEqual([3.0, 7.0, 11.0], list(column.value))
+        row = m[2, :]
+        self.assertEqual([8.0, 9.0, 10.0, 11.0], list(row.value))
+        sub = m[1:, ::2]
+        self.assertTrue(isinstance(sub, Matrix))
+        self.assertTrue(sub.storage is s)
+        self.assertEqual([[4.0, 6.0], [8.0, 10.0]], sub.value.tolist())
+        self.assertFalse(sub.is_contiguous())
+        self.assertEqual([[4.0, 6.0], [8.0, 10.0]], sub.deep_contiguous_copy().value.tolist())
+        selected = m[VectorBool(False, True, True), VectorInt64(0, 3)]
+        self.assertFalse(selected.storage is s)
+        self.assertEqual([[4.0, 7.0], [8.0, 11.0]], selected.value.tolist())
+        self.assertEqual([1.0, 5.0, 9.0], list(m[[0, 1, 2], 1].value))
+        self.assertEqual([4.0, 5.0, 6.0, 7.0], list(m[1].value))
+        def getitem(index):
+            return m[index]
+        self.assertRaises(PUCIndexError, getitem, (3, 0))
+        self.assertRaises(PUCIndexError, getitem, (0, 0, 0))
+        self.assertRaises(PUCIndexError, Matrix, s, [4, 4])
+
+    def test_setitem(self):
+        m = Matrix(Storage(n=6, kind='int64'), [2, 3])
+        m[0, 1] = 5
+        m[1, :] = VectorInt64(7, 8, 9)
+        m[VectorBool(True, False), [0, 2]] = 1
+        self.assertEqual([[1, 5, 1], [7, 8, 9]], m.value.tolist())
+        self.assertEqual([1, 5, 1, 7, 8, 9], list(m.storage.buffer))
+
+
+class TestArithmetic(unittest.TestCase):
+    def test_eager(self):
+        a = VectorInt64(1, 2, 3)
+        b = VectorFloat64(0.5, 1.0, 1.5)
+        self.assertTrue(isinstance(a + a, VectorInt64))
+        self.assertEqual([2, 4, 6], list((a + a).value))
+        self.assertEqual([1.5, 3.0, 4.5], list((a + b).value))
+        self.assertEqual([0.5, 1.0, 1.5], list((a - b).value))
+        self.assertEqual([10, 20, 30], list((10 * a).value))
+        self.assertEqual([2.0, 2.0, 2.0], list((a / b).value))
+        self.assertEqual([0.5, 1.0, 1.5], list((a / 2).value))
+        self.assertEqual([2.0, 1.0, 2.0 / 3], list((1 / b).value))
+        self.assertEqual([-1, -2, -3], list((-a).value))
+        self.assertEqual([1.5, 2.0, 2.5], list((ScalarFloat64(1.0) + b).value))
+        self.assertEqual([1, 2, 3], list(abs(-a).value))
+        self.assertEqual([2, 1], list(add(VectorBool(True, False), VectorBool(True, True)).value))  # as ScalarBool
+        self.assertEqual(list(np.exp([0.5, 1.0, 1.5])), list(exp(b).value))
+        self.assertEqual(list(np.sqrt([1.0, 2.0, 3.0])), list(a.sqrt().value))
+        self.assertEqual([1.0, 2.0, 3.0], list(multiply(a, 1.0).value))
+        self.assertEqual([3, 6, 9], list((np.int64(3) * a).value))
+
+    def test_views(self):
+        s = Storage(np.arange(6, dtype=np.int64))
+        every_other = VectorInt64(storage=s, shape=[3], strides=[2])
+        self.assertEqual([1, 5, 9], list(add(every_other, VectorInt64(storage=s, shape=[3], offset=1, strides=[2])).value))
+
+    def test_lazy(self):
+        n = Expression.chunk_size * 2 + 5
+        a = VectorFloat64.from_numpy(np.arange(n, dtype=np.float64) / n)
+        b = VectorInt64.from_numpy(np.arange(n))
+        c = VectorFloat64.from_numpy(np.linspace(-1.0, 1.0, n))
+        e = (a.lazy() + b) * c.lazy().exp()
+        self.assertTrue(isinstance(e, Expression))
+        self.assertEqual('float64', e.kind)
+        self.assertEqual(n, len(e))
+        v = e.compute()
+        self.assertTrue(isinstance(v, VectorFloat64))
+        np.testing.assert_allclose((a.value + b.value) * np.exp(c.value), v.value)
+        shared = b.lazy() * 2
+        self.assertEqual(list(b.value * 4), list((shared + shared).compute().value))
+        self.assertEqual(list(b.value + 1), list(add(1, b.lazy()).compute().value))
+        self.assertEqual(list(a.value), list(a.lazy().compute().value))
+        self.assertEqual(0, len((VectorInt64().lazy() - 1).compute()))
+
+    def test_errors(self):
+        self.assertRaises(PUCConstructionError, add, VectorInt64(1, 2), VectorInt64(1))
+        self.assertRaises(PUCConstructionError, add, VectorInt64(1, 2).lazy(), VectorInt64(1))
+        self.assertRaises(PUCTypeError, add, VectorInt64(1), 'a')
+        self.assertRaises(PUCTypeError, add, VectorInt64(1), ScalarString('a'))
+
+
+class TestAttributes(unittest.TestCase):
+    def test_set_attribute(self):
+        v = VectorInt64(1, 3, 3, 7)
+        self.assertTrue(v.attribute is None)
+        for attribute in Vector.attributes:
+            if attribute != 'unique':
+                v.set_attribute(attribute)
+                self.assertEqual(attribute, v.attribute)
+        self.assertRaises(PUCConstructionError, v.set_attribute, 'unique')
+        self.assertEqual('parted', v.attribute)  # unchanged
+        self.assertRaises(PUCConstructionError, VectorInt64(2, 1).set_attribute, 'sorted')
+        self.assertRaises(PUCConstructionError, VectorInt64(1, 2, 1).set_attribute, 'parted')
+        self.assertRaises(PUCConstructionError, v.set_attribute, 'ordered')
+        v.set_attribute(None)
+        self.assertTrue(v.attribute is None)
+        VectorInt64().set_attribute('parted')
+
+    def test_lookup(self):
+        keys = np.array([3, 7, 4, 1], dtype=np.int64)
+        expected = {
+            'sorted': (VectorInt64(1, 3, 3, 7), [1, 3, -1, 0]),
+            'unique': (VectorInt64(7, 3, 1, 5), [1, 0, -1, 2]),
+            'grouped': (VectorInt64(7, 3, 7, 1, 3), [1, 0, -1, 3]),
+            'parted': (VectorInt64(3, 3, 7, 1, 1), [0, 2, -1, 3]),
+        }
+        for attribute, (v, positions) in expected.items():
+            self.assertTrue(v._lookup(keys) is None)
+            v.set_attribute(attribute)
+            self.assertEqual(positions, list(v._lookup(keys)), attribute)
+
+    def test_positions_where(self):
+        def positions(v, op, value):
+            rows = v._positions_where(op, value)
+            return range(len(v))[rows] if isinstance(rows, slice) else list(rows)
+
+        v = VectorInt64(1, 3, 3, 7)
+        self.assertTrue(v._positions_where('=', 3) is None)
+        v.set_attribute('sorted')
+        self.assertEqual([1, 2], positions(v, '=', 3))
+        self.assertEqual([0], positions(v, '<', 3))
+        self.assertEqual([0, 1, 2], positions(v, '<=', 3.5))
+        self.assertEqual([3], positions(v, '>', 3))
+        self.assertEqual([1, 2, 3], positions(v, '>=', 3))
+        self.assertTrue(v._positions_where('!=', 3) is None)
+        g = VectorInt64(7, 3, 7, 1)
+        g.set_attribute('grouped')
+        self.assertEqual([0, 2], positions(g, '=', 7))
+        self.assertEqual([], positions(g, '=', 5))
+        self.assertTrue(g._positions_where('=', 7.5) is None)
+        self.assertTrue(g._positions_where('<', 7) is None)
+        p = VectorInt64(7, 7, 3, 1)
+        p.set_attribute('parted')
+        self.assertEqual([0, 1], positions(p, '=', 7))
+        f = VectorFloat64(2.0, 1.0)
+        f.set_attribute('unique')
+        self.assertEqual([1], positions(f, '=', 1))
+
+    def test_kept_and_removed(self):
+        v = VectorInt64(1, 2, 3)
+        v.set_attribute('sorted')
+        self.assertEqual('sorted', v.copy().attribute)
+        self.assertEqual('sorted', v.deepcopy().attribute)
+        self.assertTrue(v[0:2].attribute is None)  # a new view
+        w = v.copy()
+        w.extend([3, 4])
+        self.assertEqual('sorted', w.attribute)
+        w.append(0)
+        self.assertTrue(w.attribute is None)
+        u = VectorInt64(1, 2, 3)
+        u.set_attribute('unique')
+        longer = u.copy()
+        longer.extend([9])
+        self.assertEqual('unique', longer.attribute)
+        self.assertEqual([3], list(longer._lookup(np.array([9]))))
+        self.assertEqual([-1], list(u._lookup(np.array([9]))))  # u shares the index but is shorter
+        longer.extend([1])
+        self.assertTrue(longer.attribute is None)
+        g = VectorInt64(5, 5, 6)
+        g.set_attribute('parted')
+        g.extend([6, 7])
+        self.assertEqual([2, 4], list(g._lookup(np.array([6, 7]))))
+        g.append(5)
+        self.assertTrue(g.attribute is None)
+        v[1] = 10
+        self.assertTrue(v.attribute is None)
+
+
+
+class TestVectorString(unittest.TestCase):
+    def test_codes(self):
+        v = VectorString('ibm', 'msft', 'ibm', name='sym')
+        self.assertEqual(np.int32, v.value.dtype)
+        self.assertEqual(v.value[0], v.value[2])
+        self.assertEqual(['ibm', 'msft', 'ibm'], list(v.decode()))
+        self.assertEqual(ScalarString('msft'), v[1])
+        self.assertEqual(list(v.value), list(VectorString.from_numpy(np.array(['ibm', 'msft', 'ibm'])).value))
+        self.assertEqual(list(v.value), list(VectorString.from_iter(iter(['ibm', 'msft', 'ibm']), chunk_size=2).value))
+        self.assertEqual([1, 3], list(v.find(['msft', 'aapl']).value))
+        v[2] = 'aapl'
+        v.append(ScalarString('ibm'))
+        self.assertEqual(['ibm', 'msft', 'aapl', 'ibm'], list(v.decode()))
+        self.assertEqual(0, v._take(np.array([-1])).value[0])  # the null symbol, ''
+        self.assertEqual(['ibm', 'aapl'], list(pickle.loads(pickle.dumps(v[::2])).decode()))
+        self.assertRaises(PUCTypeError, VectorString, 'a', 1)
+        accented = VectorString.from_iter([u'caf\xe9', 'caf\xc3\xa9', u'tea'])
+        self.assertEqual(['caf\xc3\xa9', 'caf\xc3\xa9', 'tea'], list(accented.decode()))
+        self.assertEqual(accented.value[0], accented.value[1])
+        self.assertEqual(accented.value[2], VectorString('tea').value[0])
+        self.assertRaises(PUCTypeError, v.extend, [1, 2])
+        self.assertRaises(PUCConstructionError, Storage, np.zeros(1, dtype=np.int32), kind='string', place=('disk', 'x'))
+
+    def test_table(self):
+        t = Table(VectorString('b', 'a', 'b', 'c'), VectorInt64(1, 2, 3, 4), names=['sym', 'qty'])
+        self.assertEqual([1, 3], list(t.select('where sym = "b"')['qty'].value))
+        self.assertEqual([], list(t.select('where sym = "never seen"')['qty'].value))
+        self.assertEqual([2, 1, 3], list(t.select('where sym < "c" ordered by sym')['qty'].value))
+        self.assertRaises(PUCTypeError, t.select, 'where sym = 1')
+        self.assertRaises(PUCTypeError, t.select, 'where 2 > sym')
+        t['sym'].set_attribute('grouped')
+        self.assertEqual([2, 4], list(t.select('where sym <> "b"')['qty'].value))
+        self.assertEqual([1, 3], list(t.select('where sym = "b"')['qty'].value))
+        totals = t.summarize(['sym'], [('total', 'sum', 'qty')])
+        self.assertEqual((['b', 'a', 'c'], [4, 2, 4]), (list(totals['sym'].decode()), list(totals['total'].value)))
+        names = Table(VectorString('c', 'b'), VectorString('carol', 'bob'), names=['sym', 'owner'])
+        joined = join(t, names, ['sym'])
+        self.assertEqual(['bob', 'bob', 'carol'], list(joined['owner'].decode()))
+        self.assertEqual([3, 1, -1], list(KeyedTable(t, 'sym', index='hash').positions(['c', 'a', 'd'])))
+        d = Dictionary()
+        d['x'] = VectorInt64(7)
+        self.assertEqual(ScalarInt64(7), d['x'])
+        self.assertEqual(ScalarString('x'), d.find(7))
+
+    def test_min_max(self):
+        VectorString('zzq2')  # interned before the others, so its code is the least of them
+        t = Table(VectorInt64(1, 1, 2), VectorString('zzq2', 'aaq2', 'mmq2'), names=['k', 's'])
+        self.assertEqual(['aaq2'], list(t.select('select min(s)')['s'].decode()))
+        self.assertEqual(['zzq2'], list(t.select('select max(s)')['s'].decode()))
+        extremes = t.summarize(['k'], [('low', 'min', 's'), ('high', 'max', 's')])
+        self.assertEqual((['aaq2', 'mmq2'], ['zzq2', 'mmq2']), (list(extremes['low'].decode()), list(extremes['high'].decode())))
+        t['s'].set_valid([True, False, True])
+        self.assertEqual(['zzq2', 'mmq2'], list(t.summarize(['k'], [('low', 'min', 's')])['low'].decode()))
+
+
+class TestVectorTemporal(unittest.TestCase):
+    def test_construction(self):
+        v = VectorDateTime.from_iso(['2020-01-01T09:30', '2020-01-01T09:31:15.5'])
+        self.assertEqual(np.dtype('M8[ns]'), v.value.dtype)
+        self.assertEqual(list(v.value), list(VectorDateTime(datetime.datetime(2020, 1, 1, 9, 30), datetime.datetime(2020, 1, 1, 9, 31, 15, 500000)).value))
+        self.assertEqual(list(v.value), list(VectorDateTime.from_integers([1577871000000, 1577871075500], unit='ms').value))
+        self.assertEqual(ScalarDatetime(np.datetime64('2020-01-01T09:30', 'ns')), v[0])
+        self.assertEqual(1, v.find(np.datetime64('2020-01-01T09:31:15.5')).value)
+        v.append(datetime.datetime(2020, 1, 2))
+        self.assertEqual(3, len(v))
+        self.assertTrue(np.isnat(v._take(np.array([-1])).value[0]))
+        self.assertEqual([60, 3600], list(VectorTimeDelta.from_integers([1, 60], unit='m').value.astype('m8[s]').astype(np.int64)))
+        self.assertRaises(PUCConstructionError, VectorDateTime.from_iso, ['not a time'])
+        self.assertRaises(PUCConstructionError, VectorDateTime.from_integers, [1], unit='week')
+        self.assertRaises(PUCTypeError, v.extend, [1])
+        self.assertRaises(PUCTypeError, VectorTimeDelta.from_integers, [1.5])
+
+    def test_arithmetic(self):
+        t = VectorDateTime.from_iso(['2020-01-01T09:30', '2020-01-01T09:31:15'])
+        elapsed = t - t[0]
+        self.assertTrue(isinstance(elapsed, VectorTimeDelta))
+        self.assertEqual([0, 75], list(elapsed.value.astype('m8[s]').astype(np.int64)))
+        later = t + datetime.timedelta(minutes=1)
+        self.assertEqual(list((t.value + np.timedelta64(60, 's'))), list(later.value))
+        self.assertEqual(list(later.value), list((t.lazy() + VectorTimeDelta.from_integers([60, 60], unit='s')).compute().value))
+        self.assertEqual([0.0, 1.25], list((elapsed / np.timedelta64(1, 'm')).value))
+        self.assertEqual(list(elapsed.value * 2), list((2 * elapsed).value))
+        self.assertEqual([False, True], list((t > np.datetime64('2020-01-01T09:30:30')).value))
+        self.assertEqual([True, False], list((elapsed < VectorTimeDelta.from_integers([1, 1], unit='s')).value))
+        self.assertEqual([True, False], list((VectorInt64(1, 5) <= 2).value))
+        self.assertRaises(PUCTypeError, add, t, t)
+        self.assertRaises(PUCTypeError, multiply, t, 2)
+        self.assertRaises(PUCTypeError, less, t, elapsed)
+
+    def test_bucket(self):
+        t = VectorDateTime.from_iso(['2020-01-01T09:30:59', '2020-01-01T09:31:00', 'NaT'])
+        minutes = t.bucket(datetime.timedelta(minutes=1))
+        self.assertEqual(list(VectorDateTime.from_iso(['2020-01-01T09:30', '2020-01-01T09:31']).value), list(minutes.value[:2]))
+        self.assertTrue(np.isnat(minutes.value[2]))
+        elapsed = VectorTimeDelta.from_integers([29, 61], unit='s').bucket(ScalarTimedelta(datetime.timedelta(seconds=30)))
+        self.assertEqual([0, 60], list(elapsed.value.astype('m8[s]').astype(np.int64)))
+        self.assertRaises(PUCConstructionError, t.bucket, datetime.timedelta(0))
+
+    def test_xbar(self):
+        t = VectorDateTime.from_iso(['2020-01-01T09:34:59', '2020-01-01T09:35:00'])
+        self.assertEqual(list(t.bucket(np.timedelta64(5, 'm')).value), list(t.xbar(np.timedelta64(5, 'm')).value))
+        v = VectorInt64(-3, 0, 7, 12)
+        self.assertEqual([-5, 0, 5, 10], list(v.xbar(5).value))
+        self.assertEqual([0.0, 0.5, -1.0], list(VectorFloat64(0.25, 0.75, -0.75).xbar(0.5).value))
+        v.set_valid([True, False, True, True])
+        self.assertEqual(None, v.xbar(ScalarInt64(5))[1])
+        self.assertRaises(PUCConstructionError, v.xbar, 2.5)
+        self.assertRaises(PUCConstructionError, v.xbar, 0)
+        self.assertRaises(PUCTypeError, VectorString('a').xbar, 1)
+
+    def test_table(self):
+        t = Table(VectorDateTime.from_iso(['2020-01-01T09:30', '2020-01-01T09:31', '2020-01-01T09:32']), VectorInt64(1, 2, 3), names=['time', 'qty'])
+        self.assertEqual([2, 3], list(t.select('where time >= "2020-01-01T09:31"')['qty'].value))
+        t['time'].set_attribute('sorted')
+        self.assertEqual([1], list(t.select('where time < "2020-01-01T09:31"')['qty'].value))
+        self.assertEqual(2, KeyedTable(t, 'time')[np.datetime64('2020-01-01T09:31')]['qty'].value)
+
+
+
+
+
+class TestNulls(unittest.TestCase):
+    def test_vector(self):
+        v = VectorFloat64(1.0, 2.0, 3.0, 4.0)
+        v.set_valid([True, False, True, True])
+        self.assertEqual((1, 1), (v.null_count(), v.validity.size))
+        self.assertTrue(v[1] is None)
+        self.assertEqual(ScalarFloat64(3.0), v[2])
+        self.assertEqual([True, False], list(v[0:2].valid()))
+        self.assertEqual([False, True], list(v[[1, 0]].valid()))
+        self.assertEqual([True, False], list(v._take(np.array([0, -1])).valid()))
+        self.assertEqual(1, v.copy().null_count())
+        v[1] = 20.0
+        v[3] = None
+        self.assertEqual([True, True, True, False], list(v.valid()))
+        v.extend(VectorFloat64(5.0))
+        self.assertEqual([True, True, True, False, True], list(v.valid()))
+        w = VectorInt64(1, 2)
+        w.extend(VectorInt64._take(VectorInt64(7), np.array([-1])))
+        self.assertEqual((3, 1), (len(w), w.null_count()))
+        self.assertTrue(VectorInt64(1)._take(np.array([0])).validity is None)
+        self.assertRaises(PUCConstructionError, v.set_valid, [True])
+
+    def test_arithmetic(self):
+        a = VectorInt64(1, 2, 3)
+        a.set_valid([True, False, True])
+        b = VectorInt64(10, 20, 30)
+        b.set_valid([True, True, False])
+        self.assertEqual([True, False, False], list((a + b).valid()))
+        self.assertEqual([True, False, True], list((a * 2.0).valid()))
+        self.assertEqual([True, False, False], list((a.lazy() - b).compute().valid()))
+        self.assertEqual(([False, False, True], None), (list((a > 1).value), (a > 1).validity))
+
+    def test_grouping(self):
+        t = Table(VectorInt64(1, 1, 2, 2), VectorFloat64(1.0, 2.0, 3.0, 4.0), names=['k', 'x'])
+        t['x'].set_valid([True, False, False, False])
+        result = t.summarize(['k'], [('n', 'count', 'x'), ('total', 'sum', 'x'), ('mean', 'mean', 'x'), ('last', 'last', 'x')])
+        self.assertEqual([1, 0], list(result['n'].value))
+        self.assertEqual([1.0], list(result['total'].value[:1]))
+        self.assertEqual([True, False], list(result['total'].valid()))
+        self.assertEqual([True, False], list(result['mean'].valid()))
+        self.assertEqual(ScalarFloat64(1.0), result['last'][0])
+        self.assertEqual([1], list(t.select('where x < 10')['k'].value))
+
+    def test_lookups(self):
+        d = Dictionary(VectorInt64(1, 2), VectorFloat64(0.5, 1.5))
+        self.assertEqual([False, True], list(d[VectorInt64(3, 2)].valid()))
+        left = Table(VectorInt64(1, 2), names=['k'])
+        right = Table(VectorInt64(2), VectorFloat64(9.0), names=['k', 'x'])
+        joined = join(left, right, ['k'], how='left')
+        self.assertEqual([False, True], list(joined['x'].valid()))
+        self.assertTrue(joined._row(0)['x'] is None)
+
+    def test_row_gathers(self):
+        t = Table(VectorInt64(1, 2, 3), VectorFloat64(0.25, 0.75, 1.0), names=['a', 'b'])
+        t['a'].set_valid([True, False, True])
+        t['b'].set_valid([True, True, False])
+        self.assertTrue(t[VectorInt64(1, 0)]['a'][0] is None)
+        self.assertEqual([True, False], list(t[VectorBool(False, True, True)]['b'].valid()))
+        self.assertEqual([False], list(t.select('select a, b where b > 0.5')['a'].valid()))
+        ordered = t.select('ordered by b desc')
+        self.assertEqual((1, [True, True, False]), (ordered['b'].null_count(), list(ordered['b'].valid())))
+        t['k'] = VectorInt64(7, 7, 8)
+        t['k'].set_valid([True, True, False])
+        plied = t.ply(['k'], lambda group, extra: group.select_columns(['b']))
+        self.assertEqual([True, True, False], list(plied['k'].valid()))
+        t.mutate(['k'], lambda group, extra: group.select_columns(['a']).rename((('a', 'c'),)))
+        self.assertEqual([True, False, True], list(t['c'].valid()))
+
+
+class TestReductions(unittest.TestCase):
+    def test_reductions(self):
+        v = VectorInt64(3, 1, 4, 1, 5)
+        self.assertEqual(ScalarInt64(14), v.sum())
+        self.assertEqual((ScalarInt64(1), ScalarInt64(5)), (v.min(), v.max()))
+        self.assertEqual(ScalarFloat64(2.8), v.avg())
+        self.assertAlmostEqual(np.std(v.value), v.dev().value)
+        self.assertEqual(ScalarInt64(2), VectorBool(True, False, True).sum())
+        self.assertEqual(ScalarFloat64(0.5), VectorFloat64(np.nan, 0.5).min())
+        self.assertEqual((ScalarInt64(0), None), (VectorInt64().sum(), VectorInt64().max()))
+        elapsed = VectorTimeDelta.from_integers([1, 2], unit='s')
+        self.assertEqual(ScalarTimedelta(np.timedelta64(3, 's')), ScalarTimedelta(elapsed.sum().value.astype('m8[s]')))
+        v.set_valid([True, True, True, True, False])
+        self.assertEqual((ScalarInt64(9), ScalarFloat64(2.25), ScalarInt64(4)), (v.sum(), v.avg(), v.max()))
+        self.assertRaises(PUCTypeError, VectorString('a').sum)
+        self.assertRaises(PUCTypeError, VectorDateTime.from_iso(['2020-01-01']).avg)
+
+    def test_scans(self):
+        v = VectorInt64(1, 4, 9, 16)
+        self.assertEqual([1, 5, 14, 30], list(v.sums().value))
+        self.assertEqual([1, 3, 5, 7], list(v.deltas().value))
+        self.assertEqual(list(v.value), list(v.deltas().sums().value))
+        self.assertEqual([1, 4, 36, 576], list(v.prds().value))
+        self.assertEqual([1, 5, 13, 25], list(v.msum(2).value))
+        self.assertEqual([1.0, 2.5, 6.5, 12.5], list(v.mavg(2).value))
+        self.assertEqual([1, 1, 2], list(VectorBool(True, False, True).sums().value))
+        times = VectorDateTime.from_iso(['2020-01-01T00:00:00', '2020-01-01T00:00:05'])
+        self.assertEqual(np.timedelta64(5, 's'), times.deltas().value[1])
+        v.set_valid([True, False, True, True])
+        self.assertEqual([1, 1, 10, 26], list(v.sums().value))
+        self.assertEqual([True, False, False, True], list(v.deltas().valid()))
+        self.assertEqual([1.0, 1.0, 9.0, 12.5], list(v.mavg(2).value))
+        self.assertRaises(PUCConstructionError, v.msum, 0)
+
+    def test_views(self):
+        s = Storage(np.arange(10, dtype=np.int64), chunk_size=3)
+        every_other = VectorInt64(storage=s, shape=[5], strides=[2])  # 0, 2, 4, 6, 8 across 3 blocks
+        self.assertEqual(3, len(every_other.segments()))
+        self.assertEqual(ScalarInt64(20), every_other.sum())
+        self.assertEqual(list(np.cumsum([0, 2, 4, 6, 8])), list(every_other.sums().value))
+        self.assertEqual([0, 2, 2, 2, 2], list(every_other.deltas().value))
+        self.assertEqual([0, 2, 6, 10, 14], list(every_other.msum(2).value))
+
+
+class TestMovingWindows(unittest.TestCase):
+    def naive(self, function, values, n):
+        return [function(values[max(0, i - n + 1):i + 1]) for i in range(len(values))]
+
+    def test_extremes(self):
+        values = np.random.RandomState(7).randint(-50, 50, size=40)
+        v = VectorInt64.from_numpy(values)
+        for n in (1, 3, 7, 40, 100):
+            self.assertEqual(self.naive(max, list(values), n), list(v.mmax(n).value))
+            self.assertEqual(self.naive(min, list(values), n), list(v.mmin(n).value))
+        self.assertEqual([1.5, 1.5, 2.5], list(VectorFloat64(1.5, -1.0, 2.5).mmax(2).value))
+        self.assertEqual([False, False, True], list(VectorBool(False, False, True).mmax(2).value))
+        v = VectorInt64(5, 1, 4, 2)
+        v.set_valid([True, False, False, True])
+        result = v.mmin(2)
+        self.assertEqual([True, True, False, True], list(result.valid()))
+        self.assertEqual([ScalarInt64(5), ScalarInt64(5), None, ScalarInt64(2)], [result[i] for i in range(4)])
+        self.assertRaises(PUCTypeError, VectorString('a').mmax, 2)
+
+    def test_time_windows(self):
+        times = VectorDateTime.from_iso(['2020-01-01T00:00:00', '2020-01-01T00:00:01', '2020-01-01T00:00:05',
+                                         '2020-01-01T00:00:06', '2020-01-01T00:00:06'])
+        v = VectorInt64(1, 2, 3, 4, 5)
+        width = np.timedelta64(2, 's')  # each window is the rows up to i in (t - 2s, t]
+        self.assertEqual([1, 3, 3, 7, 12], list(v.msum(width, times=times).value))
+        self.assertEqual([1, 2, 3, 4, 5], list(v.mmax(width, times=times).value))
+        self.assertEqual([1, 1, 3, 3, 3], list(v.mmin(width, times=times).value))
+        self.assertEqual([1.0, 1.5, 3.0, 3.5, 4.0], list(v.mavg(width, times=times).value))
+        backwards = VectorDateTime.from_iso(['2020-01-02', '2020-01-01', '2020-01-03', '2020-01-04', '2020-01-05'])
+        self.assertRaises(PUCConstructionError, v.msum, width, backwards)
+
+    def test_ewma(self):
+        v = VectorFloat64(1.0, 2.0, 3.0, 10.0, 4.0)
+        expected = [1.0]
+        for x in v.value[1:]:
+            expected.append(0.25 * x + 0.75 * expected[-1])
+        for actual, wanted in zip(v.ewma(0.25).value, expected):
+            self.assertAlmostEqual(wanted, actual)
+        long_series = VectorFloat64.from_numpy(np.random.RandomState(1).normal(size=1000))
+        previous = long_series.value[0]
+        for x in long_series.value[1:]:
+            previous = 0.1 * x + 0.9 * previous
+        self.assertAlmostEqual(previous, long_series.ewma(0.1).value[-1])
+        self.assertEqual(list(v.value), list(v.ewma(1).value))
+        v.set_valid([True, True, False, True, True])
+        self.assertAlmostEqual(0.25 * 2.0 + 0.75 * expected[1], v.ewma(0.25).value[2])  # the null repeats 2.0
+        self.assertRaises(PUCConstructionError, v.ewma, 0)
+        for leading in (VectorFloat64(0.0, 2.0, 3.0), VectorInt64(0, 2, 3)):
+            leading.set_valid([False, True, True])
+            result = leading.ewma(0.5)
+            self.assertEqual([False, True, True], list(result.valid()))
+            self.assertEqual([2.0, 2.5], list(result.value[1:]))
+
+    def test_ewma_alpha_near_1(self):
+        values = np.random.RandomState(2).normal(size=100000)
+        restart = np.zeros(values.size, dtype=bool)
+        restart[[0, 5, 50000]] = True
+        for alpha in (0.5, 0.99, 1 - 1e-13):
+            out = np.empty(values.size)
+            started = time.time()
+            _ewma(values, alpha, restart, out)
+            vectorized = time.time() - started
+            started = time.time()
+            expected = np.empty(values.size)
+            previous = 0.0
+            for j, x in enumerate(values):
+                previous = x if restart[j] else alpha * x + (1 - alpha) * previous
+                expected[j] = previous
+            self.assertLess(vectorized, time.time() - started)  # beats the Python loop it replaces
+            self.assertTrue(np.allclose(expected, out, rtol=1e-9, atol=1e-9))
+
+    def test_out(self):
+        v = VectorInt64(1, 2, 3, 4)
+        out = VectorInt64.from_numpy(np.zeros(4, dtype=np.int64))
+        self.assertTrue(v.msum(2, out=out) is out)
+        self.assertEqual([1, 3, 5, 7], list(out.value))
+        averages = VectorFloat64.from_numpy(np.zeros(4))
+        v.mavg(4, out=averages)
+        self.assertEqual([1.0, 1.5, 2.0, 2.5], list(averages.value))
+        self.assertRaises(PUCConstructionError, v.mavg, 2, None, out)
+        self.assertRaises(PUCConstructionError, v.msum, 2, None, VectorInt64(0, 0))
+
+
+def _sort_permutation(keys):
+    '''return int64 array with the positions of the rows in the order of the keys; ties keep their order
+
+    keys is a list of (Vector, descending), most significant first, all of the same length. A
+    null sorts before every element, so after them when descending, as in Q.
+
+    The keys are integers (see Vector._sort_key) except for floats. Consecutive integer keys
+    are packed into one, (k1 - min1) * span2 + (k2 - min2), while their spans multiply to at
+    most 2**63, so that ordering by (sym, time) is one stable argsort of one array, narrowed
+    to the fewest bytes that hold it. The packed keys are then sorted least significant first,
+    each sort stable, as a radix sort whose digits are the packed keys.
+    '''
+    n = len(keys[0][0]) if len(keys) > 0 else 0
+    flat = []  # the integer or float arrays to order by, most significant first
+    for vector, descending in keys:
+        if vector.validity is not None:
+            flat.append((vector.valid().view(np.uint8), descending))
+        flat.append((vector._sort_key(), descending))
+    digits = []
+    packed, packed_span = None, 1
+    for key, descending in flat:
+        if descending:
+            key = -key if key.dtype.kind == 'f' else ~key.astype(np.int64, copy=False)  # ~k is -k - 1: no overflow
+        span = 0 if n == 0 or key.dtype.kind == 'f' else int(key.max()) - int(key.min()) + 1
+        if packed is not None and 0 < span and packed_span * span <= 2 ** 63:
+            packed = packed * span + np.subtract(key, int(key.min()), dtype=np.int64)
+            packed_span *= span
+            continue
+        if packed is not None:
+            digits.append(_narrowed(packed, packed_span))
+            packed = None
+        if 0 < span <= 2 ** 63:
+            packed, packed_span = np.subtract(key, int(key.min()), dtype=np.int64), span
+        else:
+            digits.append(key)
+    if packed is not None:
+        digits.append(_narrowed(packed, packed_span))
+    order = np.arange(n, dtype=np.int64)
+    for i, digit in enumerate(reversed(digits)):
+        order = order[np.argsort(digit if i == 0 else digit[order], kind='mergesort')]
+    return order
+
+
+def _narrowed(key, span):
+    'return the non-negative integer array key, whose elements are less than span, in the narrowest unsigned dtype'
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if span <= np.iinfo(dtype).max + 1:
+            return key.astype(dtype)
+    return key
+
+
+class _Gather(object):
+    '''a column of a Table that is gathered from a Vector when it is first used
+
+    Table.orderedby holds its columns as these, so that only the columns that are used are
+    ever gathered (see Table.column).
+    '''
+    def __init__(self, vector, positions):
+        self.vector = vector
+        self.positions = positions
+
+    def __len__(self):
+        return self.positions.size
+
+    def gather(self):
+        'return new Vector with the elements of vector at positions'
+        result = self.vector._new(self.vector._gather(self.positions))
+        if self.vector.validity is not None:
+            result._set_valid(self.vector.valid()[self.positions])
+        return result
+
+
+class Table(PUC):
+    '''an ordered list of records, stored column-wise
+
+    Each column is a VectorX, and all columns have the same length. Construct a Table from
+    its columns, named by the names keyword or else by the column names,
+        Table(VectorInt64(10, 20, name='qty'), VectorFloat64(1.5, 2.5, name='price'))
+        Table(c1, c2, names=['qty', 'price'])
+    The Table holds views of the supplied Vectors, so that no elements are copied.
+
+    With capacity=N the Table is a rolling window: it copies the last N rows of each column
+    into a ring Storage of N elements, and append then overwrites the oldest rows in
+    O(len(other)), so its memory stays the same however many rows are appended. segments()
+    returns views of its rows in order, at most two Tables.
+
+    Indexing is like indexing a Matrix whose columns are selected by name:
+        t['qty'] is a column, t[['qty', 'price']] is a Table with those columns,
+        t[3] is a row as an OrderedDict, and t[rows, cols] combines both.
+    Row slices return views; VectorBool and VectorInt64 row indexes gather new columns.
+    '''
+    def __init__(self, *columns, **kwds):
+        names = kwds.get('names', None)
+        if names is None:
+            names = [
+                'c%d' % i if getattr(column, 'name', None) is None else column.name
+                for i, column in enumerate(columns)
+                ]
+        if len(names) != len(columns):
+            raise PUCConstructionError(names, msg='%s names for %s columns' % (len(names), len(columns)))
+        self._columns = collections.OrderedDict()
+        capacity = kwds.get('capacity', None)
+        for name, column in zip(names, columns):
+            if capacity is not None:
+                if not isinstance(column, Vector):
+                    raise PUCTypeError(column, (Vector,))
+                storage = Storage(column.value[max(0, len(column) - capacity):], kind=column.kind, ring=capacity)
+                column = Vector(storage=storage, name=column.name)
+            self._add_column(name, column)
+        self.name = kwds.get('name', None)
+
+    def _add_column(self, name, column):
+        'add or replace column name with a view of the Vector column'
+        if not isinstance(column, Vector):
+            raise PUCTypeError(column, (Vector,))
+        if not isinstance(name, str):
+            raise PUCTypeError(name, (str,))
+        others = [other for other_name, other in self._columns.items() if other_name != name]
+        if len(others) > 0 and len(column) != len(others[0]):
+            raise PUCConstructionError(column, msg='column %s has %s rows, not %s' % (name, len(column), len(others[0])))
+        view = column.copy()  # O(1): shares the storage
+        view.name = name
+        self._columns[name] = view
+
+    @classmethod
+    def _from_columns(cls, columns, name=None):
+        'return new Table holding the Vectors in the OrderedDict columns, without checking them'
+        result = cls.__new__(cls)
+        result._columns = columns
+        result.name = name
+        return result
+
+    def __repr__(self):
+        return 'Table(columns=[%s], rows=%s%s)' % (
+            ', '.join(
+                '%s: %s' % (name, (column.vector if isinstance(column, _Gather) else column).__class__.__name__)
+                for name, column in self._columns.items()
+                ),
+            len(self),
+            '' if self.name is None else ', name=%s' % self.name,
+            )
+
+    def __len__(self):
+        'number of rows'
+        for column in self._columns.values():
+            return len(column)
+        return 0
+
+    @property
+    def column_names(self):
+        return list(self._columns)
+
+    def column(self, name):
+        'return the Vector that is column name, gathering it first if it is not yet gathered'
+        if name not in self._columns:
+            raise PUCIndexError(name, msg='no column named %s; columns are %s' % (name, self.column_names))
+        column = self._columns[name]
+        if isinstance(column, _Gather):
+            column = self._columns[name] = column.gather()
+        return column
+
+    def select_columns(self, names):
+        'return new Table with the columns names, in that order; the columns are shared, not copied'
+        columns = collections.OrderedDict()
+        for name in names:
+            columns[name] = self.column(name)
+        return self._from_columns(columns, name=self.name)
+
+    def select_rows(self, index):
+        '''return new Table with the rows selected by index
+
+        A slice selects views of the columns (O(1) per column). A VectorBool, VectorInt64,
+        or list is checked once and then gathers each column with one numpy operation.
+        '''
+        index_value = _check_index(index, len(self))
+        if isinstance(index_value, int):
+            index_value = slice(index_value, index_value + 1, 1)
+        columns = collections.OrderedDict()
+        for name in self.column_names:
+            column = self.column(name)
+            if isinstance(index_value, slice):
+                columns[name] = column[index_value]
+            else:
+                columns[name] = column._new(column._gather(index_value))
+                if column.validity is not None:
+                    columns[name]._set_valid(column.valid()[index_value])
+        return self._from_columns(columns, name=self.name)
+
+    def sort_positions(self, names):
+        '''return VectorInt64 with the positions of the rows in the order of the columns names
+
+        Each of names is a column name, optionally followed by asc or desc, as in select's
+        ordered by; earlier columns are more significant and ties keep their order. Nulls sort
+        first. One permutation is computed for all the columns (see _sort_permutation).
+        '''
+        keys = []
+        for item in names:
+            words = item.split()
+            if len(words) not in (1, 2) or len(words) == 2 and words[1].lower() not in ('asc', 'desc'):
+                raise PUCQueryError(item, msg='%r is not a column name, optionally followed by asc or desc' % item)
+            keys.append((self.column(words[0]), len(words) == 2 and words[1].lower() == 'desc'))
+        return VectorInt64._wrap(_sort_permutation(keys))
+
+    def orderedby(self, names):
+        '''return new Table with the rows of self in the order of the columns names; see sort_positions
+
+        As Q's xasc and xdesc. Only the permutation is computed here: each column is gathered
+        when it is first used, so columns that are never read are never copied, and ordering an
+        ordered Table composes the permutations instead of gathering.
+        '''
+        positions = self.sort_positions(names).value
+        columns = collections.OrderedDict()
+        for name, column in self._columns.items():
+            if isinstance(column, _Gather):
+                columns[name] = _Gather(column.vector, column.positions[positions])
+            else:
+                columns[name] = _Gather(column, positions)
+        return self._from_columns(columns, name=self.name)
+
+    def arrange(self, names):
+        'return new Table with the rows of self in the order of the columns names, as dplyr arrange; see orderedby'
+        return self.orderedby(names)
+
+    def rename(self, old_new_names):
+        '''return new Table selectively updating column names
+
+        ARGS
+        old_new_names = ((old_name,new_name), ...)
+        '''
+        new_names = dict(old_new_names)
+        for old_name in new_names:
+            self.column(old_name)
+        return Table(*[self.column(name) for name in self.column_names],
+                     names=[new_names.get(name, name) for name in self.column_names],
+                     name=self.name)
+
+    def _row(self, position):
+        'return row at position as an OrderedDict of column name -> Scalar'
+        row = collections.OrderedDict()
+        for name in self.column_names:
+            row[name] = self.column(name)[position]
+        return row
+
+    def __getitem__(self, index):
+        'return a column, a Table, a row, or a Scalar, as described in the class docstring'
+        if isinstance(index, str):
+            return self.column(index)
+        if isinstance(index, list) and len(index) > 0 and all(isinstance(item, str) for item in index):
+            return self.select_columns(index)
+        if isinstance(index, tuple):
+            if len(index) != 2:
+                raise PUCIndexError(index, msg='a Table index has 2 components, not %s' % len(index))
+            rows, cols = index
+            if isinstance(cols, str):
+                return self.column(cols)[rows]
+            if isinstance(cols, slice) and cols == slice(None):
+                return self[rows]
+            return self.select_columns(cols)[rows]
+        index_value = _check_index(index, len(self))
+        if isinstance(index_value, int):
+            return self._row(index_value)
+        return self.select_rows(index)
+
+    def __setitem__(self, name, column):
+        'add or replace the column name'
+        self._add_column(name, column)
+
+    def groupby(self, by):
+        'return a _Grouping of the rows by the values of the columns named in the list by'
+        for name in by:
+            self.column(name)
+        return _Grouping(self, by)
+
+    def summarize(self, by, aggregations):
+        '''return new Table with one row per group of the columns by, holding the aggregations
+
+        ARGS
+        by: a list of column names; the groups are in order of first appearance
+        aggregations: a list of (output column name, function, input column name), where the
+              function is 'sum', 'count', 'min', 'max', 'mean', 'first', or 'last' (vectorized), or
+              a callable that is applied to a Vector of each group's elements (a slow fallback)
+        '''
+        return self.groupby(by).summarize(aggregations)
+
+    def ply(self, vars, fun, extra=None, processes=None):
+        '''apply fun to groups defined by vars
+
+        Inspired by the plyr package in R
+
+        ARGS
+        vars: a list of strings, each string is a column name in self
+        fun(group, extra):  a function of a Table with the rows of one group, returning a Table
+              with the same columns for each invocation
+        processes: if more than 1, the number of worker processes that the groups are spread
+              across; then fun and extra must be picklable (see _map_groups)
+
+        RETURNS
+        new Table with one column for each var plus the columns of the Tables returned by the
+        calls to fun, with one row for each of their rows
+        '''
+        grouping = self.groupby(vars)
+        results = _map_groups(grouping, fun, extra, processes)
+        for result in results:
+            if not isinstance(result, Table):
+                raise PUCTypeError(result, (Table,))
+        return _ply_result(grouping, results)
+
+    def mutate(self, vars, fun, extra=None, processes=None):
+        '''like ply, but mutate self by adding the columns of the Tables returned by fun
+
+        Each call fun(group, extra) must return a Table with one row per row of the group.
+        '''
+        grouping = self.groupby(vars)
+        order, starts = grouping._sorted()
+        sizes = np.diff(np.append(starts, order.size))
+        results = _map_groups(grouping, fun, extra, processes)
+        for result, size in zip(results, sizes):
+            if not isinstance(result, Table):
+                raise PUCTypeError(result, (Table,))
+            if len(result) != size:
+                raise PUCConstructionError(result, msg='fun returned %s rows for a group of %s' % (len(result), size))
+        _mutate_result(self, order, results)
+
+    moving_functions = {'msum': 'sum', 'mavg': 'avg', 'mmax': 'max', 'mmin': 'min', 'ewma': 'ewma'}
+
+    def moving(self, output_name, function, name, window, times=None, by=None):
+        '''mutate self by adding the column output_name, the moving function of the column name
+
+        function is one of Table.moving_functions, each as the Vector method (see Vector.msum);
+        window is the number of rows, alpha for ewma, or a timedelta when times names a column
+        that orders the rows in time. With by, a list of column names, each group has its own
+        windows, as Q's update mavg[n; x] by sym from t. The groups are not processed one by
+        one: the rows are gathered into group order once, the windows are clipped at the group
+        starts (for times, by one merged sort; see _time_window_starts), and the functions run
+        over all the rows at once.
+        '''
+        if function not in Table.moving_functions:
+            raise PUCQueryError(function, msg='moving function %s is not one of %s' % (function, sorted(Table.moving_functions)))
+        column = self.column(name)
+        time_column = None if times is None else self.column(times)
+        if by is None:
+            if function == 'ewma':
+                result = column.ewma(window)
+            else:
+                result = getattr(column, function)(window, times=time_column)
+        else:
+            order, group_starts = self.groupby(by)._sorted()
+            ordered = column._take(order)
+            if function == 'ewma':
+                starts, parameter = group_starts, window
+            elif times is None:
+                sizes = np.diff(np.append(group_starts, order.size))
+                starts, parameter = np.maximum(ordered._window_starts(window, None), np.repeat(group_starts, sizes)), None
+            else:
+                starts = _time_window_starts(time_column._gather(order), _operand_value(window), group_starts)
+                parameter = None
+            result_ordered = ordered._moving(Table.moving_functions[function], starts, parameter, None)
+            result = result_ordered._new(np.empty_like(result_ordered.value))
+            result.value[order] = result_ordered.value
+            if result_ordered.validity is not None:
+                valid = np.empty(order.size, dtype=bool)
+                valid[order] = result_ordered.valid()
+                result._set_valid(valid)
+        self._add_column(output_name, result)
+
+    def bars(self, time_name, interval, by=None, price='price', size='size'):
+        '''return new Table of the open, high, low, and close price and the volume in each interval
+
+        As Q's select open:first price, high:max price, low:min price, close:last price,
+        volume:sum size by sym, interval xbar time from t. The result has the by columns, then
+        the column time_name with the start of each bar (see Vector.xbar), then open, high, low,
+        close, and volume, which is left out when size is None. Rows with a null time, price, or
+        size are skipped.
+
+        The rows are expected to be in time order, as trades are: they are then put into bar order
+        by one stable sort on the groups (none without by), a bar starts wherever the group or
+        the interval changes, and every bar is reduced at once with numpy reduceat.
+        '''
+        names = [time_name, price] + ([] if size is None else [size])
+        columns = [self.column(name) for name in names]
+        columns[1]._check_kind(('int64', 'float64'))
+        if size is not None:
+            columns[2]._check_kind(('int64', 'float64'))
+        by = [] if by is None else by
+        for name in by:
+            if name in (time_name, 'open', 'high', 'low', 'close', 'volume'):
+                raise PUCQueryError(name, msg='column %s is both a group key and a result' % name)
+        buckets = columns[0].xbar(interval)
+        if len(by) > 0:
+            grouping = self.groupby(by)
+            order, _ = grouping._sorted()
+            codes = grouping.codes
+        else:
+            order = np.arange(len(self), dtype=np.int64)
+            codes = np.zeros(len(self), dtype=np.int64)
+        valid = np.ones(len(self), dtype=bool)
+        for column in columns:
+            if column.validity is not None:
+                valid &= column.valid()
+        order = order[valid[order]]
+        times = columns[0].value[order]
+        if times.dtype.kind in 'mM':
+            times = times.view(np.int64)
+        in_group = codes[order][1:] == codes[order][:-1]
+        if np.any(in_group & (times[1:] < times[:-1])):
+            order = order[np.lexsort((times, codes[order]))]
+        codes = codes[order]
+        keys = buckets.value[order]
+        starts = np.flatnonzero(np.concatenate(([order.size > 0], (codes[1:] != codes[:-1]) | (keys[1:] != keys[:-1]))))
+        ends = np.append(starts[1:], order.size)[:starts.size].astype(np.int64)
+        result = collections.OrderedDict()
+        for name in by + [time_name]:
+            column = buckets if name == time_name else self.column(name)
+            result[name] = column._new(column.value[order[starts]])
+            if column.validity is not None:
+                result[name]._set_valid(column.valid()[order[starts]])
+        prices = columns[1].value[order]
+        empty = starts.size == 0
+        result['open'] = columns[1]._new(prices[starts])
+        result['high'] = columns[1]._new(prices[0:0] if empty else np.maximum.reduceat(prices, starts))
+        result['low'] = columns[1]._new(prices[0:0] if empty else np.minimum.reduceat(prices, starts))
+        result['close'] = columns[1]._new(prices[ends - 1])
+        if size is not None:
+            sizes = columns[2].value[order]
+            result['volume'] = columns[2]._new(sizes[0:0] if empty else np.add.reduceat(sizes, starts))
+        for name, column in result.items():
+            column.name = name
+        return Table._from_columns(result, name=self.name)
+
+    def select(self, query=None, **kwds):
+        '''return new Table selected by a select statement or by the equivalent keywords
+
+            t.select('select sym, price where price > 10 and size >= 100 ordered by price desc first 5')
+            t.select(columns=['sym', 'price'], where='price > 10 and size >= 100',
+                     orderedby=['price desc'], first=5)
+
+        The statement is compiled once and cached; see compile_select. The where keyword may
+        also be a VectorBool that selects the rows.
+        '''
+        if query is not None:
+            if len(kwds) > 0:
+                raise PUCQueryError(kwds, msg='supply a select statement or keywords, not both')
+            return compile_select(query).execute(self)
+        table = self
+        where = kwds.get('where', None)
+        if isinstance(where, VectorBool):
+            table = self.select_rows(where)
+            where = None
+        clauses = (
+            ('columns', 'select %s', ', '.join),
+            ('where', 'where %s', str),
+            ('groupby', 'group by %s', ', '.join),
+            ('having', 'having %s', str),
+            ('orderedby', 'ordered by %s', ', '.join),
+            ('first', 'first %d', int),
+            )
+        unknown = set(kwds) - set(keyword for keyword, _, _ in clauses)
+        if len(unknown) > 0:
+            raise PUCQueryError(kwds, msg='unknown select keywords %s' % sorted(unknown))
+        kwds = dict(kwds, where=where)
+        text = ' '.join(
+            template % convert(kwds[keyword])
+            for keyword, template, convert in clauses
+            if kwds.get(keyword, None) is not None
+            )
+        return compile_select(text).execute(table)
+
+    def append(self, other):
+        '''mutate self by appending the rows of the Table other, which has the same column names and kinds
+
+        Each column is extended in place (see Vector.extend), in amortized O(len(other)). Tables
+        and Vectors that share the columns keep their rows.
+        '''
+        self._check_same_columns(other)
+        for name in self.column_names:
+            column = self.column(name).copy()  # a new view, so that Tables sharing the column keep its length
+            column.extend(other.column(name))
+            self._columns[name] = column
+
+    def segments(self):
+        '''return list of Tables that view the rows of self in order, without copying them
+
+        Each column of each Table is one segment of its storage (see Vector.segments), so a
+        Table with capacity has at most two of them.
+        '''
+        bounds = set([0, len(self)])
+        for column in [self.column(name) for name in self.column_names]:
+            bounds.update(np.cumsum([segment.size for segment in column.segments()]).tolist())
+        bounds = sorted(bounds)
+        return [self.select_rows(slice(start, stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop]
+
+    def _check_same_columns(self, other):
+        'raise PUCTypeError unless other is a Table with the same column names and kinds as self'
+        if not isinstance(other, Table):
+            raise PUCTypeError(other, (Table,))
+        if other.column_names != self.column_names:
+            msg = 'columns %s are not the columns %s' % (other.column_names, self.column_names)
+            raise PUCConstructionError(other, msg=msg)
+        for name in self.column_names:
+            if type(other.column(name)) != type(self.column(name)):
+                raise PUCTypeError(other.column(name), (type(self.column(name)),))
+
+
+class TestTable(unittest.TestCase):
+    def make_table(self):
+        return Table(
+            VectorInt64(10, 20, 30, name='qty'),
+            VectorFloat64(1.5, 2.5, 3.5),
+            names=['qty', 'price'],
+            )
+
+    def test_init(self):
+        t = self.make_table()
+        self.assertEqual(['qty', 'price'], t.column_names)
+        self.assertEqual(3, len(t))
+        self.assertEqual('price', t['price'].name)
+        self.assertEqual(['c0', 'c1'], Table(VectorInt64(1), VectorBool(True)).column_names)
+        self.assertEqual(['a'], Table(VectorInt64(1, name='a')).column_names)
+        self.assertEqual(0, len(Table()))
+        self.assertRaises(PUCConstructionError, Table, VectorInt64(1), VectorInt64(1, 2))
+        self.assertRaises(PUCConstructionError, Table, VectorInt64(1), names=['a', 'b'])
+        self.assertRaises(PUCTypeError, Table, [1, 2])
+
+    def test_columns_are_views(self):
+        qty = VectorInt64(10, 20, 30)
+        t = Table(qty, names=['qty'])
+        self.assertTrue(t['qty'].storage is qty.storage)
+        t['qty'][0] = 11
+        self.assertEqual(ScalarInt64(11), qty[0])
+
+    def test_select_columns(self):
+        t = self.make_table()
+        p = t.select_columns(['price'])
+        self.assertEqual(['price'], p.column_names)
+        self.assertTrue(p['price'] is t['price'])
+        self.assertEqual(['price', 'qty'], t[['price', 'qty']].column_names)
+        self.assertRaises(PUCIndexError, t.select_columns, ['volume'])
+
+    def test_select_rows(self):
+        t = self.make_table()
+        window = t.select_rows(slice(1, 3))
+        self.assertEqual(2, len(window))
+        self.assertTrue(window['qty'].storage is t['qty'].storage)  # a view
+        self.assertEqual([20, 30], list(window['qty'].value))
+        masked = t[VectorBool(True, False, True)]
+        self.assertEqual([1.5, 3.5], list(masked['price'].value))
+        gathered = t[[2, 2]]
+        self.assertEqual([30, 30], list(gathered['qty'].value))
+        self.assertEqual(1, len(t.select_rows(0)))
+
+    def test_getitem(self):
+        t = self.make_table()
+        row = t[1]
+        self.assertEqual(['qty', 'price'], list(row))
+        self.assertEqual(ScalarInt64(20), row['qty'])
+        self.assertEqual(ScalarFloat64(3.5), t[2, 'price'])
+        self.assertEqual([10, 20], list(t[0:2, 'qty'].value))
+        self.assertEqual(['qty'], t[0:2, ['qty']].column_names)
+        self.assertEqual(2, len(t[1:, :]))
+        self.assertRaises(PUCIndexError, t.__getitem__, 3)
+        self.assertRaises(PUCIndexError, t.__getitem__, (0, 'qty', 0))
+
+    def test_setitem_rename(self):
+        t = self.make_table()
+        t['flag'] = VectorBool(True, False, True)
+        self.assertEqual(['qty', 'price', 'flag'], t.column_names)
+        self.assertRaises(PUCConstructionError, t.__setitem__, 'flag', VectorBool(True))
+        r = t.rename((('qty', 'quantity'),))
+        self.assertEqual(['quantity', 'price', 'flag'], r.column_names)
+        self.assertEqual(['qty', 'price', 'flag'], t.column_names)
+        self.assertRaises(PUCIndexError, t.rename, (('volume', 'v'),))
+
+    def test_append(self):
+        t = self.make_table()
+        t.append(self.make_table())
+        self.assertEqual(6, len(t))
+        self.assertEqual([10, 20, 30, 10, 20, 30], list(t['qty'].value))
+        shared = t.select_columns(['qty', 'price'])
+        batch = self.make_table()
+        for _ in range(100):
+            t.append(batch)
+        self.assertEqual(306, len(t))
+        self.assertEqual(6, len(shared))  # shares the columns, keeps its rows
+        self.assertEqual(512, t['qty'].storage.capacity)
+        self.assertRaises(PUCConstructionError, t.append, t.select_columns(['qty']))
+        self.assertRaises(PUCTypeError, t.append, Table(VectorInt64(1), VectorInt64(2), names=['qty', 'price']))
+
+    def test_orderedby(self):
+        t = Table(
+            VectorString('b', 'a', 'b', 'a', 'c'),
+            VectorDateTime.from_integers([5, 3, 1, 4, 2], unit='s'),
+            VectorFloat64(1.5, -2.0, 0.5, 3.0, 2.5),
+            VectorBool(True, False, False, True, True),
+            names=['sym', 'time', 'price', 'flag'],
+            )
+        VectorString('zzz', 'aaa')  # interned after 'b', so codes do not order like the strings
+        r = t.orderedby(['sym', 'time'])
+        self.assertTrue(isinstance(r._columns['price'], _Gather))  # not gathered until used
+        self.assertEqual(['a', 'a', 'b', 'b', 'c'], list(r['sym'].decode()))
+        self.assertEqual([3.0, 4.0, 1.0, 5.0, 2.0], list(r['time'].value.astype('M8[s]').astype(np.float64)))
+        self.assertTrue(isinstance(r._columns['price'], _Gather))
+        self.assertEqual([-2.0, 3.0, 0.5, 1.5, 2.5], list(r['price'].value))
+        self.assertEqual([4, 0, 2, 3, 1], list(t.sort_positions(['sym desc', 'price desc']).value))
+        self.assertEqual([1, 2, 0, 4, 3], list(t.sort_positions(['flag', 'price asc']).value))
+        self.assertEqual([3, 4, 0, 2, 1], list(t.sort_positions(['flag DESC', 'price desc']).value))
+        self.assertEqual(list(r['price'].value), list(t.arrange(['sym', 'time'])['price'].value))
+        again = r.orderedby(['price desc'])  # composes the permutations
+        self.assertTrue(again._columns['flag'].vector is t._columns['flag'])
+        self.assertEqual(['a', 'c', 'b', 'b', 'a'], list(again['sym'].decode()))
+        t['price'].set_valid([True, False, True, True, True])
+        self.assertEqual([1, 2, 0, 4, 3], list(t.sort_positions(['price']).value))
+        self.assertEqual([3, 4, 0, 2, 1], list(t.sort_positions(['price desc']).value))
+        self.assertEqual(None, t.orderedby(['price'])['price'][0])
+        self.assertEqual(0, len(t.select_rows(VectorInt64()).orderedby(['sym', 'time'])))
+        self.assertRaises(PUCQueryError, t.orderedby, ['sym up'])
+        self.assertRaises(PUCIndexError, t.orderedby, ['volume'])
+
+    def test_sort_permutation(self):
+        random = np.random.RandomState(3)
+        n = 1000
+        syms = VectorInt64.from_numpy(random.randint(0, 20, size=n))
+        times = VectorInt64.from_numpy(random.randint(-2 ** 62, 2 ** 62, size=n))  # too wide to pack with syms
+        small = VectorInt64.from_numpy(random.randint(0, 3, size=n))
+        prices = VectorFloat64.from_numpy(random.normal(size=n).round(1))
+        expected = np.lexsort((np.arange(n), -prices.value, small.value, syms.value))
+        keys = [(syms, False), (small, False), (prices, True)]
+        self.assertEqual(list(expected), list(_sort_permutation(keys)))
+        expected = np.lexsort((np.arange(n), times.value, -small.value, syms.value))
+        self.assertEqual(list(expected), list(_sort_permutation([(syms, False), (small, True), (times, False)])))
+        extremes = VectorInt64(np.iinfo(np.int64).max, np.iinfo(np.int64).min, 0)
+        self.assertEqual([1, 2, 0], list(_sort_permutation([(extremes, False)])))
+        self.assertEqual([0, 2, 1], list(_sort_permutation([(extremes, True)])))
+        self.assertEqual(np.uint8, _narrowed(np.array([0, 255]), 256).dtype)
+        self.assertEqual(np.uint16, _narrowed(np.array([0, 256]), 257).dtype)
+
+
+def _hash_keys(values):
+    '''return (hashes, comparable) for the 1D numpy.array values
+
+    hashes is a uint64 array. comparable is an array whose elements are equal exactly
+    when the keys are equal: the bits of numeric keys (with -0.0 and NaN made canonical),
+    or the keys themselves for object keys, which are hashed by Python.
+    '''
+    if values.dtype.hasobject:
+        hashes = np.fromiter((hash(value) for value in values), dtype=np.int64, count=values.size)
+        return hashes.view(np.uint64), values
+    if values.dtype.kind == 'f':
+        values = np.where(values == 0, 0.0, values)
+        values[np.isnan(values)] = np.nan
+    if values.dtype.itemsize == 8:
+        comparable = values.view(np.uint64)
+    else:
+        comparable = values.astype(np.uint64)
+    return _mix_bits(comparable), comparable
+
+
+def _mix_bits(x):
+    'return the splitmix64 finalizer of the uint64 array x'
+    with np.errstate(over='ignore'):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xbf58476d1ce4e5b9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94d049bb133111eb)
+        return x ^ (x >> np.uint64(31))
+
+
+class _HashIndex(object):
+    '''open-addressing hash index from keys to their positions
+
+    The table has a power-of-two number of slots, each holding the position of a key or -1.
+    Collisions are resolved by linear probing. Inserting and probing are vectorized: every
+    round advances all the unresolved keys by one slot, so the number of Python-level
+    iterations is the longest probe sequence, not the number of keys. When a key occurs
+    more than once, the index holds its first position, and firsts() gives it for every position.
+    The arrays with an element per key have spare capacity, doubled when full as in Storage, so
+    inserting a few keys into a large index is amortized O(number inserted).
+    '''
+    def __init__(self, keys):
+        'index the 1D numpy.array keys, which have positions 0, 1, ...'
+        self._n = 0
+        self._comparable = _hash_keys(keys[0:0])[1]
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._firsts = np.zeros(0, dtype=np.int64)
+        self._slots = np.full(8, -1, dtype=np.int64)
+        self.insert(keys)
+
+    def __len__(self):
+        'number of keys seen, including duplicates'
+        return self._n
+
+    def insert(self, keys):
+        'index the 1D numpy.array keys, which have positions len(self), len(self) + 1, ...'
+        hashes, comparable = _hash_keys(keys)
+        first_position = self._n
+        self._n += keys.size
+        if self._n > self._hashes.size:
+            capacity = max(self._n, 2 * self._hashes.size)
+            self._comparable = _with_capacity(self._comparable, first_position, capacity, comparable.dtype)
+            self._hashes = _with_capacity(self._hashes, first_position, capacity, np.uint64)
+            self._firsts = _with_capacity(self._firsts, first_position, capacity, np.int64)
+        self._comparable[first_position:self._n] = comparable
+        self._hashes[first_position:self._n] = hashes
+        self._firsts[first_position:self._n] = np.arange(first_position, self._n)
+        if 2 * self._n > self._slots.size:
+            self._rehash()
+        else:
+            self._insert_positions(np.arange(first_position, self._n))
+
+    def _rehash(self):
+        'grow the table so that it is at most half full, and reinsert every key'
+        size = self._slots.size
+        while 2 * self._n > size:
+            size *= 2
+        self._slots = np.full(size, -1, dtype=np.int64)
+        self._insert_positions(np.arange(self._n))
+
+    def _insert_positions(self, pending):
+        'insert the keys at the positions pending, which are increasing'
+        mask = np.uint64(self._slots.size - 1)
+        slot = (self._hashes[pending] & mask).astype(np.int64)
+        while pending.size > 0:
+            occupant = self._slots[slot]
+            empty = occupant == -1
+            # a key equal to the occupant is a duplicate: the occupant has an earlier position
+            duplicate = ~empty
+            duplicate[duplicate] = self._comparable[occupant[duplicate]] == self._comparable[pending[duplicate]]
+            self._firsts[pending[duplicate]] = occupant[duplicate]
+            # the first pending key for each empty slot takes it; the others retry the same slot
+            empty_slots = slot[empty]
+            claimed, first = np.unique(empty_slots, return_index=True)
+            self._slots[claimed] = pending[empty][first]
+            inserted = np.zeros(pending.size, dtype=bool)
+            inserted[np.flatnonzero(empty)[first]] = True
+            advance = ~empty & ~duplicate
+            slot = np.where(advance, (slot + 1) & (self._slots.size - 1), slot)
+            keep = ~inserted & ~duplicate
+            pending, slot = pending[keep], slot[keep]
+
+    def firsts(self):
+        'return int64 array with the first position of the key at each position, found while inserting it'
+        return self._firsts[:self._n]
+
+    def lookup(self, keys):
+        'return int64 array with the first position of each of the keys, or -1 if absent'
+        hashes, comparable = _hash_keys(keys)
+        result = np.full(keys.size, -1, dtype=np.int64)
+        active = np.arange(keys.size)
+        slot = (hashes & np.uint64(self._slots.size - 1)).astype(np.int64)
+        while active.size > 0:
+            occupant = self._slots[slot]
+            occupied = occupant != -1
+            found = occupied.copy()
+            found[occupied] = self._comparable[occupant[occupied]] == comparable[active[occupied]]
+            result[active[found]] = occupant[found]
+            keep = occupied & ~found
+            active, slot = active[keep], (slot[keep] + 1) & (self._slots.size - 1)
+        return result
+
+
+def _with_capacity(array, n, capacity, dtype):
+    'return new numpy.array of capacity elements whose first n are those of array, of the type of both array and dtype'
+    result = np.empty(capacity, dtype=np.promote_types(array.dtype, dtype))
+    result[:n] = array[:n]
+    return result
+
+
+def _first_occurrences(values):
+    'return the positions of the first occurrence of each distinct element of the 1D numpy.array values, in order'
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(_HashIndex(values).firsts() == np.arange(values.size))
+
+
+class Dictionary(PUC):
+    '''maps keys to values, where the keys and the values are parallel Vectors
+
+    A hash index on the keys is built once, so that d[v] for a Vector v of keys is one
+    vectorized probe. As in Q, keys need not be unique (the first one wins), and a lookup
+    that misses yields None for a scalar key and a null (see Vector.set_valid) for a Vector
+    of keys. The Dictionary holds copies of the keys and values it is constructed from.
+        d = Dictionary(VectorInt64(1, 2, 3), VectorFloat64(10.0, 20.0, 30.0))
+        d[2]                   # ScalarFloat64(20.0)
+        d[VectorInt64(3, 4)]   # VectorFloat64(30.0, nan)
+        d[VectorInt64(4, 1)] = 0.0  # updates key 1, adds key 4
+    '''
+    def __init__(self, keys=None, values=None, name=None):
+        if (keys is None) != (values is None):
+            raise PUCConstructionError(keys, msg='supply both keys and values, or neither')
+        if keys is not None:
+            for vector in (keys, values):
+                if not isinstance(vector, Vector):
+                    raise PUCTypeError(vector, (Vector,))
+            if len(keys) != len(values):
+                msg = '%s keys but %s values' % (len(keys), len(values))
+                raise PUCConstructionError(values, msg=msg)
+            self._set(keys.deepcopy(), values.deepcopy())  # d[k] = x does not change the caller's Vectors
+        else:
+            self._keys, self._values, self._index = None, None, None
+        self.name = name
+
+    def _set(self, keys, values):
+        self._keys = keys
+        self._values = values
+        # keys with an attribute are looked up through it (see Vector.set_attribute)
+        self._index = None if keys.attribute is not None else _HashIndex(keys.value)
+
+    def _lookup(self, array):
+        'return int64 array with the first position of each key in the numpy.array array, or -1'
+        return self._keys._lookup(array) if self._index is None else self._index.lookup(array)
+
+    def __repr__(self):
+        return 'Dictionary(keys=%s, values=%s%s)' % (
+            self._keys,
+            self._values,
+            '' if self.name is None else ', name=%s' % self.name,
+            )
+
+    def __len__(self):
+        return 0 if self._keys is None else len(self._keys)
+
+    def keys(self):
+        'return Vector of keys'
+        return self._keys
+
+    def values(self):
+        'return Vector of values'
+        return self._values
+
+    def _key_array(self, key):
+        'return (numpy.array of keys, True if key is a scalar)'
+        if isinstance(key, Vector):
+            if self._keys is not None and type(key) != type(self._keys):
+                raise PUCTypeError(key, (type(self._keys),))
+            return key.value, False
+        if isinstance(key, list):
+            array = np.array(key)
+            scalar = False
+        else:
+            array = np.array([key.value if isinstance(key, Scalar) else key])
+            scalar = True
+        if self._keys is not None:
+            array = self._keys._coerce(array, key)
+        return array, scalar
+
+    def _positions(self, key):
+        'return (positions of the keys in key or -1, True if key is a scalar)'
+        array, scalar = self._key_array(key)
+        if self._keys is None:
+            return np.full(array.size, -1, dtype=np.int64), scalar
+        return self._lookup(array), scalar
+
+    def __getitem__(self, key):
+        '''return Scalar or None if key is a scalar; otherwise a Vector of the same length as key
+
+        ARGS
+        key : a Scalar or python scalar, or a Vector or list of keys
+        '''
+        positions, scalar = self._positions(key)
+        if scalar:
+            return None if positions[0] == -1 else self._values[int(positions[0])]
+        if self._values is None:
+            raise PUCIndexError(key, msg='lookup of keys in an empty Dictionary')
+        return self._values._take(positions)
+
+    def __setitem__(self, key, value):
+        '''mutate self: set the value of existing keys and append new keys
+
+        A scalar value is replicated; a Vector value supplies one element per key.
+        '''
+        array, scalar = self._key_array(key)
+        if self._keys is None:
+            if not isinstance(value, Vector):
+                raise PUCTypeError(value, (Vector,))  # cannot infer the kind of the values
+            if isinstance(key, Vector):
+                keys = key._new(array[0:0].copy())
+            else:
+                keys = _VECTOR_CLASSES[Storage._kind_of(array)]._wrap(array[0:0].copy())
+            self._set(keys, value._new(value.value[0:0].copy()))
+            array, scalar = self._key_array(key)  # as elements of the keys
+        positions = self._lookup(array)
+        missing = positions == -1
+        if missing.any():
+            new_keys = array[missing][_first_occurrences(array[missing])]
+            new_values = np.full(new_keys.size, self._values.null_value, dtype=self._values.dtype)
+            self._keys.extend(new_keys)
+            self._values.extend(new_values)
+            if self._index is not None:
+                self._index.insert(new_keys)
+            elif self._keys.attribute is None:
+                self._index = _HashIndex(self._keys.value)  # the new keys broke the attribute
+            positions = self._lookup(array)
+        self._values[VectorInt64._wrap(positions)] = value
+
+    def find(self, value):
+        'reverse lookup: return the first key whose value is value, or None'
+        if self._values is None:
+            return None
+        value = value.value if isinstance(value, Scalar) else value
+        value = self._values._coerce(np.array([value]), value)
+        if self._values.attribute is not None:
+            position = self._values._lookup(value)[0]
+            return None if position == -1 else self._keys[int(position)]
+        positions = np.flatnonzero(self._values.value == value[0])
+        return None if positions.size == 0 else self._keys[int(positions[0])]
+
+
+class TestDictionary(unittest.TestCase):
+    def test_hash_index(self):
+        keys = np.array([5, 7, 5, -1, 2 ** 40], dtype=np.int64)
+        index = _HashIndex(keys)
+        self.assertEqual([0, 1, 3, 4, -1], list(index.lookup(np.array([5, 7, -1, 2 ** 40, 6]))))
+        index.insert(np.arange(100, 200, dtype=np.int64))  # forces a rehash
+        self.assertEqual([0, 5, 104], list(index.lookup(np.array([5, 100, 199]))))
+        self.assertEqual([0, 1, 0, 3, 4, 5], list(index.firsts()[:6]))  # kept through the rehash
+        capacities = set()
+        for key in range(1000, 1300):
+            index.insert(np.array([key, 5], dtype=np.int64))
+            capacities.add(index._hashes.size)
+        self.assertEqual([210, 420, 840], sorted(capacities))  # doubled, not reallocated per insert
+        self.assertEqual([105, 0, -1], list(index.lookup(np.array([1000, 5, 1300]))))
+        self.assertEqual([105, 0], list(index.firsts()[[105, 106]]))
+        floats = _HashIndex(np.array([0.0, np.nan, 1.5]))
+        self.assertEqual([0, 1, 2], list(floats.lookup(np.array([-0.0, np.nan, 1.5]))))
+        objects = _HashIndex(np.array(['a', 'b', 'a'], dtype=object))
+        self.assertEqual([1, 0, -1], list(objects.lookup(np.array(['b', 'a', 'c'], dtype=object))))
+        self.assertEqual([0, 2], list(_first_occurrences(np.array([3, 3, 4, 3]))))
+
+    def test_getitem(self):
+        d = Dictionary(VectorInt64(1, 2, 3, 2), VectorFloat64(10.0, 20.0, 30.0, 40.0))
+        self.assertEqual(4, len(d))
+        self.assertEqual(ScalarFloat64(20.0), d[2])  # first key wins
+        self.assertEqual(ScalarFloat64(30.0), d[ScalarInt64(3)])
+        self.assertTrue(d[4] is None)
+        r = d[VectorInt64(3, 4, 1)]
+        self.assertTrue(isinstance(r, VectorFloat64))
+        self.assertEqual(30.0, r.value[0])
+        self.assertTrue(np.isnan(r.value[1]))
+        self.assertEqual(10.0, r.value[2])
+        self.assertEqual([20.0, 20.0], list(d[[2, 2]].value))
+        self.assertEqual(VectorInt64.null_value, Dictionary(VectorBool(True), VectorInt64(7))[VectorBool(False)].value[0])
+        self.assertRaises(PUCTypeError, d.__getitem__, VectorFloat64(1.0))
+        self.assertRaises(PUCTypeError, d.__getitem__, 1.5)
+
+    def test_large_lookup(self):
+        keys = np.arange(0, 3 * 10000, 3, dtype=np.int64)
+        d = Dictionary(VectorInt64.from_numpy(keys), VectorInt64.from_numpy(keys * 2))
+        query = np.array([0, 1, 3, 29997, 30000], dtype=np.int64)
+        r = d[VectorInt64.from_numpy(query)].value
+        self.assertEqual([0, VectorInt64.null_value, 6, 59994, VectorInt64.null_value], list(r))
+
+    def test_setitem(self):
+        d = Dictionary(VectorInt64(1, 2), VectorFloat64(10.0, 20.0))
+        d[2] = 21.0
+        d[VectorInt64(3, 1, 3)] = 0.0
+        self.assertEqual([1, 2, 3], list(d.keys().value))
+        self.assertEqual([0.0, 21.0, 0.0], list(d.values().value))
+        d[[4, 5]] = VectorFloat64(4.0, 5.0)
+        self.assertEqual(ScalarFloat64(5.0), d[5])
+        self.assertRaises(PUCIndexError, d.__setitem__, 1, 1)  # wrong kind of value
+        e = Dictionary()
+        self.assertEqual(0, len(e))
+        self.assertTrue(e['a'] is None)
+        self.assertRaises(PUCTypeError, e.__setitem__, VectorInt64(7), True)
+        e[VectorInt64(7)] = VectorBool(True)
+        self.assertEqual(ScalarBool(True), e[7])
+        keys, values = VectorInt64(1, 2), VectorFloat64(10.0, 20.0)
+        f = Dictionary(keys, values)
+        f[VectorInt64(1, 3)] = 0.0
+        self.assertEqual(([1, 2], [10.0, 20.0]), (list(keys.value), list(values.value)))  # copies, not views
+        keys.extend([9])
+        self.assertEqual([1, 2, 3], list(f.keys().value))
+
+    def test_find(self):
+        d = Dictionary(VectorInt64(1, 2, 3), VectorFloat64(10.0, 20.0, 20.0))
+        self.assertEqual(ScalarInt64(2), d.find(20.0))
+        self.assertTrue(d.find(99.0) is None)
+
+    def test_attributes(self):
+        keys = VectorInt64(1, 3, 5)
+        keys.set_attribute('sorted')
+        values = VectorFloat64(10.0, 30.0, 50.0)
+        values.set_attribute('unique')
+        d = Dictionary(keys, values)
+        self.assertTrue(d._index is None)  # lookups binary search the keys
+        self.assertEqual([30.0, 10.0], list(d[VectorInt64(3, 1)].value))
+        self.assertEqual(ScalarInt64(5), d.find(50.0))
+        d[7] = 70.0  # keeps the keys in order
+        self.assertEqual('sorted', d.keys().attribute)
+        self.assertTrue(d._index is None)
+        d[2] = 20.0
+        self.assertTrue(d.keys().attribute is None)
+        self.assertEqual([20.0, 70.0, 10.0], list(d[VectorInt64(2, 7, 1)].value))
+
+
+class KeyedTable(PUC):
+    '''a Table whose rows are labeled by the values of its key column
+
+    It is conceptually a dictionary of rows. The primary-key index is built once:
+        index='sorted': the positions of the rows in key order, for binary search and range scans
+        index='hash': a _HashIndex, for point lookups
+    and is updated incrementally by append. If the key column is already in order, the sorted
+    index is just the column itself, and a range scan returns views of the rows.
+        ktab = KeyedTable(trades, 'time')
+        ktab[t0:t1]                  # Table of the rows with t0 <= time < t1
+        ktab[VectorInt64(t0, t2)]    # Table with one row per key (nulls for missing keys)
+        ktab[t0]                     # row as an OrderedDict, or None
+    As in Q, keys need not be unique; a point lookup finds the first row with the key.
+    '''
+    def __init__(self, table, key, index='sorted', name=None):
+        if not isinstance(table, Table):
+            raise PUCTypeError(table, (Table,))
+        if index not in ('sorted', 'hash'):
+            raise PUCConstructionError(index, msg="index must be 'sorted' or 'hash', not %s" % index)
+        table.column(key)  # raise if there is no such column
+        self.table = table
+        self.key = key
+        self.index = index
+        self.name = name
+        self._build_index()
+
+    def _build_index(self):
+        column = self.table.column(self.key)
+        keys = column.value
+        if self.index == 'hash':
+            # a key column with an attribute other than sorted is looked up through it
+            self._hash_index = None if column.attribute in ('unique', 'grouped', 'parted') else _HashIndex(keys)
+        elif column.attribute == 'sorted' or np.all(keys[1:] >= keys[:-1]):
+            self._order = None  # the rows are in key order
+        else:
+            self._order = np.argsort(keys, kind='mergesort')
+            self._sorted_keys = keys[self._order]
+
+    def __repr__(self):
+        return 'KeyedTable(key=%s, index=%s, table=%s%s)' % (
+            self.key,
+            self.index,
+            self.table,
+            '' if self.name is None else ', name=%s' % self.name,
+            )
+
+    def __len__(self):
+        return len(self.table)
+
+    def _sorted(self):
+        'return the key values in key order'
+        return self.table.column(self.key).value if self._order is None else self._sorted_keys
+
+    def _key_array(self, key):
+        'return (numpy.array of keys of the kind of the key column, True if key is a scalar)'
+        key_column = self.table.column(self.key)
+        if isinstance(key, Vector):
+            if type(key) != type(key_column):
+                raise PUCTypeError(key, (type(key_column),))
+            return key.value, False
+        scalar = not isinstance(key, list)
+        array = np.array([key.value if isinstance(key, Scalar) else key] if scalar else key)
+        return key_column._coerce(array, key), scalar
+
+    def positions(self, key):
+        'return int64 array with the position of the first row for each of the keys, or -1'
+        array, _ = self._key_array(key)
+        if self.index == 'hash':
+            if self._hash_index is None:
+                return self.table.column(self.key)._lookup(array)
+            return self._hash_index.lookup(array)
+        sorted_keys = self._sorted()
+        found = np.searchsorted(sorted_keys, array, side='left')
+        hit = found < sorted_keys.size
+        hit[hit] = sorted_keys[found[hit]] == array[hit]
+        if self._order is not None:
+            found[hit] = self._order[found[hit]]
+        return np.where(hit, found, -1)
+
+    def _range(self, start, stop):
+        'return Table of the rows with start <= key < stop, in key order'
+        if self.index != 'sorted':
+            raise PUCIndexError(slice(start, stop), msg='a range lookup needs a sorted index')
+        sorted_keys = self._sorted()
+        lo = 0 if start is None else np.searchsorted(sorted_keys, self._key_array(start)[0][0], side='left')
+        hi = sorted_keys.size if stop is None else np.searchsorted(sorted_keys, self._key_array(stop)[0][0], side='left')
+        hi = max(lo, hi)
+        if self._order is None:
+            return self.table.select_rows(slice(lo, hi))  # views
+        return self.table.select_rows(VectorInt64._wrap(self._order[lo:hi]))
+
+    def __getitem__(self, key):
+        '''return a row (an OrderedDict) or None for a scalar key, a Table for a Vector of keys, or
+        a Table for the range of keys start <= key < stop when key is the slice start:stop
+        '''
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise PUCIndexError(key, msg='a range of keys has no step')
+            return self._range(key.start, key.stop)
+        positions = self.positions(key)
+        if not isinstance(key, (Vector, list)):
+            return None if positions[0] == -1 else self.table._row(int(positions[0]))
+        columns = collections.OrderedDict()
+        for name in self.table.column_names:
+            columns[name] = self.table.column(name)._take(positions)
+        return Table._from_columns(columns, name=self.table.name)
+
+    def append(self, other):
+        '''mutate self by appending the rows of the Table other, and update the index
+
+        A hash index inserts just the new keys. A sorted index whose new keys follow the old
+        ones stays the key column itself; otherwise the sorted new keys are merged in. If the
+        table has a capacity and the append dropped its oldest rows, an index other than the
+        key column itself is rebuilt.
+        '''
+        n_old = len(self.table)
+        if self.index == 'hash':
+            self.table.append(other)
+            dropped = n_old + len(other) > len(self.table)
+            if self._hash_index is not None and not dropped:
+                self._hash_index.insert(other.column(self.key).value)
+            elif self._hash_index is not None or self.table.column(self.key).attribute is None:
+                self._build_index()  # the new keys broke the attribute, or the old rows moved
+            return
+        old_sorted = self._sorted()
+        old_last = old_sorted[-1] if n_old > 0 else None
+        self.table.append(other)
+        new_keys = other.column(self.key).value
+        if self._order is None and np.all(new_keys[1:] >= new_keys[:-1]) and (
+                n_old == 0 or new_keys.size == 0 or new_keys[0] >= old_last):
+            return
+        if n_old + len(other) > len(self.table):
+            self._build_index()
+            return
+        order = np.argsort(new_keys, kind='mergesort')
+        new_sorted = new_keys[order]
+        old_order = np.arange(n_old) if self._order is None else self._order
+        insert_at = np.searchsorted(old_sorted, new_sorted, side='right')
+        self._sorted_keys = np.insert(old_sorted, insert_at, new_sorted)
+        self._order = np.insert(old_order, insert_at, order + n_old)
+
+
+class TestKeyedTable(unittest.TestCase):
+    def make_table(self, times):
+        return Table(
+            VectorInt64.from_numpy(np.array(times, dtype=np.int64)),
+            VectorFloat64.from_numpy(np.array(times, dtype=np.float64) / 10),
+            names=['time', 'price'],
+            )
+
+    def test_sorted_in_order(self):
+        ktab = KeyedTable(self.make_table([10, 20, 20, 30, 40]), 'time')
+        window = ktab[20:40]
+        self.assertEqual([20, 20, 30], list(window['time'].value))
+        self.assertTrue(window['time'].storage is ktab.table['time'].storage)  # a view
+        self.assertEqual([10, 20, 20], list(ktab[:30]['time'].value))
+        self.assertEqual([40], list(ktab[35:]['time'].value))
+        self.assertEqual(0, len(ktab[50:60]))
+        self.assertEqual(ScalarFloat64(3.0), ktab[30]['price'])
+        self.assertTrue(ktab[31] is None)
+        r = ktab[VectorInt64(40, 11, 10)]
+        self.assertEqual([40, VectorInt64.null_value, 10], list(r['time'].value))
+        self.assertEqual([1, -1, 3], list(ktab.positions([20, 25, 30])))
+
+    def test_sorted_out_of_order(self):
+        ktab = KeyedTable(self.make_table([30, 10, 20]), 'time')
+        self.assertEqual([10, 20], list(ktab[0:25]['time'].value))
+        self.assertEqual([2, 0], list(ktab.positions([20, 30])))
+
+    def test_hash(self):
+        ktab = KeyedTable(self.make_table([30, 10, 20]), 'time', index='hash')
+        self.assertEqual([2, -1], list(ktab.positions(VectorInt64(20, 40))))
+        self.assertEqual(ScalarFloat64(1.0), ktab[10]['price'])
+        self.assertRaises(PUCIndexError, ktab.__getitem__, slice(10, 20))
+        ktab.append(self.make_table([40, 10]))
+        self.assertEqual([3, 1], list(ktab.positions([40, 10])))
+        self.assertEqual(5, len(ktab))
+
+    def test_append(self):
+        ktab = KeyedTable(self.make_table([10, 20]), 'time')
+        ktab.append(self.make_table([20, 30]))
+        self.assertTrue(ktab._order is None)  # still in order
+        self.assertEqual([20, 20, 30], list(ktab[20:]['time'].value))
+        ktab.append(self.make_table([25, 5]))
+        self.assertEqual([5, 10, 20, 20, 25, 30], list(ktab[:]['time'].value))
+        self.assertEqual([5, 4, -1], list(ktab.positions([5, 25, 26])))
+        self.assertRaises(PUCConstructionError, ktab.append, Table(VectorInt64(1), names=['time']))
+        fresh = KeyedTable(self.make_table([10, 20]), 'time')
+        fresh.append(self.make_table([]))
+        self.assertEqual([10, 20], list(fresh[:]['time'].value))
+
+    def test_attributes(self):
+        t = self.make_table([30, 10, 20])
+        t['time'].set_attribute('unique')
+        ktab = KeyedTable(t, 'time', index='hash')
+        self.assertTrue(ktab._hash_index is None)  # uses the column's index
+        self.assertEqual([2, -1], list(ktab.positions([20, 40])))
+        ktab.append(self.make_table([40]))
+        self.assertEqual('unique', ktab.table['time'].attribute)
+        self.assertEqual([3], list(ktab.positions([40])))
+        ktab.append(self.make_table([40]))
+        self.assertTrue(ktab.table['time'].attribute is None)
+        self.assertEqual([3, 1], list(ktab.positions([40, 10])))
+
+    def test_capacity(self):
+        t = Table(VectorInt64(1, 2, 3), VectorFloat64(0.1, 0.2, 0.3), names=['time', 'price'], capacity=4)
+        ktab = KeyedTable(t, 'time')
+        ktab.append(self.make_table([4, 5, 6]))  # drops 1 and 2
+        self.assertEqual([3, 4, 5, 6], list(ktab.table['time'].value))
+        self.assertEqual(4, ktab.table['time'].storage.capacity)
+        self.assertEqual([[3, 4], [5, 6]], [list(part['time'].value) for part in ktab.table.segments()])
+        self.assertEqual([0.5, 0.6], list(ktab[5:]['price'].value))
+        ktab.append(self.make_table([2]))  # out of order: drops 3 and rebuilds the index
+        self.assertEqual([2, 4, 5], list(ktab[:6]['time'].value))
+        hashed = KeyedTable(Table(VectorInt64(1, 2), names=['time'], capacity=2), 'time', index='hash')
+        hashed.append(Table(VectorInt64(3), names=['time']))
+        self.assertEqual([-1, 0, 1], list(hashed.positions([1, 2, 3])))
+
+    def test_errors(self):
+        t = self.make_table([1])
+        self.assertRaises(PUCIndexError, KeyedTable, t, 'volume')
+        self.assertRaises(PUCConstructionError, KeyedTable, t, 'time', index='btree')
+        self.assertRaises(PUCTypeError, KeyedTable(t, 'time').__getitem__, VectorFloat64(1.0))
+
+
+def _factorize(values, index=None):
+    '''return (codes, first_positions) for the 1D numpy.array values
+
+    codes[i] is the number of the group of values[i], where groups are numbered in order of
+    their first appearance, and first_positions[g] is the position of the first element of
+    group g. One hash build, with no sort; index is the _HashIndex of values, if already built.
+    '''
+    if values.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    first = (_HashIndex(values) if index is None else index).firsts()
+    first_positions = np.flatnonzero(first == np.arange(values.size))
+    code_of_position = np.empty(values.size, dtype=np.int64)
+    code_of_position[first_positions] = np.arange(first_positions.size)
+    return code_of_position[first], first_positions
+
+
+class _Grouping(object):
+    '''the rows of a Table grouped by the values of some of its columns
+
+    The key columns are factorized into one int64 group code per row, and the built-in
+    aggregations are scatter-reductions over those codes: numpy reduceat over the rows in
+    group order, so that there is no Python-level work per group.
+    '''
+    aggregations = ('sum', 'count', 'min', 'max', 'mean', 'first', 'last')
+
+    def __init__(self, table, by):
+        self.table = table
+        self.by = by
+        n = len(table)
+        codes = np.zeros(n, dtype=np.int64)
+        first_positions = np.zeros(min(n, 1), dtype=np.int64)  # no key columns: one group
+        for name in by:
+            column_codes, column_first = _factorize(table.column(name).value)
+            # pack the codes so far with this column's codes, then renumber densely
+            codes, first_positions = _factorize(codes * column_first.size + column_codes)
+        self.codes = codes
+        self.first_positions = first_positions
+        self.n_groups = first_positions.size
+        self._order = None
+
+    def _sorted(self):
+        'return (order, starts): the rows in group order (stable), and where each group starts in it'
+        if self._order is None:
+            self._order = np.argsort(self.codes, kind='mergesort')
+            counts = np.bincount(self.codes, minlength=self.n_groups)
+            self._starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+        return self._order, self._starts
+
+    def keys(self):
+        'return OrderedDict of key column name -> Vector of the key of each group'
+        columns = collections.OrderedDict()
+        for name in self.by:
+            column = self.table.column(name)
+            columns[name] = column._new(column.value[self.first_positions])
+            if column.validity is not None:
+                columns[name]._set_valid(column.valid()[self.first_positions])
+        return columns
+
+    def aggregate(self, function, name):
+        '''return Vector with function applied to the column name in each group
+
+        function is one of _Grouping.aggregations, or a callable that is called once per
+        group with a Vector of the group's elements and returns a scalar. The built-in
+        aggregations skip nulls, as in SQL: count counts the elements that are not null, and
+        the others are null for a group with no such elements.
+        '''
+        column = self.table.column(name)
+        if column.validity is not None and not callable(function):
+            return self._aggregate_valid(function, name, column)
+        values = column.value
+        if self.n_groups == 0:
+            values = values[0:0]
+        if callable(function):
+            order, starts = self._sorted()
+            ends = np.append(starts[1:], order.size)
+            results = [function(column._new(values[order[start:end]])) for start, end in zip(starts, ends)]
+            results = np.array([result.value if isinstance(result, Scalar) else result for result in results])
+            return _VECTOR_CLASSES[Storage._kind_of(results)].from_numpy(results, name=name)
+        if function not in _Grouping.aggregations:
+            raise PUCQueryError(function, msg='aggregation %s is not one of %s' % (function, _Grouping.aggregations))
+        if function == 'count':
+            return VectorInt64._wrap(np.bincount(self.codes, minlength=self.n_groups).astype(np.int64), name=name)
+        if function == 'first':
+            return column._new(values[self.first_positions])
+        if function in ('sum', 'mean') and not isinstance(column, (VectorBool, VectorInt64, VectorFloat64)):
+            raise PUCTypeError(column, (VectorBool, VectorInt64, VectorFloat64))
+        if function == 'sum' and isinstance(column, VectorBool):
+            values = values.astype(np.int64)  # as for ScalarBool, + on bools counts
+            column = VectorInt64._wrap(values[0:0], name=column.name)
+        order, starts = self._sorted()
+        if function == 'last':
+            ends = np.append(starts[1:], order.size)
+            return column._new(values[order[ends - 1]])
+        grouped = values[order]
+        strings = isinstance(column, VectorString)
+        if strings:
+            grouped = _SYMBOLS.ranks()[grouped]  # the codes do not order like the strings
+        if self.n_groups == 0:
+            reduced = grouped[0:0]
+        elif function == 'sum' or function == 'mean':
+            reduced = np.add.reduceat(grouped, starts)
+        elif function == 'min':
+            reduced = np.minimum.reduceat(grouped, starts)
+        else:
+            reduced = np.maximum.reduceat(grouped, starts)
+        if function == 'mean':
+            counts = np.bincount(self.codes, minlength=self.n_groups)
+            return VectorFloat64._wrap(reduced / counts.astype(np.float64), name=name)
+        return column._new(_SYMBOLS.by_rank()[reduced] if strings else reduced)
+
+    def _aggregate_valid(self, function, name, column):
+        'return the aggregation function of the elements of column that are not null in each group'
+        rows = np.flatnonzero(column.valid())
+        present = np.bincount(self.codes[rows], minlength=self.n_groups) > 0
+        subset = _Grouping.__new__(_Grouping)
+        subset.table = Table._from_columns(collections.OrderedDict([(name, column._new(column._gather(rows)))]))
+        subset.by = self.by
+        subset.codes = self.codes[rows]
+        subset.n_groups = self.n_groups
+        _, firsts = np.unique(subset.codes, return_index=True)
+        subset.first_positions = np.zeros(self.n_groups, dtype=np.int64)
+        subset.first_positions[present] = firsts
+        subset._order = None
+        if rows.size == 0:
+            subset.n_groups = 0
+        else:
+            order, starts = subset._sorted()
+            subset._starts = np.minimum(starts, rows.size - 1)  # an empty group reduces a placeholder row
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = subset.aggregate(function, name)
+        if rows.size == 0:
+            null_value = 0 if function == 'count' else result.null_value
+            result = result._new(np.full(self.n_groups, null_value, dtype=result.dtype))
+        if function != 'count':
+            result._set_valid(present)
+        return result
+
+    def summarize(self, aggregations):
+        '''return new Table with the key columns and then one column per aggregation
+
+        ARGS
+        aggregations: a list of (output column name, function, input column name)
+        '''
+        columns = self.keys()
+        for output_name, function, name in aggregations:
+            if output_name in columns:
+                raise PUCQueryError(output_name, msg='column %s is produced twice' % output_name)
+            vector = self.aggregate(function, name)
+            vector.name = output_name
+            columns[output_name] = vector
+        return Table._from_columns(columns, name=self.table.name)
+
+    def tables(self):
+        'generate (key row as an OrderedDict, Table of the rows of the group) for each group, in order'
+        order, starts = self._sorted()
+        ends = np.append(starts[1:], order.size)
+        keys = Table._from_columns(self.keys())
+        for group, (start, end) in enumerate(zip(starts, ends)):
+            yield keys._row(group), self.table.select_rows(VectorInt64._wrap(order[start:end]))
+
+
+def _concatenate_tables(tables):
+    'return new Table with the rows of each of the non-empty list of Tables, which have the same columns'
+    first = tables[0]
+    for table in tables[1:]:
+        first._check_same_columns(table)
+    columns = collections.OrderedDict()
+    for name in first.column_names:
+        columns[name] = first.column(name)._new(np.concatenate([table.column(name).value for table in tables]))
+        if any(table.column(name).validity is not None for table in tables):
+            columns[name]._set_valid(np.concatenate([table.column(name).valid() for table in tables]))
+    return Table._from_columns(columns, name=first.name)
+
+
+def _ply_result(grouping, results):
+    'return Table with the key of each group repeated for each row of its result Table, then the result columns'
+    counts = np.array([len(result) for result in results], dtype=np.int64)
+    columns = grouping.keys()
+    for name, key in columns.items():
+        columns[name] = key._new(np.repeat(key.value, counts))
+        if key.validity is not None:
+            columns[name]._set_valid(np.repeat(key.valid(), counts))
+    if len(results) > 0:
+        combined = _concatenate_tables(results)
+        for name in combined.column_names:
+            if name in columns:
+                raise PUCQueryError(name, msg='column %s is both a group key and a result' % name)
+            columns[name] = combined.column(name)
+    return Table._from_columns(columns, name=grouping.table.name)
+
+
+def _mutate_result(table, order, results):
+    'add the columns of the results, one Table per group in group order, to table, whose rows in group order are order'
+    if len(results) == 0:
+        return
+    combined = _concatenate_tables(results)
+    for name in combined.column_names:
+        column = combined.column(name)
+        value = np.empty(len(table), dtype=column.dtype)
+        value[order] = column.value
+        result = column._new(value)
+        if column.validity is not None:
+            valid = np.empty(len(table), dtype=bool)
+            valid[order] = column.valid()
+            result._set_valid(valid)
+        table[name] = result
+
+
+def _shared_memory_directory():
+    'return the path of a new temporary directory, in RAM (/dev/shm) where the system has one'
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return tempfile.mkdtemp(prefix='puc-', dir='/dev/shm')
+    return tempfile.mkdtemp(prefix='puc-')
+
+
+def _shared_table(table, directory):
+    '''return Table with the elements of the columns of table copied once into files in directory
+
+    The result pickles as the paths of its files (see Storage.__getstate__), so worker processes
+    map the columns instead of receiving copies of them. Columns of kinds that cannot be placed
+    on disk are pickled as usual.
+    '''
+    columns = collections.OrderedDict()
+    for i, name in enumerate(table.column_names):
+        column = table.column(name)
+        if not Storage._placeable(column.storage.kind):
+            columns[name] = column
+        else:
+            path = os.path.join(directory, 'c%d' % i)
+            storage = Storage(column.value, kind=column.storage.kind, place=('disk', path))
+            columns[name] = column._view(storage, 0, [len(storage)], [1])
+            if column.validity is not None:
+                columns[name]._set_valid(column.valid())  # the bitmap, an eighth of a byte per row, pickles with it
+    return Table._from_columns(columns, name=table.name)
+
+
+def _partition_groups(ends, n_runs):
+    'return list of (first group, stop group) that split the groups into runs with about equal numbers of rows'
+    n_groups = ends.size
+    targets = np.arange(1, n_runs) * (float(ends[-1]) / n_runs)
+    cuts = np.unique(np.concatenate(([0], np.searchsorted(ends, targets, side='right'), [n_groups])))
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _apply_to_groups(task):
+    'return list of fun(group, extra) for each array of row positions in groups; run in a worker process'
+    fun, extra, table, groups = task
+    return [fun(table.select_rows(VectorInt64._wrap(positions)), extra) for positions in groups]
+
+
+def _map_groups(grouping, fun, extra, processes):
+    '''return list of fun(group, extra) for the Table of each group of grouping, in group order
+
+    With processes > 1, the groups are split into runs with about equal numbers of rows and the
+    runs are mapped across a pool of that many worker processes, using concurrent.futures where
+    it is available and multiprocessing otherwise. The workers share the columns through files
+    in RAM (see _shared_table); fun and extra must be picklable, so fun is a module-level function.
+    '''
+    order, starts = grouping._sorted()
+    ends = np.append(starts[1:], order.size)
+    if processes is None or processes <= 1 or grouping.n_groups <= 1:
+        groups = [order[start:end] for start, end in zip(starts, ends)]
+        return _apply_to_groups((fun, extra, grouping.table, groups))
+    directory = _shared_memory_directory()
+    try:
+        table = _shared_table(grouping.table, directory)
+        tasks = []
+        for first, stop in _partition_groups(ends, 4 * processes):  # several runs per process balance the load
+            groups = [order[start:end] for start, end in zip(starts[first:stop], ends[first:stop])]
+            tasks.append((fun, extra, table, groups))
+        if futures is not None:
+            with futures.ProcessPoolExecutor(processes) as executor:
+                mapped = list(executor.map(_apply_to_groups, tasks))
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                mapped = pool.map(_apply_to_groups, tasks, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return [result for results in mapped for result in results]
+
+
+def _first_rows(group, extra):
+    'return the first extra rows of the price column of group; module-level so that it pickles'
+    return group.select_columns(['price']).select_rows(slice(0, extra))
+
+
+def _demean(group, extra):
+    'return Table with the price column of group less its mean; module-level so that it pickles'
+    price = group['price'].value
+    return Table(VectorFloat64.from_numpy(price - price.mean()), names=['demeaned'])
+
+
+class TestGrouping(unittest.TestCase):
+    def make_table(self):
+        return Table(
+            VectorInt64(1, 2, 1, 3, 2, 1),
+            VectorBool(True, False, True, True, False, False),
+            VectorFloat64(1.0, 2.0, 3.0, 4.0, 5.0, 6.0),
+            names=['sym', 'flag', 'price'],
+            )
+
+    def test_factorize(self):
+        codes, first_positions = _factorize(np.array([7, 3, 7, 9, 3], dtype=np.int64))
+        self.assertEqual([0, 1, 0, 2, 1], list(codes))
+        self.assertEqual([0, 1, 3], list(first_positions))
+        codes, first_positions = _factorize(np.zeros(0, dtype=np.float64))
+        self.assertEqual(0, codes.size)
+
+    def test_summarize(self):
+        t = self.make_table()
+        r = t.summarize(['sym'], [
+            ('total', 'sum', 'price'), ('n', 'count', 'price'), ('low', 'min', 'price'),
+            ('high', 'max', 'price'), ('avg', 'mean', 'price'), ('open', 'first', 'price'),
+            ('close', 'last', 'price'), ('flags', 'sum', 'flag'),
+            ])
+        self.assertEqual([1, 2, 3], list(r['sym'].value))
+        self.assertEqual([10.0, 7.0, 4.0], list(r['total'].value))
+        self.assertEqual([3, 2, 1], list(r['n'].value))
+        self.assertEqual([1.0, 2.0, 4.0], list(r['low'].value))
+        self.assertEqual([6.0, 5.0, 4.0], list(r['high'].value))
+        self.assertEqual([10.0 / 3, 3.5, 4.0], list(r['avg'].value))
+        self.assertEqual([1.0, 2.0, 4.0], list(r['open'].value))
+        self.assertEqual([6.0, 5.0, 4.0], list(r['close'].value))
+        self.assertTrue(isinstance(r['flags'], VectorInt64))
+        self.assertEqual([2, 0, 1], list(r['flags'].value))
+
+    def test_summarize_multiple_keys_and_callable(self):
+        t = self.make_table()
+        r = t.summarize(['sym', 'flag'], [('spread', lambda v: v.value.max() - v.value.min(), 'price')])
+        self.assertEqual([1, 2, 3, 1], list(r['sym'].value))
+        self.assertEqual([True, False, True, False], list(r['flag'].value))
+        self.assertEqual([2.0, 3.0, 0.0, 0.0], list(r['spread'].value))
+        r = t.summarize([], [('n', 'count', 'sym')])
+        self.assertEqual([6], list(r['n'].value))
+        r = t.select_rows(VectorInt64()).summarize(['sym'], [('total', 'sum', 'price')])
+        self.assertEqual(0, len(r))
+        self.assertRaises(PUCQueryError, t.summarize, ['sym'], [('sym', 'sum', 'price')])
+        self.assertRaises(PUCQueryError, t.summarize, ['sym'], [('x', 'median', 'price')])
+
+    def test_ply(self):
+        t = self.make_table()
+        r = t.ply(['sym'], _first_rows, 2)
+        self.assertEqual(['sym', 'price'], r.column_names)
+        self.assertEqual([1, 1, 2, 2, 3], list(r['sym'].value))
+        self.assertEqual([1.0, 3.0, 2.0, 5.0, 4.0], list(r['price'].value))
+        self.assertRaises(PUCTypeError, t.ply, ['sym'], lambda group, extra: 1)
+
+    def test_mutate(self):
+        t = self.make_table()
+        t.mutate(['sym'], _demean)
+        self.assertEqual(['sym', 'flag', 'price', 'demeaned'], t.column_names)
+        expected = [1.0 - 10.0 / 3, -1.5, 3.0 - 10.0 / 3, 0.0, 1.5, 6.0 - 10.0 / 3]
+        for actual, wanted in zip(t['demeaned'].value, expected):
+            self.assertAlmostEqual(wanted, actual)
+        self.assertRaises(PUCConstructionError, t.mutate, ['sym'],
+                          lambda group, extra: group.select_rows(slice(0, 1)))
+
+    def test_moving(self):
+        t = self.make_table()
+        t.moving('running', 'msum', 'price', 2)
+        self.assertEqual([1.0, 3.0, 5.0, 7.0, 9.0, 11.0], list(t['running'].value))
+        t.moving('sym_running', 'msum', 'price', 2, by=['sym'])  # sym 1 is rows 0, 2, 5
+        self.assertEqual([1.0, 2.0, 4.0, 4.0, 7.0, 9.0], list(t['sym_running'].value))
+        t.moving('sym_high', 'mmax', 'price', 2, by=['sym'])
+        self.assertEqual([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], list(t['sym_high'].value))
+        t.moving('sym_ewma', 'ewma', 'price', 0.5, by=['sym'])
+        self.assertEqual([1.0, 2.0, 2.0, 4.0, 3.5, 4.0], list(t['sym_ewma'].value))
+        t['time'] = VectorDateTime.from_integers([0, 1, 2, 3, 4, 10], unit='s')
+        t.moving('recent', 'msum', 'price', np.timedelta64(3, 's'), times='time', by=['sym'])
+        self.assertEqual([1.0, 2.0, 4.0, 4.0, 5.0, 6.0], list(t['recent'].value))
+        self.assertRaises(PUCQueryError, t.moving, 'x', 'median', 'price', 2)
+        t['price'].set_valid([True, False, True, True, True, False])  # sym 2 starts with a null
+        t.moving('sym_ewma', 'ewma', 'price', 0.5, by=['sym'])
+        self.assertEqual([True, False, True, True, True, True], list(t['sym_ewma'].valid()))
+        self.assertEqual([1.0, 2.0, 4.0, 5.0, 2.5], list(t['sym_ewma'].value[[0, 2, 3, 4, 5]]))
+
+    def test_bars(self):
+        trades = Table(
+            VectorDateTime.from_integers([0, 10, 30, 59, 60, 61, 125], unit='s'),
+            VectorString('a', 'b', 'a', 'a', 'b', 'a', 'a'),
+            VectorFloat64(10.0, 20.0, 12.0, 9.0, 21.0, 11.0, 13.0),
+            VectorInt64(1, 2, 3, 4, 5, 6, 7),
+            names=['time', 'sym', 'price', 'size'],
+            )
+        bars = trades.bars('time', np.timedelta64(1, 'm'))
+        self.assertEqual(['time', 'open', 'high', 'low', 'close', 'volume'], bars.column_names)
+        self.assertEqual([0, 60, 120], list(bars['time'].value.astype('M8[s]').astype(np.int64)))
+        self.assertEqual([10.0, 21.0, 13.0], list(bars['open'].value))
+        self.assertEqual([20.0, 21.0, 13.0], list(bars['high'].value))
+        self.assertEqual([9.0, 11.0, 13.0], list(bars['low'].value))
+        self.assertEqual([9.0, 11.0, 13.0], list(bars['close'].value))
+        self.assertEqual([10, 11, 7], list(bars['volume'].value))
+        bars = trades.bars('time', np.timedelta64(1, 'm'), by=['sym'], size=None)
+        self.assertEqual(['sym', 'time', 'open', 'high', 'low', 'close'], bars.column_names)
+        self.assertEqual(['a', 'a', 'a', 'b', 'b'], list(bars['sym'].decode()))
+        self.assertEqual([10.0, 11.0, 13.0, 20.0, 21.0], list(bars['open'].value))
+        self.assertEqual([9.0, 11.0, 13.0, 20.0, 21.0], list(bars['close'].value))
+        self.assertEqual([12.0, 11.0, 13.0, 20.0, 21.0], list(bars['high'].value))
+        shuffled = trades.select_rows(VectorInt64(6, 0, 3, 1, 5, 2, 4))
+        self.assertEqual([10, 11, 7], list(shuffled.bars('time', np.timedelta64(1, 'm'))['volume'].value))
+        self.assertEqual([10.0, 21.0, 13.0], list(shuffled.bars('time', np.timedelta64(1, 'm'))['open'].value))
+        trades['price'].set_valid([False, True, True, True, True, True, True])
+        self.assertEqual([20.0, 21.0, 13.0], list(trades.bars('time', np.timedelta64(1, 'm'))['open'].value))
+        self.assertEqual(0, len(trades.select_rows(VectorInt64()).bars('time', np.timedelta64(1, 'm'))))
+        self.assertEqual([0, 5], list(trades.bars('size', 5)['size'].value))
+        self.assertRaises(PUCTypeError, trades.bars, 'time', np.timedelta64(1, 'm'), None, 'sym')
+        self.assertRaises(PUCQueryError, trades.bars, 'time', np.timedelta64(1, 'm'), ['open'])
+
+    def test_partition_groups(self):
+        ends = np.array([1, 2, 10, 11, 12], dtype=np.int64)  # one big group
+        self.assertEqual([(0, 2), (2, 5)], [tuple(run) for run in _partition_groups(ends, 3)])
+        self.assertEqual([(0, 5)], [tuple(run) for run in _partition_groups(ends, 1)])
+
+    def test_shared_table(self):
+        directory = tempfile.mkdtemp()
+        try:
+            shared = _shared_table(self.make_table(), directory)
+            self.assertEqual(('disk', os.path.join(directory, 'c2')), shared['price'].storage.place)
+            copied = pickle.loads(pickle.dumps(shared))
+            self.assertEqual([1.0, 2.0, 3.0, 4.0, 5.0, 6.0], list(copied['price'].value))
+            self.assertTrue(isinstance(copied['sym'].storage.buffer, np.memmap))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_processes(self):
+        t = self.make_table()
+        serial = t.ply(['sym'], _first_rows, 2)
+        parallel = t.ply(['sym'], _first_rows, 2, processes=2)
+        for name in serial.column_names:
+            self.assertEqual(list(serial[name].value), list(parallel[name].value))
+        t['price'].set_valid([True, True, True, True, True, False])
+        serial = t.ply(['sym'], _first_rows, 5)
+        parallel = t.ply(['sym'], _first_rows, 5, processes=2)
+        self.assertEqual([True, True, False, True, True, True], list(serial['price'].valid()))
+        self.assertEqual(list(serial['price'].valid()), list(parallel['price'].valid()))
+        t.mutate(['sym', 'flag'], _demean, processes=3)
+        self.assertEqual([-1.0, -1.5, 1.0, 0.0, 1.5, 0.0], list(t['demeaned'].value))
+
+
+def _joint_codes(left, right, names):
+    '''return (left codes, right codes): int64 codes for the rows of the Tables left and right
+
+    Rows of either Table get the same code exactly when their values in the columns names are
+    equal, so that the codes of one key column or of several can be compared as plain integers.
+    '''
+    n = len(left)
+    codes = np.zeros(n + len(right), dtype=np.int64)
+    for name in names:
+        left_column, right_column = left.column(name), right.column(name)
+        if type(left_column) != type(right_column):
+            raise PUCTypeError(right_column, (type(left_column),))
+        column_codes, column_first = _factorize(np.concatenate((left_column.value, right_column.value)))
+        codes, _ = _factorize(codes * column_first.size + column_codes)
+    return codes[:n], codes[n:]
+
+
+def aj(columns, left, right):
+    '''return new Table with the as-of join of right to left, like Q's aj[columns; left; right]
+
+    For each row of left, the matching row of right is the last one, in order of columns[-1]
+    (usually a time), with equal values in columns[:-1] (usually a symbol) and a value in
+    columns[-1] at or before the value in the left row. The result has the columns of left
+    (shared, not copied) and then the other columns of right, with nulls where no row of right
+    matches. A column in both left and right takes the right value where there is a match.
+        aj(['sym', 'time'], trades, quotes)  # the prevailing quote for each trade
+
+    left and right are Tables or KeyedTables. Neither needs to be in order: right is sorted once,
+    then all the left rows are binary searched together within their keys, in O(n log m).
+    '''
+    left_table, right_table = _join_tables(left, right)
+    if len(columns) == 0:
+        raise PUCConstructionError(columns, msg='supply at least the column to join as of')
+    by, time = columns[:-1], columns[-1]
+    left_codes, right_codes = _joint_codes(left_table, right_table, by)
+    left_times = left_table.column(time)
+    right_times = right_table.column(time)
+    if type(left_times) != type(right_times):
+        raise PUCTypeError(right_times, (type(left_times),))
+    left_times, right_times = left_times.value, right_times.value
+    order = np.lexsort((right_times, right_codes))
+    sorted_codes, sorted_times = right_codes[order], right_times[order]
+    start = np.searchsorted(sorted_codes, left_codes, side='left')
+    low, high = start, np.searchsorted(sorted_codes, left_codes, side='right')
+    while True:  # narrow [low, high) to the first right time after the left time
+        active = low < high
+        if not active.any():
+            break
+        middle = (low + high) // 2
+        after = sorted_times[np.where(active, middle, 0)] > left_times
+        low = np.where(active & ~after, middle + 1, low)
+        high = np.where(active & after, middle, high)
+    matched = low > start
+    positions = np.where(matched, order[np.maximum(low - 1, 0)] if order.size > 0 else -1, -1)
+    return _joined_table(left_table, None, right_table, positions, columns)
+
+
+def _join_tables(left, right):
+    'return (left Table, right Table) for the Tables or KeyedTables left and right of a join'
+    tables = [side.table if isinstance(side, KeyedTable) else side for side in (left, right)]
+    for table in tables:
+        if not isinstance(table, Table):
+            raise PUCTypeError(table, (Table, KeyedTable))
+    return tables
+
+
+def _joined_table(left, left_positions, right, right_positions, on):
+    '''return new Table with the rows of left at left_positions beside the rows of right at right_positions
+
+    The result has the columns of left, then the columns of right that are not in on. A position
+    of -1 in right_positions yields nulls; a column in both left and right takes the left value
+    there and the right value elsewhere. If left_positions is None, the columns of left are
+    shared, not gathered.
+    '''
+    matched = right_positions != -1
+    result = collections.OrderedDict()
+    for name in left.column_names:
+        column = left.column(name)
+        result[name] = column if left_positions is None else column._take(left_positions)
+    for name in right.column_names:
+        if name in on:
+            continue
+        column = right.column(name)._take(right_positions)
+        column.name = name
+        if name in result:
+            left_column = result[name]
+            if type(left_column) != type(column):
+                raise PUCTypeError(column, (type(left_column),))
+            valid = np.where(matched, column.valid(), left_column.valid())
+            column = column._new(np.where(matched, column.value, left_column.value))
+            column._set_valid(valid)
+        result[name] = column
+    return Table._from_columns(result, name=left.name)
+
+
+def _key_codes(left, right, on):
+    '''return (left keys, right keys): 1D numpy.arrays that are equal where the rows' values in on are
+
+    One key column is used as it is; several are packed into one int64 code per row.
+    '''
+    if len(on) != 1:
+        return _joint_codes(left, right, on)
+    left_column, right_column = left.column(on[0]), right.column(on[0])
+    if type(left_column) != type(right_column):
+        raise PUCTypeError(right_column, (type(left_column),))
+    return left_column.value, right_column.value
+
+
+def join(left, right, on, how='inner'):
+    '''return new Table with the rows of left joined to the rows of right with equal values in on
+
+    ARGS
+    left, right: Tables or KeyedTables
+    on: a list of column names in both left and right
+    how: 'inner' for one row per pair of matching rows, or 'left' to also keep each row of left
+         that matches no row of right, with nulls in the columns of right
+
+    The rows are in the order of left, and the rows matching one left row are in the order of
+    right. The result has the columns of left, then the other columns of right; a column in both
+    takes the right value where there is a match, as in Q's lj.
+
+    A _HashIndex is built on the keys of the smaller side, which also groups them, and probed
+    with the keys of the other, once for all rows. The matches are expanded into arrays of gather positions, and each output
+    column is gathered with one Vector._take.
+    '''
+    if how not in ('inner', 'left'):
+        raise PUCConstructionError(how, msg="how must be 'inner' or 'left', not %s" % how)
+    if len(on) == 0:
+        raise PUCConstructionError(on, msg='supply at least one column to join on')
+    left_table, right_table = _join_tables(left, right)
+    left_keys, right_keys = _key_codes(left_table, right_table, on)
+    build_is_left = left_keys.size < right_keys.size
+    build_keys, probe_keys = (left_keys, right_keys) if build_is_left else (right_keys, left_keys)
+    # build: the rows of the build side with each distinct key, in CSR form
+    index = _HashIndex(build_keys)
+    build_codes, build_first = _factorize(build_keys, index)
+    build_order = np.argsort(build_codes, kind='mergesort')
+    counts = np.bincount(build_codes, minlength=build_first.size)
+    starts = np.cumsum(counts) - counts
+    # probe: the build rows matching each probe row with a hit, expanded into gather positions
+    first = index.lookup(probe_keys)
+    hit = np.flatnonzero(first != -1)
+    hit_codes = build_codes[first[hit]]
+    hit_counts = counts[hit_codes]
+    probe_positions = np.repeat(hit, hit_counts)
+    within = np.arange(probe_positions.size) - np.repeat(np.cumsum(hit_counts) - hit_counts, hit_counts)
+    build_positions = build_order[np.repeat(starts[hit_codes], hit_counts) + within]
+    if build_is_left:
+        left_positions, right_positions = build_positions, probe_positions
+    else:
+        left_positions, right_positions = probe_positions, build_positions
+    if how == 'left':
+        unmatched = np.flatnonzero(np.bincount(left_positions, minlength=left_keys.size) == 0)
+        left_positions = np.concatenate((left_positions, unmatched))
+        right_positions = np.concatenate((right_positions, np.full(unmatched.size, -1, dtype=np.int64)))
+    if left_positions.size > 1 and not np.all(left_positions[1:] >= left_positions[:-1]):
+        order = np.argsort(left_positions, kind='mergesort')
+        left_positions, right_positions = left_positions[order], right_positions[order]
+    return _joined_table(left_table, left_positions.astype(np.int64), right_table, right_positions.astype(np.int64), on)
+
+
+class TestAsOfJoin(unittest.TestCase):
+    def make_tables(self):
+        trades = Table(
+            VectorInt64(1, 2, 1, 2, 3, 1),
+            VectorInt64(10, 11, 15, 9, 20, 30),
+            VectorFloat64(100.0, 200.0, 101.0, 199.0, 300.0, 102.0),
+            names=['sym', 'time', 'price'],
+            )
+        quotes = Table(
+            VectorInt64(2, 1, 1, 2, 1),
+            VectorInt64(10, 9, 14, 5, 15),
+            VectorFloat64(199.5, 99.5, 100.5, 198.5, 101.5),
+            names=['sym', 'time', 'bid'],
+            )
+        return trades, quotes
+
+    def test_aj(self):
+        trades, quotes = self.make_tables()
+        r = aj(['sym', 'time'], trades, quotes)
+        self.assertEqual(['sym', 'time', 'price', 'bid'], r.column_names)
+        self.assertTrue(r['price'].storage is trades['price'].storage)
+        self.assertEqual([99.5, 199.5, 101.5, 198.5], list(r['bid'].value)[:4])
+        self.assertTrue(np.isnan(r['bid'].value[4]))  # no quote for sym 3
+        self.assertEqual(101.5, r['bid'].value[5])
+
+    def test_aj_time_only_and_keyed(self):
+        trades, quotes = self.make_tables()
+        r = aj(['time'], KeyedTable(trades, 'time'), KeyedTable(quotes, 'time'))
+        self.assertEqual(['sym', 'time', 'price', 'bid'], r.column_names)
+        self.assertEqual([2, 2, 1, 1, 1, 1], list(r['sym'].value))  # quote sym where matched
+        self.assertEqual([199.5, 199.5, 101.5, 99.5, 101.5, 101.5], list(r['bid'].value))
+        r = aj(['time'], trades.select_rows(slice(3, 4)), quotes.select_rows(slice(0, 1)))
+        self.assertEqual([2], list(r['sym'].value))  # unmatched rows keep the left value
+        self.assertEqual(1, len(aj(['time'], trades.select_rows(slice(0, 1)), quotes.select_rows(slice(0, 0)))))
+
+    def test_aj_errors(self):
+        trades, quotes = self.make_tables()
+        quotes['time'] = VectorFloat64(10.0, 9.0, 14.0, 5.0, 15.0)
+        self.assertRaises(PUCTypeError, aj, ['sym', 'time'], trades, quotes)
+        self.assertRaises(PUCConstructionError, aj, [], trades, quotes)
+        self.assertRaises(PUCTypeError, aj, ['sym', 'time'], trades, 1)
+
+
+class TestJoin(unittest.TestCase):
+    def make_tables(self):
+        orders = Table(
+            VectorInt64(1, 2, 3, 1, 4),
+            VectorInt64(10, 20, 30, 40, 50),
+            names=['customer', 'amount'],
+            )
+        customers = Table(
+            VectorInt64(3, 1, 1, 5),
+            VectorFloat64(0.3, 0.1, 0.11, 0.5),
+            names=['customer', 'rate'],
+            )
+        return orders, customers
+
+    def test_inner(self):
+        orders, customers = self.make_tables()
+        r = join(orders, customers, ['customer'])
+        self.assertEqual(['customer', 'amount', 'rate'], r.column_names)
+        self.assertEqual([1, 1, 3, 1, 1], list(r['customer'].value))
+        self.assertEqual([10, 10, 30, 40, 40], list(r['amount'].value))
+        self.assertEqual([0.1, 0.11, 0.3, 0.1, 0.11], list(r['rate'].value))
+        r = join(customers, orders, ['customer'])  # the build side is now the left
+        self.assertEqual([3, 1, 1, 1, 1], list(r['customer'].value))
+        self.assertEqual([30, 10, 40, 10, 40], list(r['amount'].value))
+
+    def test_left(self):
+        orders, customers = self.make_tables()
+        r = join(orders, customers, ['customer'], how='left')
+        self.assertEqual([1, 1, 2, 3, 1, 1, 4], list(r['customer'].value))
+        self.assertEqual([10, 10, 20, 30, 40, 40, 50], list(r['amount'].value))
+        self.assertTrue(np.isnan(r['rate'].value[2]))
+        self.assertTrue(np.isnan(r['rate'].value[6]))
+        r = join(orders, customers.select_rows(slice(0, 0)), ['customer'], how='left')
+        self.assertEqual(5, len(r))
+        self.assertEqual(0, len(join(orders, customers.select_rows(slice(0, 0)), ['customer'])))
+
+    def test_multiple_keys(self):
+        left = Table(VectorInt64(1, 1, 2), VectorBool(True, False, True), VectorInt64(7, 8, 9), names=['a', 'b', 'x'])
+        right = KeyedTable(Table(VectorBool(False, True), VectorInt64(1, 2), VectorInt64(70, 90), names=['b', 'a', 'x']), 'a')
+        r = join(left, right, ['a', 'b'], how='left')
+        self.assertEqual(['a', 'b', 'x'], r.column_names)
+        self.assertEqual([7, 70, 90], list(r['x'].value))  # the right value where there is a match
+
+    def test_errors(self):
+        orders, customers = self.make_tables()
+        self.assertRaises(PUCConstructionError, join, orders, customers, ['customer'], how='outer')
+        self.assertRaises(PUCConstructionError, join, orders, customers, [])
+        customers['customer'] = VectorFloat64(3.0, 1.0, 1.0, 5.0)
+        self.assertRaises(PUCTypeError, join, orders, customers, ['customer'])
+
+
+class _SelectPlan(object):
+    '''a compiled select statement; see compile_select
+
+    The where condition is a tree of tuples,
+        ('compare', op, left, right), ('and', a, b), ('or', a, b), ('not', a)
+    whose leaves are ('column', name) and ('literal', value). Executing the plan evaluates
+    each comparison as one vectorized operation on a column, and only then gathers the
+    output columns for the selected rows.
+    '''
+    comparisons = {
+        '=': np.equal,
+        '==': np.equal,
+        '!=': np.not_equal,
+        '<>': np.not_equal,
+        '<': np.less,
+        '<=': np.less_equal,
+        '>': np.greater,
+        '>=': np.greater_equal,
+    }
+    keywords = ('select', 'where', 'group', 'by', 'having', 'ordered', 'order', 'first',
+                'and', 'or', 'not', 'asc', 'desc', 'true', 'false', 'as')
+    token_re = re.compile(r'''
+        \s*(?:
+        (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)|
+        (?P<string>'[^']*'|"[^"]*")|
+        (?P<op><=|>=|!=|<>|==|=|<|>)|
+        (?P<punctuation>[(),])|
+        (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+        )''', re.VERBOSE)
+
+    def __init__(self, columns=None, aggregations=None, where=None, groupby=None, having=None,
+                 orderedby=None, first=None, text=None):
+        self.columns = columns  # list of column names, or None for all
+        self.aggregations = aggregations  # list of (output name, function, column name)
+        self.where = where
+        self.groupby = groupby
+        self.having = having
+        self.orderedby = orderedby  # list of (column name, descending)
+        self.first = first
+        self.text = text
+
+    def __repr__(self):
+        return '_SelectPlan(%r)' % (self.text,)
+
+    # parsing
+
+    @classmethod
+    def _tokenize(cls, text):
+        'return list of (type, value) tokens; keywords have type keyword and a lower-case value'
+        tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = cls.token_re.match(text, position)
+            if match is None or match.end() == position:
+                raise PUCQueryError(text, msg='cannot parse %r at position %s' % (text, position))
+            position = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == 'number':
+                value = float(value) if any(c in value for c in '.eE') else int(value)
+            elif kind == 'string':
+                value = value[1:-1]
+            elif kind == 'name' and value.lower() in cls.keywords:
+                kind, value = 'keyword', value.lower()
+            tokens.append((kind, value))
+        return tokens
+
+    @classmethod
+    def parse(cls, text):
+        '''return new _SelectPlan for the text
+
+        text := [select item, ...] [where condition] [group by names] [having condition]
+                [ordered by name [asc|desc], ...] [first N]
+        item := name | function(name) [as name]
+        where function is one of _Grouping.aggregations
+        '''
+        parser = _SelectParser(cls._tokenize(text), text)
+        plan = cls(text=text)
+        if parser.accept('keyword', 'select'):
+            plan.columns, plan.aggregations = parser.selection()
+        if parser.accept('keyword', 'where'):
+            plan.where = parser.condition()
+        if parser.accept('keyword', 'group'):
+            parser.expect('keyword', 'by')
+            plan.groupby = parser.names()
+        if parser.accept('keyword', 'having'):
+            plan.having = parser.condition()
+        if parser.accept('keyword', 'ordered') or parser.accept('keyword', 'order'):
+            parser.expect('keyword', 'by')
+            plan.orderedby = parser.ordering()
+        if parser.accept('keyword', 'first'):
+            plan.first = parser.expect('number')
+            if not isinstance(plan.first, int) or plan.first < 0:
+                raise PUCQueryError(text, msg='first needs a non-negative integer, not %s' % plan.first)
+        parser.expect_end()
+        return plan
+
+    # execution
+
+    def _evaluate(self, node, table, rows):
+        'return numpy bool array with the value of the condition node for the rows (a slice) of table'
+        operator = node[0]
+        if operator == 'and':
+            return np.logical_and(self._evaluate(node[1], table, rows), self._evaluate(node[2], table, rows))
+        if operator == 'or':
+            return np.logical_or(self._evaluate(node[1], table, rows), self._evaluate(node[2], table, rows))
+        if operator == 'not':
+            return np.logical_not(self._evaluate(node[1], table, rows))
+        _, op, left, right = node
+        left_value, right_value = self._operand(left, table, rows), self._operand(right, table, rows)
+        left_value = self._comparable(op, left, left_value, right, table)
+        right_value = self._comparable(op, right, right_value, left, table)
+        result = self.comparisons[op](left_value, right_value)
+        if not isinstance(result, np.ndarray):
+            n = len(range(*rows.indices(len(table)))) if isinstance(rows, slice) else rows.size
+            result = np.full(n, bool(result), dtype=bool)
+        for operand in (left, right):
+            if operand[0] == 'column' and table.column(operand[1]).validity is not None:
+                result &= table.column(operand[1]).valid()[rows]  # a comparison with a null is false
+        return result
+
+    flipped = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}  # a op b is b flipped[op] a
+
+    def _candidates(self, node, table):
+        '''return the rows (a slice or int64 array) that can satisfy the condition node, found through an attribute
+
+        Return None if no column of a comparison with a literal has an attribute that helps.
+        '''
+        if node[0] == 'and':
+            for child in node[1:]:
+                rows = self._candidates(child, table)
+                if rows is not None:
+                    return rows
+            return None
+        if node[0] != 'compare':
+            return None
+        _, op, left, right = node
+        if left[0] == 'literal' and right[0] == 'column':
+            op, left, right = self.flipped.get(op, op), right, left
+        if left[0] != 'column' or right[0] != 'literal':
+            return None
+        return table.column(left[1])._positions_where(op, right[1])
+
+    def _comparable(self, op, node, value, other, table):
+        '''return the value of the operand node as compared by op with the operand other
+
+        The codes of a VectorString are compared for equality, as is the code of a string
+        literal (-1 if it is not interned, so it equals no element); otherwise the strings are.
+        A literal compared with a datetime or timedelta column is converted to its kind, and one
+        compared with a VectorString must be a string.
+        '''
+        if node[0] == 'column':
+            column = table.column(node[1])
+            if isinstance(column, VectorString) and op not in ('=', '==', '!=', '<>'):
+                return column._ordered(value)
+        elif other[0] == 'column' and isinstance(table.column(other[1]), VectorString) and not isinstance(value, (str, unicode)):
+            raise PUCTypeError(value, PUC.types_string)  # not its code
+        elif other[0] == 'column' and isinstance(table.column(other[1]), _VectorTemporal):
+            return table.column(other[1])._coerce(np.array([value]), value)[0]  # say an ISO 8601 string
+        elif isinstance(value, (str, unicode)) and other[0] == 'column' and op in ('=', '==', '!=', '<>'):
+            if isinstance(table.column(other[1]), VectorString):
+                return _SYMBOLS.code(value)
+        return value
+
+    def _operand(self, node, table, rows):
+        if node[0] != 'column':
+            return node[1]
+        column = table.column(node[1])
+        return column._range_value(rows) if isinstance(rows, slice) else column._gather(rows)
+
+    def _where_positions(self, table):
+        'return int64 array of the positions of the rows that satisfy the where condition'
+        n = len(table)
+        everything = self.first is None or self.groupby is not None or self.aggregations or self.orderedby is not None
+        rows = self._candidates(self.where, table)
+        if rows is not None:
+            # only the rows that the attribute found are scanned for the whole condition
+            positions = np.arange(rows.start, rows.stop) if isinstance(rows, slice) else rows
+            positions = positions[self._evaluate(self.where, table, rows)]
+            return positions if everything else positions[:self.first]
+        chunk_sizes = [table.column(name).storage.chunk_size for name in table.column_names]
+        chunk_sizes = [size for size in chunk_sizes if size is not None]
+        if everything and len(chunk_sizes) > 0:
+            # scan block by block, so that each read of a chunked column is a view
+            size = min(chunk_sizes)
+            found = [start + np.flatnonzero(self._evaluate(self.where, table, slice(start, min(n, start + size))))
+                     for start in range(0, n, size)]
+            return np.concatenate(found) if len(found) > 0 else np.zeros(0, dtype=np.int64)
+        if everything:
+            return np.flatnonzero(self._evaluate(self.where, table, slice(0, n)))
+        # stop scanning as soon as the first rows are found
+        found = []
+        n_found = 0
+        start = 0
+        chunk_size = max(1024, 4 * self.first)
+        while start < n and n_found < self.first:
+            stop = min(n, start + chunk_size)
+            positions = start + np.flatnonzero(self._evaluate(self.where, table, slice(start, stop)))
+            found.append(positions)
+            n_found += positions.size
+            start = stop
+            chunk_size *= 2
+        return np.concatenate(found)[:self.first] if len(found) > 0 else np.zeros(0, dtype=np.int64)
+
+    def _order(self, table, positions):
+        'return positions reordered by the orderedby columns; ties keep their order'
+        keys = [(table.column(name)._take(positions), descending) for name, descending in self.orderedby]
+        return positions[_sort_permutation(keys)]
+
+    def _execute_grouped(self, table):
+        '''return new Table with one row per group: the group by columns, then the aggregations
+
+        Without a select list, each other column is summarized by its last value, as in Q.
+        '''
+        by = [] if self.groupby is None else self.groupby
+        for name in [] if self.columns is None else self.columns:
+            if name not in by:
+                raise PUCQueryError(self.text, msg='column %s is neither grouped nor aggregated' % name)
+        aggregations = self.aggregations
+        if aggregations is None:
+            aggregations = [(name, 'last', name) for name in table.column_names if name not in by]
+        needed = list(by)
+        for _, _, name in aggregations:
+            if name not in needed:
+                needed.append(name)
+        rows = table.select_columns(needed)
+        if self.where is not None:
+            rows = rows.select_rows(VectorInt64._wrap(self._where_positions(table)))
+        result = rows.summarize(by, aggregations)
+        if self.having is not None:
+            result = result.select_rows(VectorBool._wrap(self._evaluate(self.having, result, slice(0, len(result)))))
+        positions = np.arange(len(result))
+        if self.orderedby is not None:
+            positions = self._order(result, positions)
+        if self.first is not None:
+            positions = positions[:self.first]
+        return result.select_rows(VectorInt64._wrap(positions))
+
+    def execute(self, table):
+        'return new Table with the result of applying the plan to table'
+        if not isinstance(table, Table):
+            raise PUCTypeError(table, (Table,))
+        if self.groupby is not None or self.aggregations:
+            return self._execute_grouped(table)
+        if self.having is not None:
+            raise PUCQueryError(self.text, msg='having needs group by or aggregations')
+        names = table.column_names if self.columns is None else self.columns
+        if self.where is None and self.orderedby is None:
+            rows = slice(0, len(table) if self.first is None else min(self.first, len(table)))
+            return table.select_columns(names).select_rows(rows)  # views
+        if self.where is None:
+            positions = np.arange(len(table))
+        else:
+            positions = self._where_positions(table)
+        if self.orderedby is not None:
+            positions = self._order(table, positions)
+        if self.first is not None:
+            positions = positions[:self.first]
+        return table.select_columns(names).select_rows(VectorInt64._wrap(positions))
+
+
+class _SelectParser(object):
+    'recursive-descent parser over the tokens of a select statement'
+    def __init__(self, tokens, text):
+        self.tokens = tokens
+        self.text = text
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _error(self, expected):
+        kind, value = self._peek()
+        found = 'the end' if kind is None else repr(value)
+        return PUCQueryError(self.text, msg='expected %s but found %s in %r' % (expected, found, self.text))
+
+    def accept(self, kind, value=None):
+        'consume and return True if the next token matches; otherwise return False'
+        next_kind, next_value = self._peek()
+        if next_kind == kind and (value is None or next_value == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind, value=None):
+        'consume the next token and return its value; raise PUCQueryError if it does not match'
+        next_kind, next_value = self._peek()
+        if next_kind == kind and (value is None or next_value == value):
+            self.position += 1
+            return next_value
+        raise self._error(kind if value is None else value)
+
+    def expect_end(self):
+        if self.position != len(self.tokens):
+            raise self._error('the end')
+
+    def selection(self):
+        'return (list of column names, list of (output name, function, column name))'
+        names, aggregations = [], []
+        while True:
+            name = self.expect('name')
+            if self.accept('punctuation', '('):
+                function = name.lower()
+                if function not in _Grouping.aggregations:
+                    raise PUCQueryError(self.text, msg='aggregation %s is not one of %s' % (name, _Grouping.aggregations))
+                column = self.expect('name')
+                self.expect('punctuation', ')')
+                output_name = self.expect('name') if self.accept('keyword', 'as') else column
+                aggregations.append((output_name, function, column))
+            else:
+                names.append(name)
+            if not self.accept('punctuation', ','):
+                return names, aggregations
+
+    def names(self):
+        result = [self.expect('name')]
+        while self.accept('punctuation', ','):
+            result.append(self.expect('name'))
+        return result
+
+    def ordering(self):
+        result = []
+        while True:
+            name = self.expect('name')
+            descending = self.accept('keyword', 'desc')
+            if not descending:
+                self.accept('keyword', 'asc')
+            result.append((name, descending))
+            if not self.accept('punctuation', ','):
+                return result
+
+    def condition(self):
+        node = self.conjunction()
+        while self.accept('keyword', 'or'):
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.accept('keyword', 'and'):
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.negation())
+        if self.accept('punctuation', '('):
+            node = self.condition()
+            self.expect('punctuation', ')')
+            return node
+        left = self.operand()
+        op = self.expect('op')
+        return ('compare', op, left, self.operand())
+
+    def operand(self):
+        kind, value = self._peek()
+        if kind == 'name':
+            self.position += 1
+            return ('column', value)
+        if kind in ('number', 'string'):
+            self.position += 1
+            return ('literal', value)
+        if kind == 'keyword' and value in ('true', 'false'):
+            self.position += 1
+            return ('literal', value == 'true')
+        raise self._error('a column name or a literal')
+
+
+_SELECT_CACHE = collections.OrderedDict()  # text -> _SelectPlan, least recently used first
+_SELECT_CACHE_SIZE = 1024
+
+
+def compile_select(text):
+    '''return the _SelectPlan for the select statement text
+
+    Like re.compile, plans are cached, so that a query shape is parsed only once. The cache
+    holds the _SELECT_CACHE_SIZE most recently used plans.
+    '''
+    plan = _SELECT_CACHE.pop(text, None)
+    if plan is None:
+        plan = _SelectPlan.parse(text)
+    _SELECT_CACHE[text] = plan
+    if len(_SELECT_CACHE) > _SELECT_CACHE_SIZE:
+        _SELECT_CACHE.popitem(last=False)
+    return plan
+
+
+class TestSelect(unittest.TestCase):
+    def make_table(self):
+        return Table(
+            VectorInt64(1, 2, 3, 4, 5, 6),
+            VectorFloat64(10.0, 30.0, 20.0, 30.0, 5.0, 40.0),
+            VectorBool(True, False, True, True, False, True),
+            names=['id', 'price', 'flag'],
+            )
+
+    def test_tokenize_parse(self):
+        plan = _SelectPlan.parse("SELECT id where price >= 10.5 and not (flag = false or id <> 3) ordered by price desc, id first 2")
+        self.assertEqual(['id'], plan.columns)
+        self.assertEqual([('price', True), ('id', False)], plan.orderedby)
+        self.assertEqual(2, plan.first)
+        self.assertEqual('and', plan.where[0])
+        self.assertEqual(('compare', '>=', ('column', 'price'), ('literal', 10.5)), plan.where[1])
+        self.assertEqual([('string', 'a b')], _SelectPlan._tokenize("'a b'"))
+        for bad in ('where', 'where price >', 'first -1', 'first 1.5', 'select id,', 'where price > 1 junk', 'where price ! 1'):
+            self.assertRaises(PUCQueryError, _SelectPlan.parse, bad)
+
+    def test_where(self):
+        t = self.make_table()
+        r = t.select('where price > 10 and flag = true')
+        self.assertEqual([3, 4, 6], list(r['id'].value))
+        self.assertEqual(['id', 'price', 'flag'], r.column_names)
+        r = t.select('select id where price = 30 or id < 2')
+        self.assertEqual(['id'], r.column_names)
+        self.assertEqual([1, 2, 4], list(r['id'].value))
+        self.assertEqual(6, len(t.select('where 1 = 1')))
+        self.assertEqual(0, len(t.select('where 1 > 2')))
+        self.assertRaises(PUCIndexError, t.select, 'where volume > 1')
+
+    def test_first(self):
+        t = self.make_table()
+        r = t.select('first 2')
+        self.assertTrue(r['id'].storage is t['id'].storage)  # views
+        self.assertEqual([1, 2], list(r['id'].value))
+        self.assertEqual([2, 4], list(t.select('where price >= 30 first 2')['id'].value))
+        self.assertEqual([6], list(t.select('where price > 30 first 5')['id'].value))
+        big = Table(VectorInt64.from_numpy(np.arange(100000)), names=['x'])
+        self.assertEqual([50000, 50001], list(big.select('where x >= 50000 first 2')['x'].value))
+
+    def test_attributes(self):
+        t = self.make_table()
+        t['id'].set_attribute('sorted')
+        plan = compile_select('where id >= 3 and price > 20')
+        self.assertEqual(slice(2, 6), plan._candidates(plan.where, t))
+        self.assertEqual([4, 6], list(t.select('where id >= 3 and price > 20')['id'].value))
+        self.assertEqual([1, 2], list(t.select('where 3 > id')['id'].value))
+        self.assertEqual([5], list(t.select('where id > 3 and price < 30 first 1')['id'].value))
+        t['price'].set_attribute('grouped')
+        plan = compile_select('where price = 30')
+        self.assertEqual([1, 3], list(plan._candidates(plan.where, t)))
+        self.assertEqual([2, 4], list(t.select('where price = 30')['id'].value))
+        self.assertEqual([2], list(t.select('where price = 30 and flag = false')['id'].value))
+        self.assertTrue(plan._candidates(('or', plan.where, plan.where), t) is None)
+
+    def test_ordered_by(self):
+        t = self.make_table()
+        r = t.select('ordered by price desc, id')
+        self.assertEqual([6, 2, 4, 3, 1, 5], list(r['id'].value))
+        r = t.select('where flag = true order by price first 2')
+        self.assertEqual([1, 3], list(r['id'].value))
+
+    def test_keywords(self):
+        t = self.make_table()
+        r = t.select(columns=['id'], where='price > 10', orderedby=['price desc'], first=2)
+        self.assertEqual([6, 2], list(r['id'].value))
+        r = t.select(where=VectorBool(False, True, True, False, False, False))
+        self.assertEqual([2, 3], list(r['id'].value))
+        self.assertRaises(PUCQueryError, t.select, wherever='price > 1')
+        self.assertRaises(PUCQueryError, t.select, 'first 1', first=1)
+
+    def test_cache(self):
+        plan = compile_select('where id > 3')
+        self.assertTrue(compile_select('where id > 3') is plan)
+        self.assertTrue(list(_SELECT_CACHE)[-1] == 'where id > 3')
+        for i in range(_SELECT_CACHE_SIZE):
+            compile_select('first %d' % i)
+        self.assertEqual(_SELECT_CACHE_SIZE, len(_SELECT_CACHE))
+        self.assertFalse('where id > 3' in _SELECT_CACHE)
+
+    def test_group_by(self):
+        t = self.make_table()
+        r = t.select('select flag, sum(price) as total, count(id) as n, max(id) group by flag')
+        self.assertEqual(['flag', 'total', 'n', 'id'], r.column_names)
+        self.assertEqual([True, False], list(r['flag'].value))
+        self.assertEqual([100.0, 35.0], list(r['total'].value))
+        self.assertEqual([4, 2], list(r['n'].value))
+        self.assertEqual([6, 5], list(r['id'].value))
+        r = t.select('select mean(price) as avg where id > 1 group by flag having avg > 10 ordered by avg')
+        self.assertEqual([False, True], list(r['flag'].value))
+        self.assertEqual([17.5, 30.0], list(r['avg'].value))
+        r = t.select('select mean(price) as avg where id > 1 group by flag having avg > 20')
+        self.assertEqual([True], list(r['flag'].value))
+        r = t.select('select sum(price) as total')  # one group
+        self.assertEqual([135.0], list(r['total'].value))
+        r = t.select('group by flag first 1')  # last value of each other column, as in Q
+        self.assertEqual(['flag', 'id', 'price'], r.column_names)
+        self.assertEqual([6], list(r['id'].value))
+        self.assertRaises(PUCQueryError, t.select, 'select id group by flag')
+        self.assertRaises(PUCQueryError, t.select, 'select median(id)')
+        self.assertRaises(PUCQueryError, t.select, 'having id > 1')
+        self.assertRaises(PUCQueryError, t.select, 'select sum(id), max(id) group by flag')
+
+
 if __name__ == '__main__':
     if False:
         # avoid warnings from pyflakes by using imports